@@ -2,25 +2,103 @@
 Merge multiple React component snippets into one file via OpenAI.
 Falls back to regex merging when AI is disabled or the call errors out.
 """
+import asyncio
+import logging
 import os
 import re
-from typing import List
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
+from .lazy import Lazy
+from .llm_cache import LLM_CACHE, ReplayMiss
+from .metrics import (AI_FALLBACKS, AI_MERGES, LLM_CACHE_REQUESTS, LLM_PROMPT_TOKENS_SAVED, LLM_TOKENS,
+                      STAGE_SECONDS, span)
+from .prompt_budget import AI_PROMPT_BUDGET, count_tokens, fit_snippets, output_budget
+
 load_dotenv()  
-try:
-    from openai import OpenAI  # type: ignore
-    _client = OpenAI()  # API key pulled from env
+
+log = logging.getLogger(__name__)
+
+AI_MODEL           = os.getenv("AI_MODEL", "gpt-4o-mini")
+AI_TIMEOUT         = float(os.getenv("AI_TIMEOUT", "30"))          # seconds per completion
+AI_MAX_RETRIES     = int(os.getenv("AI_MAX_RETRIES", "1"))
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "16"))    # in-flight completions per worker
+
+def _sdk_version() -> Tuple[int, int]:
+    """(major, minor) of the installed ``openai`` package, read without importing it ((0, 0) if absent)."""
+    from importlib.metadata import PackageNotFoundError, version
+    try:
+        match = re.match(r"(\d+)\.(\d+)", version("openai"))
+    except PackageNotFoundError:
+        return 0, 0
+    return (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+
+SDK_VERSION = _sdk_version()
+# Streams report token usage on their last chunk only when asked to (openai 1.26+)
+STREAM_KWARGS = {"stream_options": {"include_usage": True}} if SDK_VERSION >= (1, 26) else {}
+
+# The SDK takes about half a second to import; it and its clients are only
+# built on the first completion (or by the warm-up after startup).
+if SDK_VERSION >= (1, 0):
+    def _make_client():
+        from openai import OpenAI  # type: ignore
+        return OpenAI()  # API key pulled from env
+
+    OPENAI_CLIENT = Lazy("openai_client", _make_client, warm=lambda: _ai_enabled())
 
     def _llm_call(**kwargs):
-        return _client.chat.completions.create(**kwargs)
+        return OPENAI_CLIENT.get().chat.completions.create(**kwargs)
+
+    # One pooled HTTP client per worker, shared by every async completion.
+    def _make_async_client():
+        import httpx
+        from openai import AsyncOpenAI  # type: ignore
+        return AsyncOpenAI(
+            timeout=AI_TIMEOUT,
+            max_retries=AI_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                timeout=httpx.Timeout(AI_TIMEOUT, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=AI_MAX_CONCURRENCY,
+                    max_keepalive_connections=AI_MAX_CONCURRENCY,
+                ),
+            ),
+        )
+
+    ASYNC_OPENAI_CLIENT = Lazy("async_openai_client", _make_async_client, warm=lambda: _ai_enabled())
+
+    def _get_async_client():
+        return ASYNC_OPENAI_CLIENT.get()
 
-except ImportError:
-    import openai  # type: ignore
+    async def _llm_call_async(**kwargs):
+        return await _get_async_client().chat.completions.create(**kwargs)
 
+    async def close_async_client() -> None:
+        if ASYNC_OPENAI_CLIENT.loaded:
+            await ASYNC_OPENAI_CLIENT.get().close()
+            ASYNC_OPENAI_CLIENT.reset()
+
+else:
     def _llm_call(**kwargs):
+        import openai  # type: ignore
         return openai.ChatCompletion.create(**kwargs)
 
+    async def _llm_call_async(**kwargs):
+        import openai  # type: ignore
+        return await openai.ChatCompletion.acreate(request_timeout=AI_TIMEOUT, **kwargs)
+
+    async def close_async_client() -> None:
+        pass
+
+_ai_slots: Optional[asyncio.Semaphore] = None
+
+def _get_ai_slots() -> asyncio.Semaphore:
+    global _ai_slots
+    if _ai_slots is None:
+        _ai_slots = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+    return _ai_slots
+
 
 # ────────────────── prompt builder ──────────────────
 def build_merge_prompt(snippets: List[str], query: str, export_name: str) -> str:
@@ -75,7 +153,165 @@ def extract_code_from_response(text: str) -> str:
     return text.replace("```", "").strip()
 
 
-# ────────────────── public entry point ──────────────────
+# ────────────────── shared request / validation ──────────────────
+SYSTEM_PROMPT = (
+    "You are an expert React/TypeScript engineer who creates "
+    "production-ready components by intelligently merging multiple "
+    "component snippets. You understand UI/UX patterns and create "
+    "cohesive, accessible, and well-structured components. "
+    "Always return complete, working TSX code with proper imports."
+)
+
+def _ai_enabled() -> bool:
+    return bool(os.getenv("OPENAI_API_KEY")) and os.getenv("USE_AI_MERGING", "true").lower() == "true"
+
+def _completion_kwargs(snippets: List[str], query: str, export_name: str) -> dict:
+    # Whatever the system prompt and the instructions around the snippets
+    # take (plus each snippet's heading and fence) is not left for the snippets.
+    overhead = (count_tokens(SYSTEM_PROMPT) + count_tokens(build_merge_prompt([], query, export_name))
+                + len(snippets) * count_tokens("\n### Component 1\n```tsx\n\n```\n"))
+    fitted = fit_snippets(snippets, AI_PROMPT_BUDGET - overhead)
+    prompt = build_merge_prompt(fitted.snippets, query, export_name)
+    max_tokens = output_budget(fitted.tokens_after)
+
+    saved = fitted.tokens_before - fitted.tokens_after
+    LLM_PROMPT_TOKENS_SAVED.inc(saved)
+    log.info("AI merge prompt for %r: snippets %d -> %d tokens (-%d, %.0f%%), max_tokens=%d",
+             query, fitted.tokens_before, fitted.tokens_after, saved,
+             100 * saved / max(fitted.tokens_before, 1), max_tokens)
+    return dict(
+        model=AI_MODEL,
+        temperature=0.1,
+        max_tokens=max_tokens,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+    )
+
+def _response_text(response) -> str:
+    # Handle different OpenAI SDK versions
+    try:
+        # SDK 1.x
+        return response.choices[0].message.content
+    except AttributeError:
+        # SDK 0.x
+        return response.choices[0]["message"]["content"]
+
+class AIResponseRejected(RuntimeError):
+    """The LLM replied, but not with code we can use; *reason* feeds the metrics."""
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+def _fallback_reason(exc: BaseException) -> str:
+    if isinstance(exc, AIResponseRejected):
+        return exc.reason
+    if isinstance(exc, ReplayMiss):
+        return "replay_miss"
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in type(exc).__name__:
+        return "timeout"
+    return "exception"
+
+def _fall_back(exc: BaseException) -> None:
+    reason = _fallback_reason(exc)
+    AI_MERGES.inc(outcome="fallback")
+    AI_FALLBACKS.inc(reason=reason)
+    log.info("AI merge failed (%s): %r; doing manual merge", reason, exc)
+
+def _record_usage(response) -> Dict[str, int]:
+    """Add a response's token usage (SDK object or 0.x dict) to the counters."""
+    usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+    if not usage:
+        return {}
+    get = usage.get if isinstance(usage, dict) else lambda k: getattr(usage, k, None)
+    counted = {}
+    for kind in ("prompt", "completion"):
+        counted[f"{kind}_tokens"] = get(f"{kind}_tokens") or 0
+        LLM_TOKENS.inc(counted[f"{kind}_tokens"], kind=kind)
+    return counted
+
+def _cached_reply(request: dict) -> Optional[str]:
+    """Stored reply for *request* from the LLM cache (raises ReplayMiss in replay mode)."""
+    if not LLM_CACHE.enabled:
+        return None
+    try:
+        cached = LLM_CACHE.get(request)
+    except ReplayMiss:
+        LLM_CACHE_REQUESTS.inc(result="replay_miss")
+        raise
+    LLM_CACHE_REQUESTS.inc(result="miss" if cached is None else "hit")
+    return cached.content if cached is not None else None
+
+def validate_merged_code(raw: str) -> str:
+    """Extract the TSX from an LLM reply; raise if it is unusable."""
+    if not raw:
+        raise AIResponseRejected("empty_response", "AI returned empty response")
+
+    log.debug("Raw AI response (first 500 chars):\n%s", raw[:500])
+
+    merged_code = extract_code_from_response(raw)
+
+    # ---------- HARD CHECK: every import must appear in JSX ----------
+    imports = re.findall(r"import\s+\{([^}]+)\}\s+from '@visa/nova-react'", merged_code)
+    imported = {name.strip() for grp in imports for name in grp.split(",")}
+    unused = [name for name in imported if re.search(rf"<\s*{name}\b", merged_code) is None]
+
+    if unused:
+        raise AIResponseRejected("unused_imports", f"Unused imports returned by AI: {unused}")
+
+    
+    if not merged_code or len(merged_code) < 50:
+        raise AIResponseRejected("unusable_code", "AI returned unusable code")
+
+    return merged_code
+
+
+# ────────────────── public entry points ──────────────────
+def ai_merge(snippets: List[str], query: str, export_name: str) -> str:
+    """One AI merge (or its cached reply); raises instead of falling back."""
+    log.debug("Attempting AI merge for query %r (%d snippets)", query, len(snippets))
+
+    request = _completion_kwargs(snippets, query, export_name)
+    raw = _cached_reply(request)
+    if raw is not None:
+        code = validate_merged_code(raw)
+    else:
+        started = time.perf_counter()
+        with span("ai_merge"):
+            response = _llm_call(**request)
+        usage = _record_usage(response)
+        raw   = _response_text(response)
+        code  = validate_merged_code(raw)
+        LLM_CACHE.put(request, raw, usage, time.perf_counter() - started)
+    AI_MERGES.inc(outcome="success")
+    return code
+
+
+async def ai_merge_async(snippets: List[str], query: str, export_name: str) -> str:
+    """Non-blocking :func:`ai_merge`: pooled async client, bounded by AI_MAX_CONCURRENCY and AI_TIMEOUT."""
+    log.debug("Attempting AI merge for query %r (%d snippets)", query, len(snippets))
+
+    request = _completion_kwargs(snippets, query, export_name)
+    raw = await asyncio.to_thread(_cached_reply, request)
+    if raw is not None:
+        code = validate_merged_code(raw)
+    else:
+        started = time.perf_counter()
+        async with _get_ai_slots():
+            with span("ai_merge"):
+                response = await asyncio.wait_for(
+                    _llm_call_async(**request),
+                    timeout=AI_TIMEOUT * (AI_MAX_RETRIES + 1),
+                )
+        usage = _record_usage(response)
+        raw   = _response_text(response)
+        code  = validate_merged_code(raw)
+        await asyncio.to_thread(LLM_CACHE.put, request, raw, usage, time.perf_counter() - started)
+    AI_MERGES.inc(outcome="success")
+    return code
+
+
 def merge_components_with_ai(
     snippets: List[str], query: str, export_name: str
 ) -> str:
@@ -85,66 +321,138 @@ def merge_components_with_ai(
     from .manual_merge import merge_variants  
 
     # Bail out early if no key or AI disabled
-    if not os.getenv("OPENAI_API_KEY") or os.getenv("USE_AI_MERGING", "true").lower() != "true":
-        print("AI disabled or no API key, falling back to manual merge")
+    if not _ai_enabled():
+        log.debug("AI disabled or no API key, falling back to manual merge")
+        AI_FALLBACKS.inc(reason="disabled")
         return merge_variants(snippets, export_name)
 
     try:
-        prompt = build_merge_prompt(snippets, query, export_name)
-        
-        print(f"Attempting AI merge for query: '{query}'")
-        print(f"Components to merge: {len(snippets)} snippets")
-
-        response = _llm_call(
-            model="gpt-4o-mini",           
-            temperature=0.1,
-            max_tokens=2500,  # Increased for longer components
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are an expert React/TypeScript engineer who creates "
-                        "production-ready components by intelligently merging multiple "
-                        "component snippets. You understand UI/UX patterns and create "
-                        "cohesive, accessible, and well-structured components. "
-                        "Always return complete, working TSX code with proper imports."
-                    ),
-                },
-                {"role": "user", "content": prompt},
-            ],
-        )
+        return ai_merge(snippets, query, export_name)
+    except Exception as exc:
+        _fall_back(exc)
+        return merge_variants(snippets, export_name)
 
-        # Handle different OpenAI SDK versions
-        raw = ""
-        try:
-            # SDK 1.x
-            raw = response.choices[0].message.content
-        except AttributeError:
-            # SDK 0.x
-            raw = response.choices[0]["message"]["content"]
-        
-        if not raw:
-            raise Exception("AI returned empty response")
 
-        print("RAW AI RESPONSE (first 500 chars):\n", raw[:500])
+async def merge_components_with_ai_async(
+    snippets: List[str], query: str, export_name: str
+) -> str:
+    """
+    Non-blocking variant of :func:`merge_components_with_ai`: the completion
+    goes through :func:`ai_merge_async`, and the regex fallback runs in a
+    worker thread.
+    """
+    from .manual_merge import merge_variants
+
+    if not _ai_enabled():
+        log.debug("AI disabled or no API key, falling back to manual merge")
+        AI_FALLBACKS.inc(reason="disabled")
+        return await asyncio.to_thread(merge_variants, snippets, export_name)
 
-        merged_code = extract_code_from_response(raw)
+    try:
+        return await ai_merge_async(snippets, query, export_name)
+    except Exception as exc:
+        _fall_back(exc)
+        return await asyncio.to_thread(merge_variants, snippets, export_name)
 
-        # ---------- HARD CHECK: every import must appear in JSX ----------
-        imports = re.findall(r"import\s+\{([^}]+)\}\s+from '@visa/nova-react'", merged_code)
-        imported = {name.strip() for grp in imports for name in grp.split(",")}
-        unused = [name for name in imported if re.search(rf"<\s*{name}\b", merged_code) is None]
 
-        if unused:
-            raise RuntimeError(f"Unused imports returned by AI: {unused}")
+# ────────────────── streaming ──────────────────
+class CodeStreamFilter:
+    """
+    Incrementally forwards only the body of the first fenced code block of a
+    streamed reply, holding back just enough characters to recognise the
+    closing fence across chunk boundaries.
+    """
+    OPEN  = re.compile(r"```(?:tsx|typescript|jsx|javascript|ts|js)?\n")
+    CLOSE = "\n```"
+
+    def __init__(self):
+        self._buf   = ""
+        self._state = "before"                      # before | inside | after
+
+    def feed(self, chunk: str) -> str:
+        self._buf += chunk
+        if self._state == "before":
+            match = self.OPEN.search(self._buf)
+            if not match:
+                return ""
+            self._buf, self._state = self._buf[match.end():], "inside"
+        if self._state == "inside":
+            end = self._buf.find(self.CLOSE)
+            if end >= 0:
+                out, self._buf, self._state = self._buf[:end], "", "after"
+                return out
+            keep = len(self.CLOSE) - 1
+            out, self._buf = self._buf[:-keep] if len(self._buf) > keep else "", self._buf[-keep:]
+            return out
+        return ""
+
+
+def _delta_text(chunk) -> str:
+    try:
+        # SDK 1.x
+        return chunk.choices[0].delta.content or "" if chunk.choices else ""
+    except AttributeError:
+        # SDK 0.x
+        return chunk["choices"][0]["delta"].get("content", "")
+
+
+async def stream_merge_components_with_ai(
+    snippets: List[str], query: str, export_name: str
+) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Streamed :func:`merge_components_with_ai_async`.
+
+    Yields ``("delta", text)`` pieces of the TSX as the model produces them,
+    then exactly one ``("final", code)`` with the validated code, or
+    ``("fallback", code)`` with the regex merge if the reply was rejected.
+    """
+    from .manual_merge import merge_variants
+
+    if not _ai_enabled():
+        AI_FALLBACKS.inc(reason="disabled")
+        yield "fallback", await asyncio.to_thread(merge_variants, snippets, export_name)
+        return
+
+    try:
+        log.debug("Attempting streamed AI merge for query %r", query)
+        request = _completion_kwargs(snippets, query, export_name)
+        cached  = await asyncio.to_thread(_cached_reply, request)
+        if cached is not None:
+            code  = validate_merged_code(cached)
+            piece = CodeStreamFilter().feed(cached)
+            if piece:
+                yield "delta", piece
+            AI_MERGES.inc(outcome="success")
+            yield "final", code
+            return
+
+        started = time.perf_counter()
+        deadline = time.monotonic() + AI_TIMEOUT * (AI_MAX_RETRIES + 1)
+        raw, code_filter, usage = [], CodeStreamFilter(), {}
 
-        
-        if not merged_code or len(merged_code) < 50:
-            raise Exception("AI returned unusable code")
+        async with _get_ai_slots():
+            stream = await _llm_call_async(
+                stream=True, **STREAM_KWARGS, **request,
+            )
+            async for chunk in stream:
+                if time.monotonic() > deadline:
+                    raise TimeoutError("AI stream exceeded its time budget")
+                usage = _record_usage(chunk) or usage    # usage rides on the last chunk
+                text = _delta_text(chunk)
+                if not text:
+                    continue
+                raw.append(text)
+                piece = code_filter.feed(text)
+                if piece:
+                    yield "delta", piece
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage="ai_merge")
 
-        return merged_code
+        code = validate_merged_code("".join(raw))
+        await asyncio.to_thread(LLM_CACHE.put, request, "".join(raw), usage, elapsed)
+        AI_MERGES.inc(outcome="success")
+        yield "final", code
 
     except Exception as exc:
-        print(f"AI merge failed: {exc}")
-        print("Doing manual merge...")
-        return merge_variants(snippets, export_name)
\ No newline at end of file
+        _fall_back(exc)
+        yield "fallback", await asyncio.to_thread(merge_variants, snippets, export_name)
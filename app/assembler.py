@@ -1,79 +1,845 @@
 """Build a merged TSX snippet, with CSV caching of both code *and* components."""
-import csv, json, os, re, pathlib
-from typing import Tuple, List, Dict
+import asyncio, csv, hashlib, io, json, logging, os, re, pathlib, sqlite3, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import (Tuple, List, Dict, NamedTuple, Optional, Iterable, Iterator, Hashable, AsyncIterator, Union,
+                    Callable, Set)
 from dotenv import load_dotenv
 
+from .catalog import COMP_PATH, COMPONENT_HASHES, COMPONENTS, NAME2COMP, components_version
+from .metrics import CACHE_INVALIDATIONS, CACHE_LOOKUPS, span
+from .pattern_index import PatternIndex
+from .query_match import QueryMatcher, normalize_query
+from .shared_state import SHARED_STATE, Generation, generation
+from .singleflight import SingleFlight
+
+try:
+    import fcntl                                    # POSIX only
+except ImportError:                                 # pragma: no cover
+    fcntl = None
+
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
 ROOT        = pathlib.Path(__file__).resolve().parents[1]
 CACHE_PATH  = ROOT / "data" / "pattern-dataset.csv"   # acts as cache
-COMP_PATH   = ROOT / "data" / "components.json"
+CACHE_DB    = pathlib.Path(os.getenv("PATTERN_CACHE_DB", ROOT / "data" / "pattern-cache.sqlite3"))
+
+CACHE_FIELDS      = ["query", "components", "code", "version", "provisional"]
+CACHE_BACKEND     = os.getenv("PATTERN_CACHE_BACKEND", "csv").lower()   # csv | sqlite
+CACHE_MAX_ENTRIES = int(os.getenv("PATTERN_CACHE_MAX_ENTRIES", "10000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))            # misses merged at once per batch
+CACHE_REGENERATE  = os.getenv("PATTERN_CACHE_REGENERATE", "false").lower() == "true"
+CACHE_STAMP_TTL   = float(os.getenv("PATTERN_CACHE_STAMP_TTL", "1"))    # seconds resident hits trust the last backend stamp
+
+# Merges precomputed per component combination (python -m app.warmup combos)
+# share the cache under keys with this prefix; they are not user queries.
+COMBO_PREFIX = "@combo:"
+
+# ────────────────── cache backends ──────────────────
+class CacheEntry(NamedTuple):
+    components: List[str]
+    code: str
+    version: str = ""                               # components_version() at merge time; "" = unknown
+    provisional: bool = False                       # regex merge waiting for its AI upgrade (app.upgrades)
+
+
+class CacheBackend:
+    """
+    Persistent storage behind :class:`PatternCache`.
+
+    ``stamp()`` must change whenever the stored data changes, whichever
+    process made the change.  ``preload`` tells the front cache whether a
+    full ``load()`` is cheaper than per-key ``get()`` calls.
+    """
+    preload = False
+
+    def stamp(self) -> Hashable:
+        raise NotImplementedError
+
+    def load(self) -> Iterator[Tuple[str, CacheEntry]]:
+        raise NotImplementedError
+
+    def load_components(self) -> Iterator[Tuple[str, List[str]]]:
+        """``(key, components)`` of every entry, for indexing."""
+        return ((key, entry.components) for key, entry in self.load())
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, CacheEntry]:
+        """The stored entries of *keys* (absent ones left out), in one pass."""
+        wanted = set(keys)
+        return {key: entry for key, entry in self.load() if key in wanted} if wanted else {}
+
+    def keys(self) -> List[str]:
+        raise NotImplementedError
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys()
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def upsert(self, key: str, entry: CacheEntry) -> None:
+        raise NotImplementedError
+
+    def delete(self, keys: Iterable[str]) -> None:
+        raise NotImplementedError
+
+
+@contextmanager
+def _file_lock(path: pathlib.Path):
+    """Exclusive advisory lock shared by every worker process."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+class CSVCacheBackend(CacheBackend):
+    """
+    The original ``pattern-dataset.csv`` format: appends only, later rows
+    win.  Each row is written with one ``write()`` under an exclusive
+    ``flock`` so concurrent workers cannot interleave multi-line rows.
+
+    The byte offset of every key's last row is kept, so ``get`` reads one
+    row, and rows other workers appended are picked up by reading just the
+    new tail of the file.
+    """
+    preload = True
+
+    def __init__(self, path: pathlib.Path = CACHE_PATH):
+        self.path      = path
+        self.lock_path = path.with_name(path.name + ".lock")
+        self._known: Dict[str, int] = {}           # every key in the file → byte offset of its last row
+        self._known_stamp: Optional[Tuple[int, int]] = None
+        self._known_end: Optional[Tuple[int, int]] = None   # (inode, size) of the file _known covers
+
+    def _file(self) -> Optional[os.stat_result]:
+        try:
+            return self.path.stat()
+        except FileNotFoundError:
+            return None
+
+    def stamp(self) -> Optional[Tuple[int, int]]:
+        st = self._file()
+        return (st.st_mtime_ns, st.st_size) if st else None
+
+    def _rows(self, offset: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, dict]]:
+        """``(byte offset, row)`` for the rows from *offset* (the first row) up to byte *end*."""
+        if not self.path.exists():
+            return
+        with self.path.open("rb") as f:
+            header = next(csv.reader([f.readline().decode("utf-8")]), [])
+            pos = f.seek(offset) if offset else f.tell()
+
+            def lines() -> Iterator[str]:
+                nonlocal pos
+                for line in f:
+                    if end is not None and pos >= end:
+                        return
+                    pos += len(line)
+                    yield line.decode("utf-8")
+
+            reader = csv.reader(lines())
+            while True:
+                start = pos                         # the reader never reads past the row it returns
+                row = next(reader, None)
+                if row is None:
+                    return
+                if row:                             # blank lines are skipped, as by DictReader
+                    yield start, dict(zip(header, row))
+
+    @staticmethod
+    def _entry(row: dict) -> CacheEntry:
+        return CacheEntry(json.loads(row["components"]), row["code"], row.get("version") or "",
+                          row.get("provisional") == "1")
+
+    def _header(self) -> List[str]:
+        with self.path.open(newline="", encoding="utf-8") as f:
+            return next(csv.reader(f), [])
+
+    def load(self) -> Iterator[Tuple[str, CacheEntry]]:
+        st      = self._file()
+        entries: Dict[str, CacheEntry] = {}
+        known:   Dict[str, int] = {}
+        for offset, row in self._rows(end=st.st_size if st else None):
+            entries[row["query"]] = self._entry(row)
+            known[row["query"]] = offset
+        self._learned(known, st)
+        return iter(entries.items())
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """One row, read at its recorded offset."""
+        self._refresh_known()
+        offset = self._known.get(key)
+        if offset is None:
+            return None
+        for _, row in self._rows(offset):
+            if row["query"] == key:
+                return self._entry(row)
+            break
+        self._known_stamp = self._known_end = None  # offsets went stale: rescan next time
+        return None
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, CacheEntry]:
+        found = {}
+        for key in keys:
+            entry = self.get(key)                   # one row each, by offset
+            if entry is not None:
+                found[key] = entry
+        return found
+
+    def _learned(self, known: Dict[str, int], st: Optional[os.stat_result]) -> None:
+        self._known       = known
+        self._known_stamp = (st.st_mtime_ns, st.st_size) if st else None
+        self._known_end   = (st.st_ino, st.st_size) if st else None
+
+    def _refresh_known(self) -> None:
+        st = self._file()
+        if st is None:
+            self._learned({}, None)
+            return
+        if (st.st_mtime_ns, st.st_size) == self._known_stamp:
+            return
+        if self._known_end is not None and self._known_end[0] == st.st_ino and st.st_size >= self._known_end[1]:
+            known, start = self._known, self._known_end[1]     # appended to: read the new rows only
+        else:
+            known, start = {}, 0                    # replaced (a delete or a migration): read it all
+        for offset, row in self._rows(start, st.st_size):
+            known[row["query"]] = offset
+        self._learned(known, st)
+
+    def keys(self) -> List[str]:
+        self._refresh_known()
+        return list(self._known)
+
+    def __contains__(self, key: str) -> bool:
+        self._refresh_known()
+        return key in self._known
 
-COMPONENTS  = json.loads(COMP_PATH.read_text("utf-8"))
-NAME2COMP   = {c["component"]: c for c in COMPONENTS}
+    def upsert(self, key: str, entry: CacheEntry) -> None:
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=CACHE_FIELDS)
+        with _file_lock(self.lock_path):
+            if self.path.exists() and self._header() != CACHE_FIELDS:
+                self._rewrite(set())                # older file without the version / provisional columns
+            self._refresh_known()                   # rows appended by other workers, while nobody writes
+            if not self.path.exists():
+                writer.writeheader()
+            offset = (self.path.stat().st_size if self.path.exists() else 0) + len(buf.getvalue().encode("utf-8"))
+            writer.writerow(_csv_row(key, entry))
+            with self.path.open("a", newline="", encoding="utf-8") as f:
+                f.write(buf.getvalue())
+            self._known[key] = offset
+            self._learned(self._known, self._file())
+
+    def delete(self, keys: Iterable[str]) -> None:
+        with _file_lock(self.lock_path):
+            self._rewrite(set(keys))
+
+    def _rewrite(self, dropped: Set[str]) -> None:
+        """Replace the file with one row per live key (callers hold the lock)."""
+        entries = [(k, e) for k, e in self.load() if k not in dropped]
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        known: Dict[str, int] = {}
+        with tmp.open("wb") as f:
+            buf = io.StringIO()
+            writer = csv.DictWriter(buf, fieldnames=CACHE_FIELDS)
+            writer.writeheader()
+            for key, entry in entries:
+                known[key] = f.tell() + len(buf.getvalue().encode("utf-8"))
+                writer.writerow(_csv_row(key, entry))
+                f.write(buf.getvalue().encode("utf-8"))
+                buf.seek(0)
+                buf.truncate()
+            f.write(buf.getvalue().encode("utf-8"))
+        os.replace(tmp, self.path)
+        self._learned(known, self._file())
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    SQLite in WAL mode keyed on the normalised query.  Upserts are atomic,
+    readers never block the writer, and every worker process sees a commit
+    as soon as it lands (``PRAGMA data_version`` moves for other writers).
+    """
+    preload = False
+
+    def __init__(self, path: pathlib.Path = CACHE_DB, seed_csv: Optional[pathlib.Path] = None):
+        self.path    = path
+        self._lock   = threading.RLock()
+        self._writes = 0                            # our own commits (data_version ignores them)
+        self._db     = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS patterns ("
+                " query TEXT PRIMARY KEY,"
+                " components TEXT NOT NULL,"
+                " code TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(patterns)")]
+            if "version" not in columns:
+                self._db.execute("ALTER TABLE patterns ADD COLUMN version TEXT NOT NULL DEFAULT ''")
+            if "provisional" not in columns:
+                self._db.execute("ALTER TABLE patterns ADD COLUMN provisional INTEGER NOT NULL DEFAULT 0")
+        if seed_csv is not None and seed_csv.exists() and len(self) == 0:
+            import_csv(seed_csv, self)
+
+    def _fetch(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def stamp(self) -> Tuple[int, int]:
+        return self._fetch("PRAGMA data_version")[0][0], self._writes
+
+    def load(self) -> Iterator[Tuple[str, CacheEntry]]:
+        rows = self._fetch("SELECT query, components, code, version, provisional FROM patterns ORDER BY rowid")
+        for query, comps, code, version, provisional in rows:
+            yield query, CacheEntry(json.loads(comps), code, version, bool(provisional))
+
+    def load_components(self) -> Iterator[Tuple[str, List[str]]]:
+        for query, comps in self._fetch("SELECT query, components FROM patterns"):
+            yield query, json.loads(comps)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        rows = self._fetch("SELECT components, code, version, provisional FROM patterns WHERE query = ?", (key,))
+        return CacheEntry(json.loads(rows[0][0]), rows[0][1], rows[0][2], bool(rows[0][3])) if rows else None
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, CacheEntry]:
+        keys, found = list(keys), {}
+        for i in range(0, len(keys), 500):          # stay under SQLite's bound-parameter limit
+            chunk = keys[i:i + 500]
+            rows  = self._fetch(
+                "SELECT query, components, code, version, provisional FROM patterns"
+                f" WHERE query IN ({','.join('?' * len(chunk))})", tuple(chunk),
+            )
+            for query, comps, code, version, provisional in rows:
+                found[query] = CacheEntry(json.loads(comps), code, version, bool(provisional))
+        return found
+
+    def keys(self) -> List[str]:
+        return [r[0] for r in self._fetch("SELECT query FROM patterns ORDER BY rowid")]
+
+    def __contains__(self, key: str) -> bool:
+        return bool(self._fetch("SELECT 1 FROM patterns WHERE query = ?", (key,)))
+
+    def __len__(self) -> int:
+        return self._fetch("SELECT COUNT(*) FROM patterns")[0][0]
+
+    def upsert(self, key: str, entry: CacheEntry) -> None:
+        self.upsert_many([(key, entry)])
+
+    def upsert_many(self, items: Iterable[Tuple[str, CacheEntry]]) -> None:
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO patterns (query, components, code, version, provisional, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(query) DO UPDATE SET"
+                " components = excluded.components, code = excluded.code, version = excluded.version,"
+                " provisional = excluded.provisional, updated_at = excluded.updated_at",
+                ((k, json.dumps(e.components), e.code, e.version, int(e.provisional), time.time())
+                 for k, e in items),
+            )
+            self._writes += 1
+
+    def delete(self, keys: Iterable[str]) -> None:
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM patterns WHERE query = ?", ((k,) for k in keys))
+            self._writes += 1
+
+
+def _csv_row(key: str, entry: CacheEntry) -> dict:
+    return {"query": key, "components": json.dumps(entry.components), "code": entry.code,
+            "version": entry.version, "provisional": "1" if entry.provisional else ""}
+
+def import_csv(src: pathlib.Path, backend: CacheBackend) -> int:
+    """Copy every row of a ``pattern-dataset.csv`` file into *backend*."""
+    rows = list(CSVCacheBackend(src).load())
+    if isinstance(backend, SQLiteCacheBackend):
+        backend.upsert_many(rows)
+    else:
+        for key, entry in rows:
+            backend.upsert(key, entry)
+    return len(rows)
+
+def export_csv(backend: CacheBackend, dst: pathlib.Path) -> int:
+    """Write *backend* out in the ``pattern-dataset.csv`` format."""
+    count = 0
+    with dst.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CACHE_FIELDS)
+        writer.writeheader()
+        for key, entry in backend.load():
+            writer.writerow(_csv_row(key, entry))
+            count += 1
+    return count
+
+def make_backend(kind: str = CACHE_BACKEND) -> CacheBackend:
+    if kind == "sqlite":
+        return SQLiteCacheBackend(CACHE_DB, seed_csv=CACHE_PATH)
+    if kind == "csv":
+        return CSVCacheBackend(CACHE_PATH)
+    raise ValueError(f"Unknown PATTERN_CACHE_BACKEND: {kind!r}")
 
 # ────────────────── cache helpers ──────────────────
-def _load_cache() -> Dict[str, Tuple[List[str], str]]:
-    if not CACHE_PATH.exists():
-        return {}
-    with CACHE_PATH.open(newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        return {
-            row["query"]: (json.loads(row["components"]), row["code"])
-            for row in reader
+class PatternCache:
+    """
+    Resident, LRU-bounded view over a :class:`CacheBackend`.
+
+    Lookups are dict hits.  Writes go through to the backend, and a change of
+    the backend's stamp made by someone else drops (or, for preloadable
+    backends, re-reads) the resident entries on the next access.  Keys that
+    fell out of the LRU are fetched from the backend on demand.
+
+    With a shared :class:`Generation` the backend stamp is not polled at all:
+    every write bumps the counter and every worker sees the bump at once,
+    then re-reads just the keys the generation's change log names and adds
+    them to its matcher and index (a full reload only if the log cannot say).
+
+    With *version_of*, entries are stamped with the version of the components
+    they were merged from, and an entry whose components changed since reads
+    as a miss.  ``queries_using`` is the reverse index used to find them.
+
+    ``search`` pages through the stored queries from a :class:`PatternIndex`
+    kept up to date the same way as the near-duplicate matcher.
+
+    Nothing is read from the backend until the first access (or ``warm``).
+    """
+    _UNLOADED = object()
+
+    def __init__(self, backend: CacheBackend, max_entries: int = CACHE_MAX_ENTRIES,
+                 generation: Optional[Generation] = None,
+                 version_of: Optional[Callable[[List[str]], str]] = None):
+        self.backend     = backend
+        self.max_entries = max(1, max_entries)
+        self.generation  = generation
+        self.version_of  = version_of
+        self.matcher     = QueryMatcher()
+        self._lock       = threading.RLock()
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._stamp: Hashable = self._UNLOADED     # never equal to a backend stamp
+        self._checked    = float("-inf")           # when the backend stamp was last read (monotonic)
+        self._matcher_stale = True
+        self.index       = PatternIndex(listed=lambda key: not key.startswith(COMBO_PREFIX))
+        self._index_stale = True
+
+    def _current_stamp(self) -> Hashable:
+        if self.generation is not None:
+            return self.generation.value()
+        self._checked = time.monotonic()
+        return self.backend.stamp()
+
+    def reload(self) -> None:
+        with self._lock:
+            stamp = self._current_stamp()
+            self._entries = OrderedDict()
+            if self.backend.preload:
+                for key, entry in self.backend.load():
+                    self._remember(key, entry)
+            self._stamp = stamp
+            self._matcher_stale = True
+            self._index_stale = True
+
+    def _refresh(self) -> None:
+        stamp = self._current_stamp()
+        if stamp == self._stamp:
+            return
+        changed = None
+        if self.generation is not None and self._stamp is not self._UNLOADED:
+            changed = self.generation.changes(self._stamp, stamp)
+        if changed is None or len(changed) > self.max_entries:
+            self.reload()
+            return
+        for key in dict.fromkeys(changed):
+            entry = self.backend.get(key)
+            if entry is None:                       # gone again already; start over
+                self.reload()
+                return
+            if self.backend.preload or key in self._entries:
+                self._remember(key, entry)
+            self._learn(key, entry.components)
+        self._stamp = stamp
+
+    def _learn(self, key: str, comps: List[str]) -> None:
+        """Add *key* to the matcher and the index, unless they are to be rebuilt anyway."""
+        if not self._matcher_stale and not key.startswith(COMBO_PREFIX):
+            self.matcher.add(key)
+        if not self._index_stale:
+            self.index.add(key, comps)
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def is_current(self, entry: CacheEntry) -> bool:
+        """False once a component the entry was merged from has changed ("" = not versioned)."""
+        return not entry.version or self.version_of is None or entry.version == self.version_of(entry.components)
+
+    # ---- public API ----
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            elif self.backend.preload and key not in self.backend:
+                return None
+            else:
+                entry = self.backend.get(key)       # evicted, or never preloaded
+                if entry is not None:
+                    self._remember(key, entry)
+        if entry is not None and not self.is_current(entry):
+            log.debug("Cached %r is stale: its components changed", key)
+            return None
+        return entry
+
+    def resident(self, key: str) -> Optional[CacheEntry]:
+        """
+        Exact hit among the resident entries, or None – without touching the
+        backend or waiting for the lock, so it is safe on the event loop.
+        None is not a miss: ``lookup`` (in a thread) has the final word.
+
+        Freshness comes from the shared generation if there is one; else
+        from the backend stamp the last threaded access read, trusted for
+        ``CACHE_STAMP_TTL`` seconds (reading it may query the backend).
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            if self.generation is not None:
+                if self.generation.value() != self._stamp:
+                    return None
+            elif self._stamp is self._UNLOADED or time.monotonic() - self._checked > CACHE_STAMP_TTL:
+                return None
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        finally:
+            self._lock.release()
+        return entry if self.is_current(entry) else None
+
+    def lookup(self, key: str) -> Tuple[Optional[CacheEntry], str]:
+        """
+        Exact hit first, then a normalised / near-duplicate query.
+        Returns ``(entry, tier)`` with tier in exact | normalized | similar | miss.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry, "exact"
+        with self._lock:
+            if self._matcher_stale:
+                self.matcher.rebuild(k for k in self.backend.keys() if not k.startswith(COMBO_PREFIX))
+                self._matcher_stale = False
+        found = self.matcher.match(key)
+        if found is not None:
+            entry = self.get(found[0])
+            if entry is not None:
+                return entry, found[1]
+        return None, "miss"
+
+    def stamp(self) -> Hashable:
+        """Changes whenever the stored patterns do, whichever worker wrote."""
+        with self._lock:
+            self._refresh()
+            return self._stamp
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries or key in self.backend
+
+    def __len__(self) -> int:
+        return len(self.backend)
+
+    def keys(self) -> List[str]:
+        return self.backend.keys()
+
+    def put(self, key: str, comps: List[str], code: str, provisional: bool = False) -> None:
+        """Upsert into the backend and update the resident view."""
+        shared = self.generation.locked() if self.generation is not None else nullcontext()
+        with self._lock, shared:
+            self._put(key, comps, code, provisional)
+
+    def _put(self, key: str, comps: List[str], code: str, provisional: bool) -> None:
+        """Write one entry (callers hold both locks)."""
+        if self._stamp is not self._UNLOADED:
+            self._refresh()                         # catch up with the other workers first
+        version = self.version_of(comps) if self.version_of is not None else ""
+        entry   = CacheEntry(list(comps), code, version, provisional)
+        self.backend.upsert(key, entry)
+        if self.generation is not None:
+            self.generation.bump([key])             # tell the other workers
+        if self._stamp is self._UNLOADED:
+            return                                  # the first access loads it all anyway
+        self._remember(key, entry)
+        self._learn(key, comps)
+        self._stamp = self._current_stamp()
+
+    def replace_provisional(self, key: str, provisional_code: str, code: str) -> bool:
+        """
+        Swap the provisional entry of *key* for *code*, but only if it still
+        holds *provisional_code* (it may have been dropped or rewritten since).
+        """
+        shared = self.generation.locked() if self.generation is not None else nullcontext()
+        with self._lock, shared:
+            self._refresh()                         # resident entries are current from here on
+            current = self._entries.get(key) or self.backend.get(key)   # a single-row read if evicted
+            if current is None or not current.provisional or current.code != provisional_code:
+                return False
+            self._put(key, current.components, code, provisional=False)
+            return True
+
+    def delete(self, keys: Iterable[str]) -> None:
+        """Drop *keys* from the backend; every worker re-reads its view."""
+        keys = list(keys)
+        if not keys:
+            return
+        shared = self.generation.locked() if self.generation is not None else nullcontext()
+        with self._lock, shared:
+            self.backend.delete(keys)
+            if self.generation is not None:
+                self.generation.bump()
+            self.reload()
+
+    def warm(self) -> None:
+        """Load the resident entries and build the matcher and the index now rather than on first use."""
+        with self._lock:
+            self._refresh()
+            if self._matcher_stale:
+                self.matcher.rebuild(k for k in self.backend.keys() if not k.startswith(COMBO_PREFIX))
+                self._matcher_stale = False
+            self._current_index()
+
+    def _current_index(self) -> PatternIndex:
+        """The index, rebuilt from the backend if someone else wrote (callers hold the lock)."""
+        self._refresh()
+        if self._index_stale:
+            self.index.rebuild(self.backend.load_components())
+            self._index_stale = False
+        return self.index
+
+    def queries_using(self, components: Iterable[str]) -> Set[str]:
+        """Keys of the entries merged from any of *components*."""
+        with self._lock:
+            return self._current_index().using(components)
+
+    def search(self, limit: int, after: str = "", prefix: str = "", contains: str = "",
+               component: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+        """A page of stored queries in sorted order; see :meth:`PatternIndex.page`."""
+        with self._lock:
+            return self._current_index().page(limit, after, prefix, contains, component)
+
+    def search_count(self, prefix: str = "", contains: str = "", component: Optional[str] = None) -> int:
+        """How many stored queries :meth:`search` pages through for these filters."""
+        with self._lock:
+            return self._current_index().count(prefix, contains, component)
+
+
+def _shared_generation() -> Optional[Generation]:
+    """Write counter shared by the workers using the same cache store (SHARED_STATE=true)."""
+    if not SHARED_STATE:
+        return None
+    store = CACHE_DB if CACHE_BACKEND == "sqlite" else CACHE_PATH
+    return generation("pattern-cache-" + hashlib.sha256(str(store).encode("utf-8")).hexdigest()[:12])
+
+PATTERN_CACHE = PatternCache(make_backend(), generation=_shared_generation(), version_of=components_version)
+
+
+# ────────────────── catalog changes ──────────────────
+def _catalog_manifest() -> pathlib.Path:
+    """Per-component hashes of the catalog the cache store was last checked against."""
+    store = CACHE_DB if CACHE_BACKEND == "sqlite" else CACHE_PATH
+    return store.with_name(store.name + ".catalog.json")
+
+def invalidate_changed_components() -> List[str]:
+    """
+    Compare the catalog with the one the cache was last checked against and
+    drop the entries merged from a component that changed (or disappeared).
+    Returns the dropped keys; run once per deploy, the first worker does it.
+    """
+    manifest = _catalog_manifest()
+    with _file_lock(manifest.with_name(manifest.name + ".lock")):
+        previous = json.loads(manifest.read_text("utf-8")) if manifest.exists() else None
+        changed  = set() if previous is None else {
+            c for c in set(previous) | set(COMPONENT_HASHES) if previous.get(c) != COMPONENT_HASHES.get(c)
         }
+        affected = PATTERN_CACHE.backend.get_many(PATTERN_CACHE.queries_using(changed)) if changed else {}
+        stale = sorted(key for key, entry in affected.items()
+                       if entry.version != components_version(entry.components))
+        PATTERN_CACHE.delete(stale)
+        if previous != COMPONENT_HASHES:
+            manifest.write_text(json.dumps(COMPONENT_HASHES, indent=1, sort_keys=True), "utf-8")
+    if stale:
+        CACHE_INVALIDATIONS.inc(len(stale))
+        log.warning("Catalog changed (%s): dropped %d cached pattern(s)", ", ".join(sorted(changed)), len(stale))
+    return stale
 
-def _append_cache(query: str, comps: List[str], code: str) -> None:
-    new_file = not CACHE_PATH.exists()
-    with CACHE_PATH.open("a", newline="", encoding="utf-8") as f:
-        fieldnames = ["query", "components", "code"]
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if new_file:
-            writer.writeheader()
-        writer.writerow(
-            {"query": query, "components": json.dumps(comps), "code": code}
-        )
+async def regenerate(keys: List[str], concurrency: int = BATCH_CONCURRENCY) -> int:
+    """
+    Recompute dropped queries in the background, *concurrency* at a time.
+    Combination keys are left to ``python -m app.warmup combos``.
+    """
+    queries = [k for k in keys if not k.startswith(COMBO_PREFIX)]
+    failed  = 0
+    async for query, result in resolve_many_async(queries, concurrency):
+        if isinstance(result, Exception):
+            failed += 1
+            log.warning("Regenerating %r failed: %r", query, result)
+    log.info("Regenerated %d of %d invalidated pattern(s)", len(queries) - failed, len(queries))
+    return len(queries) - failed
+
+
+def _load_cache() -> Dict[str, CacheEntry]:
+    """Snapshot of the whole cache (kept for scripts; the API uses PATTERN_CACHE)."""
+    return {k: PATTERN_CACHE.get(k) for k in PATTERN_CACHE.keys()}
+
+def _append_cache(query: str, comps: List[str], code: str, provisional: bool = False) -> bool:
+    from .manual_merge import is_broken_merge
+    if is_broken_merge(code):
+        log.info("Merged code failed quick check — not cached.")
+        return False
+    with span("cache_write"):
+        PATTERN_CACHE.put(query, comps, code, provisional)
+    return True
+
+def cached_queries() -> List[str]:
+    return [k for k in PATTERN_CACHE.keys() if not k.startswith(COMBO_PREFIX)]
+
+def combo_key(comps: List[str], picks: List[int]) -> str:
+    """Cache key of the merge of these component variants, whatever the query or order."""
+    return COMBO_PREFIX + "|".join(sorted(f"{c}#{i}" for c, i in zip(comps, picks)))
+
+def _export_name(query: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9]", " ", query).title().replace(" ", "") or "Generated"
+
+def _renamed(code: str, export_name: str) -> str:
+    return re.sub(r"export default function \w+", f"export default function {export_name}", code, count=1)
+
+def _precomputed(combo: str, export_name: str) -> Optional[str]:
+    """A warmed-up merge of the same variants, renamed for this query."""
+    entry = PATTERN_CACHE.get(combo)
+    if entry is None:
+        return None
+    return _renamed(entry.code, export_name)
 
-def pick_variant(comp: dict) -> str:
-    return comp["variants"][0]["code"]
+def pick_variant(comp: dict, query: str = "") -> str:
+    """Code of the variant of *comp* that best fits *query* (the first one by default)."""
+    from .retriever import best_variants
+    idx = best_variants(query, [comp["component"]])[0] if query else 0
+    return comp["variants"][idx]["code"]
+
+def warm_merge() -> None:
+    """Warm-up step: parse the catalog's variants before the first miss has to."""
+    from .manual_merge import warm_parse_caches
+    warm_parse_caches(COMPONENTS)
 
 def check_ai_setup() -> bool:                       # keeps main.py happy
     use_ai = os.getenv("USE_AI_MERGING", "true").lower() == "true"
     return use_ai and bool(os.getenv("OPENAI_API_KEY"))
-def build_snippet(query: str) -> Tuple[str, List[str]]:
+
+def _lookup(q_key: str) -> Tuple[Optional[CacheEntry], str]:
+    """
+    PATTERN_CACHE.lookup, timed.  Hits are counted here; misses are counted
+    by the caller once it knows how the request was answered.
+    """
+    with span("cache_lookup"):
+        hit, tier = PATTERN_CACHE.lookup(q_key)
+    if hit is not None:
+        CACHE_LOOKUPS.inc(tier=tier)
+    return hit, tier
+
+async def _lookup_async(q_key: str) -> Tuple[Optional[CacheEntry], str]:
+    """:func:`_lookup` for the event loop: resident hits inline, anything that may read the backend in a thread."""
+    with span("cache_lookup"):
+        hit = PATTERN_CACHE.resident(q_key)
+    if hit is not None:
+        CACHE_LOOKUPS.inc(tier="exact")
+        return hit, "exact"
+    return await asyncio.to_thread(_lookup, q_key)
+
+class SnippetResult(NamedTuple):
+    code: str
+    components: List[str]
+    cache_tier: str                                 # exact | normalized | similar | combo | coalesced | miss
+    merged_by: Optional[str] = None                 # ai | regex for a fresh merge, None when cached
+    provisional: bool = False                       # regex merge whose AI upgrade is pending
+
+def _hit_result(hit: CacheEntry, tier: str, query: str) -> SnippetResult:
+    """A cache hit; one cached for another spelling of the query is renamed for this one."""
+    code = hit.code if tier == "exact" else _renamed(hit.code, _export_name(query))
+    return SnippetResult(code, hit.components, tier, provisional=hit.provisional)
+
+def _cache_as(merged_by: Optional[str], reason: Optional[str]) -> Optional[bool]:
     """
-    1. Look for an exact query match in pattern‑dataset.csv.
+    How a fresh merge is cached: False = final, True = provisional (queued
+    for an AI upgrade, see :mod:`app.upgrades`), None = not at all.  A regex
+    merge that stood in for the AI merge (opt-out, budget, open circuit,
+    failure) must not become the final answer for everyone else.
+    """
+    if merged_by != "regex" or reason == "disabled":
+        return False                                # AI merge, warmed combination, or AI is off
+    from .upgrades import AI_UPGRADE
+    return True if AI_UPGRADE else None
+
+def _plan_merge(query: str) -> Tuple[List[str], List[str], str, str]:
+    """Pick components via the retriever → (components, variant codes, export name, combo key)."""
+    from .retriever import best_variants, top_components
+    with span("retrieval"):
+        comps: List[str] = top_components(query, k=3)
+        picks = best_variants(query, comps)
+    variant_codes = [NAME2COMP[c]["variants"][i]["code"] for c, i in zip(comps, picks)]
+    export_name   = _export_name(query)
+    return comps, variant_codes, export_name, combo_key(comps, picks)
+
+def build_snippet(query: str, use_ai: Optional[bool] = True) -> Tuple[str, List[str]]:
+    result = resolve_snippet(query, use_ai)
+    return result.code, result.components
+
+def resolve_snippet(query: str, use_ai: Optional[bool] = True) -> SnippetResult:
+    """
+    1. Look for the query in the resident pattern cache – exact key first,
+       then the same words in any order / punctuation, then a near-duplicate.
     2. If found → return that snippet + components immediately.
-    3. If not → choose components with retriever, merge (AI or regex),
-       optionally cache the result *only* if it passes a quick sanity test.
+    3. If not → choose components with retriever, merge (AI or regex, see
+       :mod:`app.merge_router`), optionally cache the result *only* if it
+       passes a quick sanity test – and a regex stand-in for the AI merge
+       only as provisional (see :func:`_cache_as`).
     """
     q_key = query.strip().lower()
 
     # Serve from cache if present
-    cache = _load_cache()
-    if q_key in cache:
-        code, comps = cache[q_key][1], cache[q_key][0]
-        return code, comps
-
-    # If not pick components via retriever
-    from .retriever import top_components
-    comps: List[str] = top_components(query, k=3)
-
-    variant_codes = [pick_variant(NAME2COMP[c]) for c in comps]
-    export_name   = re.sub(r"[^a-zA-Z0-9]", " ", query).title().replace(" ", "") or "Generated"
-
-    # Merge snippets (AI if enabled, else regex)
-    use_ai  = os.getenv("USE_AI_MERGING", "true").lower() == "true"
-    has_key = bool(os.getenv("OPENAI_API_KEY"))
-    if use_ai and has_key:
-        from .ai_merge import merge_components_with_ai
-        code = merge_components_with_ai(variant_codes, query, export_name)
-    else:
-        from .merge import merge_variants
-        code = merge_variants(variant_codes, export_name)
-    
-    _append_cache(q_key, comps, code)
-    return code, comps
+    hit, tier = _lookup(q_key)
+    if hit is not None:
+        return _hit_result(hit, tier, query)
+
+    comps, variant_codes, export_name, combo = _plan_merge(query)
+
+    # Merge snippets (warmed-up combination, else AI or regex as routed)
+    code, tier, merged_by, reason = _precomputed(combo, export_name), "combo", None, None
+    if code is None:
+        from .merge_router import route_merge
+        code, merged_by, reason = route_merge(variant_codes, query, export_name, use_ai)
+        tier = "miss"
+
+    provisional = _cache_as(merged_by, reason)
+    cached = provisional is not None and _append_cache(q_key, comps, code, provisional)
+    if provisional and cached:
+        from .upgrades import enqueue_sync
+        enqueue_sync(q_key, query, variant_codes, export_name)
+    CACHE_LOOKUPS.inc(tier=tier)
+    return SnippetResult(code, comps, tier, merged_by, bool(provisional) and cached)
 
     # Sanity check for testing if needed (shouldn't be needed in prod)
     # def _looks_ok(tsx: str) -> bool:
@@ -87,4 +853,175 @@ def build_snippet(query: str) -> Tuple[str, List[str]]:
     #     _append_cache(q_key, comps, code)
     # else:
     #     print("Generated code failed quick check — not cached.")
-    
+
+_INFLIGHT = SingleFlight()
+
+async def resolve_snippet_async(query: str, use_ai: Optional[bool] = True,
+                                budget: Optional[float] = None) -> SnippetResult:
+    """
+    Event-loop friendly :func:`resolve_snippet`.  Resident cache hits are
+    answered inline; other lookups, retrieval, the regex merge and the cache write run in the default
+    thread pool, and the AI merge awaits the pooled async OpenAI client
+    within *budget* seconds (see :func:`~app.merge_router.route_merge_async`).
+
+    Concurrent misses for the same normalised query (and ``use_ai``) are
+    coalesced: one request computes (one LLM call, one cache write) and the
+    rest await it and report ``cache_tier="coalesced"``.
+    """
+    q_key = query.strip().lower()
+
+    hit, tier = await _lookup_async(q_key)
+    if hit is not None:
+        return _hit_result(hit, tier, query)
+
+    flight = ("" if use_ai is not False else "regex:") + (normalize_query(q_key) or q_key)
+    result, shared = await _INFLIGHT.do(flight, lambda: _compute_snippet_async(query, q_key, use_ai, budget))
+    if shared:                                      # computed for another spelling of the query
+        result = result._replace(code=_renamed(result.code, _export_name(query)), cache_tier="coalesced")
+    CACHE_LOOKUPS.inc(tier=result.cache_tier)
+    return result
+
+async def _compute_snippet_async(query: str, q_key: str, use_ai: Optional[bool],
+                                 budget: Optional[float]) -> SnippetResult:
+    # A flight for this query may have landed between our lookup and now
+    hit, tier = await asyncio.to_thread(PATTERN_CACHE.lookup, q_key)
+    if hit is not None:
+        return _hit_result(hit, tier, query)
+
+    comps, variant_codes, export_name, combo = await asyncio.to_thread(_plan_merge, query)
+
+    settled = asyncio.Event()                       # our own cache write is done
+
+    async def late(ai_code: str) -> None:
+        # An AI merge that overran the budget is the final answer; it must land after our stand-in
+        await settled.wait()
+        await asyncio.to_thread(_append_cache, q_key, comps, ai_code)
+
+    try:
+        code, tier, merged_by, reason = await asyncio.to_thread(_precomputed, combo, export_name), "combo", None, None
+        if code is None:
+            from .upgrades import wants_upgrade
+            tier = "miss"
+            if wants_upgrade(use_ai):
+                # Answer with the regex merge now; a background AI merge replaces it (app.upgrades)
+                from .merge_router import Routed, _regex_merge, _served
+                code = await asyncio.to_thread(_regex_merge, variant_codes, export_name)
+                _, merged_by, reason = _served(Routed(code, "regex", "upgrade_pending"))
+            else:
+                from .merge_router import route_merge_async
+                code, merged_by, reason = await route_merge_async(variant_codes, query, export_name,
+                                                                  use_ai, budget, on_late=late)
+
+        provisional = _cache_as(merged_by, reason)
+        cached = provisional is not None and await asyncio.to_thread(_append_cache, q_key, comps, code, provisional)
+        if provisional and cached:
+            from .upgrades import enqueue
+            await enqueue(q_key, query, variant_codes, export_name)
+    finally:
+        settled.set()
+    return SnippetResult(code, comps, tier, merged_by, bool(provisional) and cached)
+
+def batch_key(query: str) -> str:
+    """Queries of one batch with the same key are resolved once (see :func:`normalize_query`)."""
+    return normalize_query(query) or query.strip().lower()
+
+async def resolve_many_async(
+    queries: List[str], concurrency: int = BATCH_CONCURRENCY, use_ai: Optional[bool] = True
+) -> AsyncIterator[Tuple[str, Union[SnippetResult, Exception]]]:
+    """
+    Resolve a batch of queries, yielding ``(query, result)`` as each finishes.
+
+    Duplicate queries are resolved once, every cache hit is yielded in a
+    first pass, and the misses then run through :func:`resolve_snippet_async`
+    with at most *concurrency* in flight.  A failing query yields its
+    exception instead of aborting the batch.
+    """
+    originals = {batch_key(q): q for q in reversed(queries)}   # first spelling wins
+    unique = [originals[key] for key in dict.fromkeys(batch_key(q) for q in queries)]
+
+    misses = []
+    for query in unique:
+        hit, tier = await _lookup_async(query.strip().lower())
+        if hit is not None:
+            yield query, _hit_result(hit, tier, query)
+        else:
+            misses.append(query)
+
+    slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(query: str):
+        async with slots:
+            try:
+                return query, await resolve_snippet_async(query, use_ai)
+            except Exception as exc:
+                return query, exc
+
+    for done in asyncio.as_completed([run(q) for q in misses]):
+        yield await done
+
+async def stream_snippet_async(query: str, use_ai: Optional[bool] = True) -> AsyncIterator[dict]:
+    """
+    Event stream for one query: ``components`` as soon as they are chosen,
+    ``delta`` pieces of TSX while the LLM writes, and a ``final`` event with
+    the validated (or fallback) code, which is what gets cached (a fallback
+    only as provisional, see :func:`_cache_as`).
+    """
+    q_key = query.strip().lower()
+
+    hit, tier = await _lookup_async(q_key)
+    if hit is not None:
+        result = _hit_result(hit, tier, query)
+        yield {"event": "components", "components_used": result.components, "cache_tier": tier}
+        yield {"event": "final", "snippet": result.code, "fallback": False, "cache_tier": tier}
+        return
+
+    comps, variant_codes, export_name, combo = await asyncio.to_thread(_plan_merge, query)
+    code = await asyncio.to_thread(_precomputed, combo, export_name)
+    if code is not None:
+        await asyncio.to_thread(_append_cache, q_key, comps, code)
+        CACHE_LOOKUPS.inc(tier="combo")
+        yield {"event": "components", "components_used": comps, "cache_tier": "combo"}
+        yield {"event": "final", "snippet": code, "fallback": False, "cache_tier": "combo"}
+        return
+    yield {"event": "components", "components_used": comps, "cache_tier": "miss"}
+
+    from .merge_router import Routed, _regex_merge, _served, record_ai, skip_reason
+    reason = skip_reason(use_ai)
+    if reason is None:
+        from .ai_merge import stream_merge_components_with_ai
+        started = time.perf_counter()
+        async for kind, text in stream_merge_components_with_ai(variant_codes, query, export_name):
+            if kind == "delta":
+                yield {"event": "delta", "text": text}
+            else:
+                code, fallback = text, kind == "fallback"
+        record_ai(not fallback, time.perf_counter() - started, "stream_fallback")
+        _, merged_by, reason = _served(Routed(code, "regex" if fallback else "ai",
+                                              "stream_fallback" if fallback else "success"))
+    else:
+        code = await asyncio.to_thread(_regex_merge, variant_codes, export_name)
+        _, merged_by, reason = _served(Routed(code, "regex", reason))
+        fallback = True
+
+    provisional = _cache_as(merged_by, reason)
+    cached = provisional is not None and await asyncio.to_thread(_append_cache, q_key, comps, code, provisional)
+    if provisional and cached:
+        from .upgrades import enqueue
+        await enqueue(q_key, query, variant_codes, export_name)
+    CACHE_LOOKUPS.inc(tier="miss")
+    yield {"event": "final", "snippet": code, "fallback": fallback, "cache_tier": "miss"}
+
+
+if __name__ == "__main__":
+    # python -m app.assembler export out.csv | import in.csv
+    import sys
+    if len(sys.argv) != 3 or sys.argv[1] not in {"import", "export"}:
+        sys.exit("usage: python -m app.assembler import|export <file.csv>")
+    action, target = sys.argv[1], pathlib.Path(sys.argv[2])
+    if action == "import":
+        print(f"Imported {import_csv(target, PATTERN_CACHE.backend)} rows")
+        if PATTERN_CACHE.generation is not None:
+            with PATTERN_CACHE.generation.locked():
+                PATTERN_CACHE.generation.bump()     # running workers drop their view
+    else:
+        print(f"Exported {export_csv(PATTERN_CACHE.backend, target)} rows")
@@ -0,0 +1,43 @@
+"""
+The component catalog (``data/components.json``), read once per process.
+
+Every module that needs the catalog imports it from here, so a worker
+parses the file a single time and the path no longer depends on the
+directory uvicorn was started from.
+"""
+import hashlib
+import json
+import os
+import pathlib
+from typing import Dict, Iterable, List
+
+ROOT      = pathlib.Path(__file__).resolve().parents[1]
+COMP_PATH = pathlib.Path(os.getenv("COMPONENTS_PATH", ROOT / "data" / "components.json"))
+
+COMPONENTS: List[dict]      = json.loads(COMP_PATH.read_text("utf-8"))
+NAME2COMP: Dict[str, dict]  = {c["component"]: c for c in COMPONENTS}
+
+
+def catalog_hash(components: List[dict] = COMPONENTS) -> str:
+    """Short fingerprint of the catalog contents, used to name state derived from it."""
+    blob = json.dumps(components, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+CATALOG_HASH = catalog_hash()
+
+
+def component_hashes(components: List[dict] = COMPONENTS) -> Dict[str, str]:
+    """Fingerprint of each component's catalog entry, by component name."""
+    return {c["component"]: catalog_hash([c]) for c in components}
+
+COMPONENT_HASHES = component_hashes()
+
+
+def components_version(names: Iterable[str]) -> str:
+    """
+    Fingerprint of the catalog entries of *names*.  Cache entries are stamped
+    with the version of the components they were merged from, so a change
+    to any other component leaves them valid.
+    """
+    blob = "|".join(f"{n}={COMPONENT_HASHES.get(n, '')}" for n in sorted(set(names)))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
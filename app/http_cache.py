@@ -0,0 +1,136 @@
+"""
+HTTP-level caching for responses whose body rarely changes.
+
+A body is serialised and compressed once (gzip, and brotli when the
+``brotli`` package is installed) into a :class:`PreparedBody`, whose
+content hash is the ETag.  :func:`prepared_response` then picks the
+encoding the client accepts and, for GETs, answers ``If-None-Match`` with
+304 (a POST such as ``/suggest`` only reuses the compressed body).
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, NamedTuple, Optional
+
+from fastapi import Request, Response
+
+try:
+    import brotli  # type: ignore
+except ImportError:                                 # optional dependency
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "512"))
+BODY_CACHE_ENTRIES = int(os.getenv("HTTP_BODY_CACHE_ENTRIES", "2048"))   # prepared /suggest bodies
+
+# Cache-Control policy per kind of response
+CATALOG_CACHE_CONTROL  = "public, max-age=300"      # components.json changes on deploy only
+PATTERNS_CACHE_CONTROL = "no-cache"                 # may change any time: revalidate (cheap 304)
+SUGGEST_CACHE_CONTROL  = "no-store"                 # a POST: compressed once, never revalidated
+
+
+class PreparedBody(NamedTuple):
+    raw: bytes
+    etag: str
+    encoded: Dict[str, bytes]                       # content-coding -> compressed body
+
+
+def prepare(raw: bytes) -> PreparedBody:
+    """Hash and pre-compress *raw* (small bodies are sent as they are)."""
+    etag = '"' + hashlib.sha256(raw).hexdigest()[:32] + '"'
+    encoded: Dict[str, bytes] = {}
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        if brotli is not None:
+            encoded["br"] = brotli.compress(raw, quality=5)
+        encoded["gzip"] = gzip.compress(raw, compresslevel=6, mtime=0)
+    return PreparedBody(raw, etag, encoded)
+
+
+def _accepted(request: Request) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}."""
+    accepted = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    tags = (t.strip() for t in if_none_match.split(","))
+    return any((t[2:] if t.startswith("W/") else t) == etag for t in tags)
+
+
+def prepared_response(request: Request, body: PreparedBody, cache_control: str,
+                      media_type: str = "application/json", conditional: bool = True) -> Response:
+    """
+    200 with the best accepted encoding of *body*, or 304 if the client has
+    it.  With ``conditional=False`` (non-GET requests) no ETag is sent or checked.
+    """
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if conditional:
+        headers["ETag"] = body.etag
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _matches(if_none_match, body.etag):
+            return Response(status_code=304, headers=headers)
+
+    accepted = _accepted(request)
+    for coding in ("br", "gzip"):
+        if coding in body.encoded and accepted.get(coding, accepted.get("*", 0)) > 0:
+            headers["Content-Encoding"] = coding
+            return Response(body.encoded[coding], media_type=media_type, headers=headers)
+    return Response(body.raw, media_type=media_type, headers=headers)
+
+
+class BodyCache:
+    """
+    LRU of prepared bodies.  Keys should contain everything the body is
+    built from, so a stale key is simply never asked for again.
+    """
+
+    def __init__(self, max_entries: int = BODY_CACHE_ENTRIES):
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._bodies: "OrderedDict[Hashable, PreparedBody]" = OrderedDict()
+
+    def get_or_prepare(self, key: Hashable, render: Callable[[], bytes]) -> PreparedBody:
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+                return body
+        body = prepare(render())
+        with self._lock:
+            self._bodies[key] = body
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+        return body
+
+    def __len__(self) -> int:
+        return len(self._bodies)
+
+
+class VersionedBody:
+    """One prepared body, rebuilt only when the version it was built from changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[Hashable] = None
+        self._body: Optional[PreparedBody] = None
+
+    def get(self, version: Hashable, render: Callable[[], bytes]) -> PreparedBody:
+        with self._lock:
+            if self._body is None or self._version != version:
+                self._body, self._version = prepare(render()), version
+            return self._body
@@ -0,0 +1,99 @@
+"""
+Deferred construction of the heavy per-process resources (OpenAI client,
+pattern cache contents, merge parse caches, semantic index…).
+
+Each resource is a :class:`Lazy` built on first use, so importing the app
+stays cheap and a worker can bind its port at once.  ``warm_up`` then
+builds everything in the background after startup, and ``readiness``
+reports whether that has finished (``GET /ready``) – unlike ``/health``,
+which only says the process is up.
+"""
+import asyncio
+import importlib
+import logging
+import threading
+import time
+from typing import Callable, Dict, Generic, Iterable, List, Optional, TypeVar
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_RESOURCES: Dict[str, "Lazy"] = {}
+
+
+class Lazy(Generic[T]):
+    """A value built by *factory* the first time it is asked for (thread-safe, once)."""
+
+    _UNSET = object()
+
+    def __init__(self, name: str, factory: Callable[[], T], warm: Callable[[], bool] = lambda: True):
+        self.name     = name
+        self._factory = factory
+        self.warm     = warm                           # whether warm_up should build it
+        self._value   = self._UNSET
+        self._lock    = threading.Lock()
+        self.seconds: Optional[float] = None       # time the factory took
+        _RESOURCES[name] = self
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not self._UNSET
+
+    def get(self) -> T:
+        if self._value is self._UNSET:
+            with self._lock:
+                if self._value is self._UNSET:
+                    started = time.perf_counter()
+                    value = self._factory()
+                    self.seconds = time.perf_counter() - started
+                    self._value = value
+                    log.info("%s ready in %.0f ms", self.name, self.seconds * 1000)
+        return self._value
+
+    def reset(self) -> None:
+        """Forget the value (e.g. a closed client); the next ``get`` builds it again."""
+        with self._lock:
+            self._value  = self._UNSET
+            self.seconds = None
+
+
+class _WarmUp:
+    def __init__(self):
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.failed: Dict[str, str] = {}
+
+WARM_UP = _WarmUp()
+
+
+async def warm_up(modules: Iterable[str] = (), then: Iterable[Callable[[], object]] = ()) -> None:
+    """
+    Import *modules* (registering their resources), build every registered
+    resource in a worker thread, then run the *then* steps the same way.
+    A resource that fails is logged and left to be retried on first use.
+    """
+    WARM_UP.started = time.monotonic()
+    for module in modules:
+        await asyncio.to_thread(importlib.import_module, module)
+    steps: List[Callable[[], object]] = [r.get for r in list(_RESOURCES.values()) if r.warm()] + list(then)
+    for step in steps:
+        name = getattr(getattr(step, "__self__", None), "name", None) or getattr(step, "__name__", repr(step))
+        try:
+            await asyncio.to_thread(step)
+        except Exception as exc:
+            WARM_UP.failed[name] = repr(exc)
+            log.warning("Warm-up of %s failed: %r", name, exc)
+    WARM_UP.finished = time.monotonic()
+    log.info("Warm-up finished in %.2fs", WARM_UP.finished - WARM_UP.started)
+
+
+def readiness() -> dict:
+    return {
+        "ready": WARM_UP.finished is not None,
+        "resources": {
+            name: {"loaded": r.loaded, "ms": round(r.seconds * 1000, 1) if r.seconds is not None else None}
+            for name, r in _RESOURCES.items()
+        },
+        "failed": dict(WARM_UP.failed),
+    }
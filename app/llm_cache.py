@@ -0,0 +1,167 @@
+"""
+On-disk cache of LLM merge replies, keyed on what determines the reply:
+model, temperature and the chat messages (system prompt + the prompt from
+``build_merge_prompt``).
+
+Modes (``LLM_CACHE_MODE``):
+
+* ``cache``  – read through: answer from disk when fresh, else call and store
+* ``record`` – always call the API and overwrite what is stored
+* ``replay`` – never call the API; a missing entry is an error (CI, load tests)
+* ``off``    – no caching
+
+Only replies that passed validation are stored.  Entries expire after
+``LLM_CACHE_TTL`` seconds (replay ignores the TTL) and the least recently
+used ones are evicted once the file holds more than ``LLM_CACHE_MAX_BYTES``
+of replies.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+LLM_CACHE_MODE      = os.getenv("LLM_CACHE_MODE", "cache").lower()          # cache | record | replay | off
+LLM_CACHE_PATH      = pathlib.Path(os.getenv("LLM_CACHE_PATH", ROOT / "data" / "llm-cache.sqlite3"))
+LLM_CACHE_TTL       = float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))  # seconds
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class ReplayMiss(LookupError):
+    """Replay mode was asked for a completion that was never recorded."""
+
+
+class CachedReply(NamedTuple):
+    content: str
+    usage: Dict[str, int]
+    latency: float                                  # seconds the original call took
+
+
+def cache_key(request: Dict[str, Any]) -> str:
+    """Stable hash of the parts of a chat completion request that shape the reply."""
+    material = {
+        "model":       request.get("model"),
+        "temperature": request.get("temperature"),
+        "messages":    [{"role": m.get("role"), "content": m.get("content")}
+                        for m in request.get("messages", [])],
+    }
+    blob = json.dumps(material, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """SQLite-backed reply store shared by every worker on the host."""
+
+    def __init__(self, path: pathlib.Path = LLM_CACHE_PATH, mode: str = LLM_CACHE_MODE,
+                 ttl: float = LLM_CACHE_TTL, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        if mode not in ("cache", "record", "replay", "off"):
+            raise ValueError(f"Unknown LLM_CACHE_MODE: {mode!r}")
+        self.path      = path
+        self.mode      = mode
+        self.ttl       = ttl
+        self.max_bytes = max_bytes
+        self._lock     = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            with db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS replies ("
+                    " key TEXT PRIMARY KEY,"
+                    " model TEXT NOT NULL,"
+                    " content TEXT NOT NULL,"
+                    " usage TEXT NOT NULL,"
+                    " latency REAL NOT NULL,"
+                    " bytes INTEGER NOT NULL,"
+                    " created_at REAL NOT NULL,"
+                    " used_at REAL NOT NULL)"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS replies_used_at ON replies (used_at)")
+            self._db = db
+        return self._db
+
+    def get(self, request: Dict[str, Any]) -> Optional[CachedReply]:
+        """
+        The stored reply for *request*, or None when the API should be called.
+        Raises :class:`ReplayMiss` in replay mode instead of returning None.
+        """
+        if self.mode in ("off", "record"):
+            return None
+        key = cache_key(request)
+        now = time.time()
+        with self._lock:
+            db  = self._conn()
+            row = db.execute(
+                "SELECT content, usage, latency, created_at FROM replies WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and (self.mode == "replay" or now - row[3] <= self.ttl):
+                with db:
+                    db.execute("UPDATE replies SET used_at = ? WHERE key = ?", (now, key))
+                return CachedReply(row[0], json.loads(row[1]), row[2])
+        if self.mode == "replay":
+            raise ReplayMiss(f"no recorded LLM reply for key {key[:12]}…")
+        return None
+
+    def put(self, request: Dict[str, Any], content: str,
+            usage: Optional[Dict[str, int]] = None, latency: float = 0.0) -> None:
+        """Store a validated reply (no-op in replay and off modes)."""
+        if self.mode not in ("cache", "record"):
+            return
+        now  = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            db = self._conn()
+            with db:
+                db.execute(
+                    "INSERT INTO replies (key, model, content, usage, latency, bytes, created_at, used_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(key) DO UPDATE SET"
+                    " content = excluded.content, usage = excluded.usage, latency = excluded.latency,"
+                    " bytes = excluded.bytes, created_at = excluded.created_at, used_at = excluded.used_at",
+                    (cache_key(request), str(request.get("model")), content,
+                     json.dumps(usage or {}), latency, size, now, now),
+                )
+                self._evict(db, now)
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        db.execute("DELETE FROM replies WHERE created_at < ?", (now - self.ttl,))
+        total = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM replies").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used replies until 90% of the budget is left
+        excess = total - int(self.max_bytes * 0.9)
+        freed  = 0
+        for key, size in db.execute("SELECT key, bytes FROM replies ORDER BY used_at").fetchall():
+            if freed >= excess:
+                break
+            db.execute("DELETE FROM replies WHERE key = ?", (key,))
+            freed += size
+
+    def lookup_key(self, key: str) -> Optional[CachedReply]:
+        """Reply stored under a precomputed key, ignoring mode and TTL (used by the stub server)."""
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT content, usage, latency FROM replies WHERE key = ?", (key,)
+            ).fetchone()
+        return CachedReply(row[0], json.loads(row[1]), row[2]) if row else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn().execute("SELECT COUNT(*) FROM replies").fetchone()[0]
+
+
+LLM_CACHE = LLMCache()
@@ -1,17 +1,62 @@
 # app/main.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
+import asyncio
+import logging
 import os
+from .lazy import readiness, warm_up
+from .metrics import CONTENT_TYPE, render_latest
 from .routes import router
 
 # Load environment variables
 load_dotenv()
 
+# Pipeline chatter is DEBUG/INFO; only warnings are emitted unless LOG_LEVEL says otherwise
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "WARNING").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+
+# Imported by the warm-up rather than at startup; importing them registers their lazy resources
+WARM_UP_MODULES = (f"{__package__}.ai_merge", f"{__package__}.manual_merge", f"{__package__}.retriever")
+
+async def start_up() -> None:
+    """Background warm-up: runs after the server has bound, /ready reports when it is done."""
+    from .assembler import CACHE_REGENERATE, PATTERN_CACHE, invalidate_changed_components, regenerate, warm_merge
+    stale = []
+
+    def invalidate_changed():
+        # Entries of changed components already read as misses; this drops them
+        stale.extend(invalidate_changed_components())
+
+    await warm_up(WARM_UP_MODULES, then=(invalidate_changed, warm_merge, PATTERN_CACHE.warm))
+    if stale and CACHE_REGENERATE:
+        await regenerate(stale)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from .upgrades import AI_UPGRADE, start_workers
+    warming = asyncio.create_task(start_up())
+    # Replace provisional regex merges with AI merges in the background
+    upgrading = start_workers() if AI_UPGRADE else []
+    yield
+    for task in [warming, *upgrading]:
+        task.cancel()
+    await asyncio.gather(*upgrading, return_exceptions=True)
+    # Release the pooled OpenAI HTTP connections, if they were ever opened
+    import sys
+    ai_merge = sys.modules.get(f"{__package__}.ai_merge")
+    if ai_merge is not None:
+        await ai_merge.close_async_client()
+
 app = FastAPI(
     title="AI Component Generator",
     description="Generate React components using AI-powered merging",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -52,4 +97,15 @@ async def health_check():
             "has_openai_key": bool(os.getenv('OPENAI_API_KEY')),
             "ai_enabled": os.getenv('USE_AI_MERGING', 'true').lower() == 'true'
         }
-    }
\ No newline at end of file
+    }
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 503 until the background warm-up has loaded the heavy resources"""
+    status = readiness()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_latest(), media_type=CONTENT_TYPE)
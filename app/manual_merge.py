@@ -2,8 +2,45 @@
 Manual/regex-based component merging when AI is unavailable.
 Creates a basic but functional combined component.
 """
+import logging
+import os
 import re
-from typing import List, Set
+from functools import lru_cache
+from typing import List, NamedTuple, Set, Tuple
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined
+
+from .metrics import span
+
+log = logging.getLogger(__name__)
+
+MERGE_ENGINE = os.getenv("MERGE_ENGINE", "ast").lower()    # ast | regex
+EXTRACT_ERROR_JSX = "<div>Error extracting JSX</div>"
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+# Templates are compiled on first use and kept by the environment's cache;
+# auto_reload is off so rendering never stats the template files.
+TEMPLATES = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=False,
+    trim_blocks=True,
+    lstrip_blocks=True,
+    keep_trailing_newline=False,
+    auto_reload=False,
+    undefined=StrictUndefined,
+)
+
+IMPORT_LINE_RE  = re.compile(r'^import\s+.*?;?$', re.MULTILINE)
+EXPORT_CONST_RE = re.compile(r'export\s+const\s+(\w+)\s*=')
+RETURN_JSX_RE   = re.compile(r'return\s*\(?([^}]+)\)?;?\s*}', re.DOTALL)
+VAR_DECL_RE     = re.compile(r'const\s+\w+\s*=\s*[^;]+;')
+
+class ParsedVariant(NamedTuple):
+    """Everything merge_variants needs from one snippet, parsed once."""
+    imports: Tuple[str, ...]           # cleaned import statements
+    name: str
+    jsx: str
+    variables: Tuple[str, ...]
 
 def extract_imports(code_snippets: List[str]) -> Set[str]:
     """Extract and deduplicate all import statements."""
@@ -11,7 +48,7 @@ def extract_imports(code_snippets: List[str]) -> Set[str]:
     
     for snippet in code_snippets:
         # Find all import lines
-        import_lines = re.findall(r'^import\s+.*?;?$', snippet, re.MULTILINE)
+        import_lines = IMPORT_LINE_RE.findall(snippet)
         for imp in import_lines:
             # Clean up the import
             clean_import = imp.strip().rstrip(';') + ';'
@@ -22,19 +59,19 @@ def extract_imports(code_snippets: List[str]) -> Set[str]:
 def extract_component_logic(code: str) -> dict:
     """Extract key parts of a component for merging."""
     # Extract component name
-    comp_match = re.search(r'export\s+const\s+(\w+)\s*=', code)
+    comp_match = EXPORT_CONST_RE.search(code)
     comp_name = comp_match.group(1) if comp_match else "Component"
     
     # Extract JSX content (everything between return and the closing of return)
-    jsx_match = re.search(r'return\s*\(?([^}]+)\)?;?\s*}', code, re.DOTALL)
-    jsx_content = jsx_match.group(1).strip() if jsx_match else "<div>Error extracting JSX</div>"
+    jsx_match = RETURN_JSX_RE.search(code)
+    jsx_content = jsx_match.group(1).strip() if jsx_match else EXTRACT_ERROR_JSX
     
     # Clean up JSX (remove outer parentheses if present)
     jsx_content = re.sub(r'^\s*\(\s*', '', jsx_content)
     jsx_content = re.sub(r'\s*\)\s*$', '', jsx_content)
     
     # Extract any variable declarations
-    var_matches = re.findall(r'const\s+\w+\s*=\s*[^;]+;', code)
+    var_matches = VAR_DECL_RE.findall(code)
     
     return {
         "name": comp_name,
@@ -42,108 +79,121 @@ def extract_component_logic(code: str) -> dict:
         "variables": var_matches
     }
 
+@lru_cache(maxsize=4096)
+def parse_variant(code: str) -> ParsedVariant:
+    """Parse one snippet into a ParsedVariant (memoised on the code text)."""
+    info = extract_component_logic(code)
+    return ParsedVariant(
+        imports=tuple(sorted(extract_imports([code]))),
+        name=info["name"],
+        jsx=info["jsx"],
+        variables=tuple(info["variables"]),
+    )
+
+def warm_parse_caches(components: List[dict]) -> None:
+    """Parse every variant of the catalog now, so merges of catalog code hit the parse caches."""
+    if MERGE_ENGINE == "ast":
+        from .tsx_merge import TSXParseError, parse_module
+    for comp in components:
+        for variant in comp.get("variants", []):
+            parse_variant(variant["code"])
+            if MERGE_ENGINE == "ast":
+                try:
+                    parse_module(variant["code"])       # warm the structural parse too
+                except TSXParseError as exc:
+                    log.warning("%s: %s; regex merge will be used", comp["component"], exc)
+
+def is_broken_merge(code: str) -> bool:
+    """True for merges that lost a snippet's JSX (these must never be cached)."""
+    return EXTRACT_ERROR_JSX in code
+
+def _form_wrapper(jsx: str) -> str:
+    lower = jsx.lower()
+    if "input" in lower or "textfield" in lower:
+        return "mb-4"
+    if "button" in lower:
+        return "mt-6"
+    return "mb-3"
+
+def _profile_wrapper(jsx: str) -> str:
+    lower = jsx.lower()
+    if "avatar" in lower:
+        return "flex justify-center mb-4"
+    if "badge" in lower:
+        return "flex flex-wrap gap-2 mb-3"
+    return "mb-3"
+
+def _render_layout(template: str, components: List[dict], wrapper) -> str:
+    parts = [(wrapper(comp["jsx"]), comp["jsx"]) for comp in components]
+    return TEMPLATES.get_template(template).render(parts=parts)
+
 def create_form_layout(components: List[dict], export_name: str) -> str:
     """Create a form-like layout when appropriate."""
-    jsx_parts = []
-    
-    for comp in components:
-        jsx = comp["jsx"]
-        # Wrap in form-friendly containers
-        if "input" in jsx.lower() or "textfield" in jsx.lower():
-            jsx_parts.append(f"      <div className=\"mb-4\">\n        {jsx}\n      </div>")
-        elif "button" in jsx.lower():
-            jsx_parts.append(f"      <div className=\"mt-6\">\n        {jsx}\n      </div>")
-        else:
-            jsx_parts.append(f"      <div className=\"mb-3\">\n        {jsx}\n      </div>")
-    
-    form_content = "\n".join(jsx_parts)
-    
-    return f"""    <div className=\"max-w-md mx-auto p-6 bg-white rounded-lg shadow-md\">
-      <form className=\"space-y-4\">
-{form_content}
-      </form>
-    </div>"""
+    return _render_layout("form.tsx.j2", components, _form_wrapper)
 
 def create_profile_layout(components: List[dict], export_name: str) -> str:
     """Create a profile-like layout."""
-    jsx_parts = []
-    
-    for comp in components:
-        jsx = comp["jsx"]
-        if "avatar" in jsx.lower():
-            jsx_parts.append(f"      <div className=\"flex justify-center mb-4\">\n        {jsx}\n      </div>")
-        elif "badge" in jsx.lower():
-            jsx_parts.append(f"      <div className=\"flex flex-wrap gap-2 mb-3\">\n        {jsx}\n      </div>")
-        else:
-            jsx_parts.append(f"      <div className=\"mb-3\">\n        {jsx}\n      </div>")
-    
-    profile_content = "\n".join(jsx_parts)
-    
-    return f"""    <div className=\"max-w-sm mx-auto p-6 bg-white rounded-lg shadow-lg text-center\">
-{profile_content}
-    </div>"""
+    return _render_layout("profile.tsx.j2", components, _profile_wrapper)
 
 def create_generic_layout(components: List[dict], export_name: str) -> str:
     """Create a generic vertical layout."""
-    jsx_parts = []
-    
-    for comp in components:
-        jsx = comp["jsx"]
-        jsx_parts.append(f"      <div className=\"mb-4\">\n        {jsx}\n      </div>")
-    
-    generic_content = "\n".join(jsx_parts)
-    
-    return f"""    <div className=\"p-6 space-y-4\">
-{generic_content}
-    </div>"""
+    return _render_layout("generic.tsx.j2", components, lambda jsx: "mb-4")
+
+def select_layout(export_name: str):
+    """Pick the layout builder for a component from its export name."""
+    export_lower = export_name.lower()
+    if any(word in export_lower for word in ['form', 'login', 'signup', 'register']):
+        return create_form_layout
+    if any(word in export_lower for word in ['profile', 'user', 'account']):
+        return create_profile_layout
+    return create_generic_layout
 
 def merge_variants(code_snippets: List[str], export_name: str) -> str:
     """
-    Merge multiple component code snippets using regex-based approach.
+    Merge multiple component code snippets: structural TSX merge by default,
+    regex-based approach if that is disabled or a snippet cannot be parsed.
     """
     if not code_snippets:
         return f"export default function {export_name}() {{ return <div>No components provided</div>; }}"
     
-    # Extract imports
-    all_imports = extract_imports(code_snippets)
+    with span("manual_merge"):
+        if MERGE_ENGINE == "ast":
+            from .tsx_merge import TSXParseError, merge_snippets
+            try:
+                return merge_snippets(code_snippets, export_name)
+            except TSXParseError as exc:
+                log.warning("TSX merge failed (%s), using regex merge", exc)
+
+        return merge_records([parse_variant(snippet) for snippet in code_snippets], export_name)
+
+def merge_records(records: List[ParsedVariant], export_name: str) -> str:
+    """
+    Merge pre-parsed snippets – string assembly only, no regex scanning.
+    """
+    if not records:
+        return f"export default function {export_name}() {{ return <div>No components provided</div>; }}"
+
+    # Imports
+    all_imports = {imp for record in records for imp in record.imports}
     imports_section = "\n".join(sorted(all_imports))
     
-    # Extract component logic from each snippet
-    components = []
-    variables = []
-    
-    for snippet in code_snippets:
-        comp_info = extract_component_logic(snippet)
-        components.append(comp_info)
-        variables.extend(comp_info["variables"])
+    # Component logic from each snippet
+    components = [{"name": r.name, "jsx": r.jsx, "variables": list(r.variables)} for r in records]
     
-    # Deduplicate variables
-    unique_vars = list(set(variables))
+    # Deduplicate variables (first occurrence wins, so output is stable)
+    unique_vars = list(dict.fromkeys(v for r in records for v in r.variables))
     variables_section = "\n  ".join(unique_vars) if unique_vars else ""
     
     # Determine layout based on export name/content
-    export_lower = export_name.lower()
-    
-    if any(word in export_lower for word in ['form', 'login', 'signup', 'register']):
-        main_jsx = create_form_layout(components, export_name)
-    elif any(word in export_lower for word in ['profile', 'user', 'account']):
-        main_jsx = create_profile_layout(components, export_name)
-    else:
-        main_jsx = create_generic_layout(components, export_name)
+    main_jsx = select_layout(export_name)(components, export_name)
     
     # Build the final component
-    component_body = f"""export default function {export_name}() {{
-  {variables_section}
-
-  return (
-{main_jsx}
-  );
-}}"""
-    
-    # Combine everything
-    full_component = f"""{imports_section}
-
-{component_body}"""
-    
-    print(f"🔧 Manual merge completed for {export_name}")
+    full_component = TEMPLATES.get_template("default.tsx.j2").render(
+        imports=imports_section,
+        export_name=export_name,
+        body=variables_section,
+        jsx_body=main_jsx,
+    )
+    
+    log.debug("Manual merge completed for %s", export_name)
     return full_component
\ No newline at end of file
@@ -0,0 +1,256 @@
+"""
+Chooses, per miss, between the AI merge and the regex merge.
+
+* ``use_ai=False`` on the request, or AI switched off, goes straight to the
+  regex merge;
+* the AI merge gets a latency budget (``AI_LATENCY_BUDGET`` or the
+  request's own, at least ``AI_MIN_LATENCY_BUDGET``).  The regex merge
+  runs alongside it, so when the budget runs out or the AI merge fails its
+  result is already there.  A late AI merge is not cancelled: it finishes
+  in the background and its result is handed to the caller's ``on_late``;
+* after ``AI_BREAKER_FAILURES`` failed AI merges in a row (errors,
+  ``AI_TIMEOUT`` timeouts, rejected replies such as unused imports) the
+  circuit opens: misses skip the LLM for ``AI_BREAKER_COOLDOWN`` seconds,
+  then one trial merge decides whether it closes again.  An overrun
+  budget is not a failure; the late merge reports its own outcome.
+
+Every merge is counted and timed per path (``merge_route_total``,
+``merge_path_duration_seconds``); ``route_status`` summarises them.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Set
+
+from .metrics import AI_FALLBACKS, AI_MERGES, MERGE_PATH_SECONDS, MERGE_ROUTES
+
+log = logging.getLogger(__name__)
+
+AI_LATENCY_BUDGET     = float(os.getenv("AI_LATENCY_BUDGET", "8"))        # seconds; 0 = wait for the AI merge
+AI_MIN_LATENCY_BUDGET = float(os.getenv("AI_MIN_LATENCY_BUDGET", "1"))    # floor for a request's own budget
+AI_BREAKER_FAILURES   = int(os.getenv("AI_BREAKER_FAILURES", "5"))        # consecutive failures that open it
+AI_BREAKER_COOLDOWN   = float(os.getenv("AI_BREAKER_COOLDOWN", "30"))     # seconds before a trial merge
+
+
+class CircuitBreaker:
+    """closed → (failures) → open → (cooldown) → half_open → one trial → closed | open."""
+
+    def __init__(self, failures: int = AI_BREAKER_FAILURES, cooldown: float = AI_BREAKER_COOLDOWN,
+                 clock=time.monotonic):
+        self.threshold = max(1, failures)
+        self.cooldown  = cooldown
+        self._clock    = clock
+        self._lock     = threading.Lock()
+        self.state     = "closed"
+        self.failures  = 0                          # consecutive
+        self._since    = 0.0                        # when it opened / the trial started
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self._clock() - self._since < self.cooldown:
+                return False                        # open, or a trial is still out
+            # Cooled down (or the last trial never reported back): let one through
+            self.state, self._since = "half_open", self._clock()
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                log.info("AI merge circuit closed")
+            self.state, self.failures = "closed", 0
+
+    def record_failure(self, reason: str) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+                log.warning("AI merge circuit open for %.0fs after %d failure(s), last: %s",
+                            self.cooldown, self.failures, reason)
+                self.state, self._since = "open", self._clock()
+
+
+class PathStats:
+    """Merges, successes and latency of one path, for ``route_status``."""
+
+    def __init__(self):
+        self._lock     = threading.Lock()
+        self.merges    = 0
+        self.successes = 0
+        self.seconds   = 0.0
+
+    def record(self, ok: bool, seconds: float) -> None:
+        with self._lock:
+            self.merges    += 1
+            self.successes += ok
+            self.seconds   += seconds
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "merges": self.merges,
+                "success_rate": round(self.successes / self.merges, 4) if self.merges else None,
+                "mean_ms": round(self.seconds / self.merges * 1000, 1) if self.merges else None,
+            }
+
+
+BREAKER = CircuitBreaker()
+PATHS: Dict[str, PathStats] = {"ai": PathStats(), "regex": PathStats()}
+_LATE: Set[asyncio.Future] = set()                  # AI merges that outlived their budget
+
+
+class Routed(NamedTuple):
+    code: str
+    path: str                                       # ai | regex
+    reason: str                                     # success, or why the regex merge answered
+
+
+def skip_reason(use_ai: Optional[bool] = True) -> Optional[str]:
+    """Why this merge must not try the LLM, or None if it may."""
+    from .ai_merge import _ai_enabled
+
+    if not _ai_enabled():
+        return "disabled"
+    if use_ai is False:
+        return "opt_out"
+    if not BREAKER.allow():
+        return "circuit_open"
+    return None
+
+
+def record_ai(ok: bool, seconds: float, reason: str = "success") -> None:
+    PATHS["ai"].record(ok, seconds)
+    MERGE_PATH_SECONDS.observe(seconds, path="ai")
+    if ok:
+        BREAKER.record_success()
+    else:
+        BREAKER.record_failure(reason)
+
+
+def _served(routed: Routed) -> Routed:
+    MERGE_ROUTES.inc(path=routed.path, reason=routed.reason)
+    if routed.reason in ("disabled", "opt_out", "circuit_open"):
+        AI_FALLBACKS.inc(reason=routed.reason)
+    return routed
+
+
+def _regex_merge(snippets: List[str], export_name: str) -> str:
+    from .manual_merge import merge_variants
+
+    started = time.perf_counter()
+    code    = merge_variants(snippets, export_name)
+    elapsed = time.perf_counter() - started
+    PATHS["regex"].record(True, elapsed)
+    MERGE_PATH_SECONDS.observe(elapsed, path="regex")
+    return code
+
+
+def _ai_failed(exc: BaseException, seconds: float) -> str:
+    from .ai_merge import _fall_back, _fallback_reason
+
+    reason = _fallback_reason(exc)
+    _fall_back(exc)
+    record_ai(False, seconds, reason)
+    return reason
+
+
+def route_merge(snippets: List[str], query: str, export_name: str, use_ai: Optional[bool] = True) -> Routed:
+    """
+    Blocking merge for the sync pipeline.  The AI call is bounded by
+    ``AI_TIMEOUT`` only: a latency budget needs the async race.
+    """
+    from .ai_merge import ai_merge
+
+    started = time.perf_counter()
+    reason  = skip_reason(use_ai)
+    if reason is None:
+        try:
+            code = ai_merge(snippets, query, export_name)
+            record_ai(True, time.perf_counter() - started)
+            return _served(Routed(code, "ai", "success"))
+        except Exception as exc:
+            reason = _ai_failed(exc, time.perf_counter() - started)
+    return _served(Routed(_regex_merge(snippets, export_name), "regex", reason))
+
+
+def _finish_late(ai: asyncio.Future, started: float, query: str,
+                 on_late: Optional[Callable[[str], Awaitable[None]]]) -> None:
+    """Let an AI merge that overran its budget finish, record its outcome and pass its code on."""
+    from .ai_merge import _fallback_reason
+
+    async def finish() -> None:
+        try:
+            code = await ai
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            reason = _fallback_reason(exc)
+            AI_MERGES.inc(outcome="fallback")
+            record_ai(False, time.perf_counter() - started, reason)
+            log.info("Late AI merge for %r failed (%s): %r", query, reason, exc)
+            return
+        record_ai(True, time.perf_counter() - started)
+        if on_late is not None:
+            await on_late(code)
+
+    task = asyncio.ensure_future(finish())
+    _LATE.add(task)
+    task.add_done_callback(_LATE.discard)
+
+
+async def route_merge_async(snippets: List[str], query: str, export_name: str,
+                            use_ai: Optional[bool] = True, budget: Optional[float] = None,
+                            on_late: Optional[Callable[[str], Awaitable[None]]] = None) -> Routed:
+    """
+    Merge for one miss: the AI merge within *budget* seconds (default
+    ``AI_LATENCY_BUDGET``, a positive one no less than
+    ``AI_MIN_LATENCY_BUDGET``), raced against the regex merge that answers
+    if it is late, fails or is not to be tried.  A late AI merge carries
+    on in the background and, if it succeeds, is awaited by *on_late*.
+    """
+    from .ai_merge import ai_merge_async
+
+    reason = skip_reason(use_ai)
+    if reason is not None:
+        code = await asyncio.to_thread(_regex_merge, snippets, export_name)
+        return _served(Routed(code, "regex", reason))
+
+    if budget is None:
+        budget = AI_LATENCY_BUDGET
+    elif budget > 0:
+        budget = max(budget, AI_MIN_LATENCY_BUDGET)
+    started = time.perf_counter()
+    ai      = asyncio.ensure_future(ai_merge_async(snippets, query, export_name))
+    regex   = asyncio.ensure_future(asyncio.to_thread(_regex_merge, snippets, export_name))
+    try:
+        done, _ = await asyncio.wait({ai}, timeout=budget if budget > 0 else None)
+    except asyncio.CancelledError:
+        ai.cancel()
+        regex.cancel()
+        raise
+    elapsed = time.perf_counter() - started
+
+    if ai in done and ai.exception() is None:
+        regex.cancel()                              # the thread finishes on its own; nobody waits for it
+        record_ai(True, elapsed)
+        return _served(Routed(ai.result(), "ai", "success"))
+
+    if ai in done:
+        reason = _ai_failed(ai.exception(), elapsed)
+    else:
+        reason = "budget"
+        AI_FALLBACKS.inc(reason=reason)
+        _finish_late(ai, started, query, on_late)
+        log.info("AI merge for %r exceeded its %.1fs budget; serving the regex merge", query, budget)
+    return _served(Routed(await regex, "regex", reason))
+
+
+def route_status() -> dict:
+    return {
+        "breaker": {"state": BREAKER.state, "consecutive_failures": BREAKER.failures},
+        "paths": {path: stats.summary() for path, stats in PATHS.items()},
+        "latency_budget_s": AI_LATENCY_BUDGET,
+        "late_ai_merges": len(_LATE),
+    }
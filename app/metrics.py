@@ -0,0 +1,189 @@
+"""
+Process-local counters and latency histograms for the suggest pipeline,
+exposed in the Prometheus text format on ``GET /metrics``.
+
+Each worker keeps its own numbers; scrape every worker (or aggregate by
+``instance``) when running more than one.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+log = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: LabelKey, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name       = name
+        self.doc        = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock      = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonic count per label combination."""
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram per label combination."""
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelKey, List[float]] = {}     # bucket counts..., +Inf, sum
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            row[bisect.bisect_left(self.buckets, value)] += 1
+            row[-1] += value
+
+    def count(self, **labels: str) -> int:
+        row = self._values.get(self._key(labels))
+        return int(sum(row[:-1])) if row else 0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, row in items:
+            cumulative = 0.0
+            for bound, n in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative:g}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {row[-1]:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative:g}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+def render_latest() -> str:
+    """Every registered metric in the text exposition format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# ────────────────── pipeline metrics ──────────────────
+STAGE_SECONDS = Histogram(
+    "suggest_stage_duration_seconds",
+    "Time spent in each stage of the suggest pipeline.",
+    ("stage",),             # cache_lookup | retrieval | ai_merge | manual_merge | cache_write
+)
+CACHE_LOOKUPS = Counter(
+    "pattern_cache_lookups_total",
+    "Suggest lookups by how the pattern cache answered (exact, normalized, similar, combo, coalesced, miss).",
+    ("tier",),
+)
+CACHE_INVALIDATIONS = Counter(
+    "pattern_cache_invalidated_total",
+    "Cached patterns dropped because a component they were merged from changed.",
+)
+AI_MERGES = Counter(
+    "ai_merge_total",
+    "AI merge attempts by outcome (success, fallback).",
+    ("outcome",),
+)
+AI_FALLBACKS = Counter(
+    "ai_fallback_total",
+    "AI merges answered by the manual merge instead, by reason.",
+    ("reason",),
+)
+MERGE_ROUTES = Counter(
+    "merge_route_total",
+    "Merges by the path that answered (ai, regex) and why (success, opt_out, circuit_open, budget, ...).",
+    ("path", "reason"),
+)
+MERGE_PATH_SECONDS = Histogram(
+    "merge_path_duration_seconds",
+    "Time taken by each merge path (ai, regex), whether or not its result was used.",
+    ("path",),
+)
+AI_UPGRADES = Counter(
+    "ai_upgrade_total",
+    "Background AI upgrades of provisional regex merges (queued, dropped, upgraded, obsolete, waiting, retried, failed).",
+    ("result",),
+)
+LLM_CACHE_REQUESTS = Counter(
+    "llm_cache_requests_total",
+    "LLM reply cache lookups by result (hit, miss, replay_miss).",
+    ("result",),
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens reported by the LLM API, by kind (prompt, completion).",
+    ("kind",),
+)
+LLM_PROMPT_TOKENS_SAVED = Counter(
+    "llm_prompt_tokens_saved_total",
+    "Snippet tokens removed from AI merge prompts by compaction and budgeting.",
+)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the enclosed block into ``suggest_stage_duration_seconds{stage=...}``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        log.debug("%s took %.2f ms", stage, elapsed * 1000)
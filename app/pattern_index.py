@@ -0,0 +1,119 @@
+"""
+Search index over the cached queries, for listing them a page at a time.
+
+* the keys in sorted order: a prefix is a contiguous range found with
+  ``bisect``, and a cursor (the last key of the previous page) resumes the
+  range in O(log n);
+* the same keys joined into one newline-separated string, so a substring
+  search is ``str.find`` (C speed, no per-key Python work) from the
+  cursor's offset until a page is full;
+* component -> sorted keys, for "every cached pattern that uses Checkbox"
+  (and for the cache's targeted invalidation).
+
+Keys that are not user queries (see ``listed``) are indexed by component
+only.  Not thread-safe on its own; :class:`~app.assembler.PatternCache`
+serialises access.
+"""
+from bisect import bisect_left, bisect_right, insort
+from itertools import accumulate
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+def _remove(sorted_keys: List[str], key: str) -> None:
+    i = bisect_left(sorted_keys, key)
+    if i < len(sorted_keys) and sorted_keys[i] == key:
+        del sorted_keys[i]
+
+
+class PatternIndex:
+    def __init__(self, listed: Callable[[str], bool] = lambda key: True):
+        self.listed = listed
+        self._keys: List[str] = []                          # sorted listed keys
+        self._components: Dict[str, List[str]] = {}         # key -> components
+        self._by_component: Dict[str, List[str]] = {}       # component -> sorted keys
+        self._text: Optional[str] = None                    # "\n".join(_keys) + "\n", built on demand
+        self._starts: List[int] = []                        # offset of each key in _text
+
+    def rebuild(self, items: Iterable[Tuple[str, List[str]]]) -> None:
+        self._components = {key: list(components) for key, components in items}
+        self._keys = sorted(k for k in self._components if self.listed(k))
+        by_component: Dict[str, List[str]] = {}
+        for key, components in self._components.items():
+            for comp in components:
+                by_component.setdefault(comp, []).append(key)
+        self._by_component = {comp: sorted(keys) for comp, keys in by_component.items()}
+        self._text = None
+
+    def add(self, key: str, components: List[str]) -> None:
+        if key in self._components:
+            for comp in self._components[key]:
+                _remove(self._by_component.get(comp, []), key)
+        elif self.listed(key):
+            insort(self._keys, key)
+            self._text = None
+        self._components[key] = list(components)
+        for comp in components:
+            insort(self._by_component.setdefault(comp, []), key)
+
+    def using(self, components: Iterable[str]) -> Set[str]:
+        """Keys of the entries merged from any of *components*."""
+        return set().union(*(self._by_component.get(c, ()) for c in components))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _blob(self) -> str:
+        if self._text is None:
+            self._text   = "\n".join(self._keys) + "\n"
+            self._starts = list(accumulate((len(k) + 1 for k in self._keys), initial=0))
+        return self._text
+
+    def _containing(self, needle: str, start: int) -> Iterator[str]:
+        """Listed keys from position *start* on that contain *needle*, in order."""
+        text = self._blob()
+        pos  = self._starts[start]
+        while True:
+            hit = text.find(needle, pos)
+            if hit < 0:
+                return
+            i = bisect_right(self._starts, hit) - 1
+            yield self._keys[i]
+            pos = self._starts[i + 1]
+
+    def _matching(self, after: str, prefix: str, contains: str, component: Optional[str]) -> Iterator[str]:
+        """Listed keys greater than *after* that match every filter given, in sorted order."""
+        if "\n" in contains:
+            return
+        keys  = self._by_component.get(component, []) if component is not None else self._keys
+        start = max(bisect_right(keys, after) if after else 0, bisect_left(keys, prefix))
+
+        if component is None and contains:
+            source: Iterable[str] = self._containing(contains, start)
+        else:
+            source = (keys[i] for i in range(start, len(keys)))
+
+        for key in source:
+            if not key.startswith(prefix):
+                return                                  # sorted: past the prefix range
+            if (contains and contains not in key) or not self.listed(key):
+                continue
+            yield key
+
+    def page(self, limit: int, after: str = "", prefix: str = "", contains: str = "",
+             component: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+        """
+        Up to *limit* listed keys in sorted order, greater than *after*,
+        matching every filter given → (keys, cursor of the next page or None).
+        """
+        found: List[str] = []
+        for key in self._matching(after, prefix, contains.lower(), component):
+            if len(found) == limit:
+                return found, found[-1]
+            found.append(key)
+        return found, None
+
+    def count(self, prefix: str = "", contains: str = "", component: Optional[str] = None) -> int:
+        """How many listed keys match every filter given, over all pages."""
+        if not (prefix or contains or component is not None):
+            return len(self._keys)
+        return sum(1 for _ in self._matching("", prefix, contains.lower(), component))
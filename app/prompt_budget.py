@@ -0,0 +1,227 @@
+"""
+Token budgeting for the AI merge prompt.
+
+Variant snippets are written for people: ``// TIP:`` comments, long sample
+data arrays, runs of identical list items and blank lines that the model
+does not need to merge them.  ``fit_snippets`` compacts each snippet
+(comments out, sample arrays and repeated sibling elements cut to their
+first few items) and, if the prompt is still over ``AI_PROMPT_BUDGET``
+tokens, drops the middle of the longest snippets, keeping their imports and
+the JSX they end with.  ``output_budget`` sizes ``max_tokens`` from what is
+left, since the merged file is about as long as its compacted inputs.
+
+Tokens are counted with ``tiktoken`` when it is installed, otherwise
+estimated from the character count.
+"""
+import math
+import os
+import re
+from typing import List, NamedTuple
+
+from .lazy import Lazy
+
+AI_PROMPT_BUDGET      = int(os.getenv("AI_PROMPT_BUDGET", "6000"))       # tokens, system + user prompt
+AI_MIN_OUTPUT_TOKENS  = int(os.getenv("AI_MIN_OUTPUT_TOKENS", "512"))
+AI_MAX_OUTPUT_TOKENS  = int(os.getenv("AI_MAX_OUTPUT_TOKENS", "2500"))
+AI_OUTPUT_RATIO       = float(os.getenv("AI_OUTPUT_RATIO", "1.1"))        # output tokens per snippet token
+MAX_SAMPLE_ITEMS      = int(os.getenv("AI_MAX_SAMPLE_ITEMS", "2"))        # items kept per list / array
+
+CHARS_PER_TOKEN = 3.5                               # TSX averages ~3.5 characters per token
+
+def _estimate(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _load_counter():
+    try:
+        import tiktoken  # type: ignore
+    except ImportError:                             # optional dependency
+        return _estimate
+    try:
+        encoding = tiktoken.encoding_for_model(os.getenv("AI_MODEL", "gpt-4o-mini"))
+    except KeyError:
+        encoding = tiktoken.get_encoding("o200k_base")
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+# Loading the encoding reads (or downloads) its BPE ranks: done on first use.
+TOKEN_COUNTER = Lazy("token_counter", _load_counter)
+
+
+def count_tokens(text: str) -> int:
+    return TOKEN_COUNTER.get()(text)
+
+
+# ────────────────── compaction ──────────────────
+_LINE_COMMENT  = re.compile(r"^[ \t]*//.*\n?", re.MULTILINE)
+_BLOCK_COMMENT = re.compile(r"^[ \t]*\{?/\*[\s\S]*?\*/\}?[ \t]*\n?", re.MULTILINE)
+_TAIL_COMMENT  = re.compile(r"(?<=[;,{}()\[\]])[ \t]+//[^'\"`\n]*$", re.MULTILINE)
+_BLANK_RUNS    = re.compile(r"\n[ \t]*\n(?:[ \t]*\n)+")
+_ARRAY_DECL    = re.compile(
+    r"^[ \t]*(?:export\s+)?(?:const|let|var)\s+\w+(?:\s*:\s*[^=\n]+)?\s*=\s*\[", re.MULTILINE,
+)
+
+
+def strip_comments(code: str) -> str:
+    """Drop ``//`` and ``/* */`` comments on their own lines, trailing ``// …`` and blank-line runs."""
+    code = _BLOCK_COMMENT.sub("", code)
+    code = _LINE_COMMENT.sub("", code)
+    code = _TAIL_COMMENT.sub("", code)
+    code = _BLANK_RUNS.sub("\n\n", code)
+    return "\n".join(line.rstrip() for line in code.split("\n")).strip()
+
+
+def _array_items(code: str, start: int):
+    """
+    Split the array literal opening at ``code[start] == '['`` → (end of the
+    literal, [end of each top-level item including its comma]).
+    """
+    depth, quote, ends, i = 0, None, [], start
+    while i < len(code):
+        ch = code[i]
+        if quote:
+            if ch == "\\":
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in "'\"`":
+            quote = ch
+        elif ch in "[({":
+            depth += 1
+        elif ch in "])}":
+            depth -= 1
+            if depth == 0:
+                if code[ends[-1] if ends else start + 1:i].strip():
+                    ends.append(i)          # last item without a trailing comma
+                return i, ends
+        elif ch == "," and depth == 1:
+            ends.append(i + 1)
+        i += 1
+    return -1, []                           # unbalanced: leave the snippet alone
+
+
+def truncate_arrays(code: str, keep: int = MAX_SAMPLE_ITEMS) -> str:
+    """Cut declared array literals (sample data, options lists) down to their first *keep* items."""
+    out, pos = [], 0
+    for match in _ARRAY_DECL.finditer(code):
+        if match.start() < pos:
+            continue                        # nested inside an array we already cut
+        end, items = _array_items(code, match.end() - 1)
+        if end < 0 or len(items) <= keep:
+            continue
+        indent = re.match(r"[ \t]*", code[code.rfind("\n", 0, end) + 1:]).group(0)
+        out.append(code[pos:items[keep - 1] if keep else match.end()])
+        out.append("\n" + indent)
+        pos = end
+    out.append(code[pos:])
+    return "".join(out)
+
+
+_JSX_OPEN = re.compile(r"^([ \t]*)<([A-Za-z][\w.]*)\b")
+
+
+def _element_end(lines: List[str], i: int, indent: str, tag: str) -> int:
+    """Last line of the JSX element opening on ``lines[i]``, or -1 if it cannot be told."""
+    first = lines[i]
+    if first.rstrip().endswith("/>") or f"</{tag}>" in first:
+        return i
+    for j in range(i + 1, len(lines)):
+        line = lines[j]
+        if line.strip() and not line.startswith(indent + " ") and not line.startswith(indent + "\t"):
+            rest = line[len(indent):] if line.startswith(indent) else None
+            return j if rest is not None and (rest.startswith(f"</{tag}>") or rest.startswith("/>")) else -1
+    return -1
+
+
+def truncate_repeated_elements(code: str, keep: int = MAX_SAMPLE_ITEMS) -> str:
+    """Keep the first *keep* of a run of sibling JSX elements with the same tag (list items, options)."""
+    lines = code.split("\n")
+    i = 0
+    while i < len(lines):
+        match = _JSX_OPEN.match(lines[i])
+        if match:
+            indent, tag = match.groups()
+            run, j = [], i
+            while j < len(lines):
+                sibling = _JSX_OPEN.match(lines[j])
+                if not sibling or sibling.groups() != (indent, tag):
+                    break
+                end = _element_end(lines, j, indent, tag)
+                if end < 0:
+                    break
+                run.append((j, end))
+                j = end + 1
+            if len(run) > keep:
+                del lines[run[keep][0]:run[-1][1] + 1]
+        i += 1
+    return "\n".join(lines)
+
+
+def compact_snippet(code: str, keep: int = MAX_SAMPLE_ITEMS) -> str:
+    return truncate_repeated_elements(truncate_arrays(strip_comments(code), keep), keep)
+
+
+def shorten(code: str, max_tokens: int) -> str:
+    """
+    Fit *code* into *max_tokens* by dropping lines from its middle: the import
+    block stays, then as much of the end of the file (the returned JSX) as fits.
+    """
+    if count_tokens(code) <= max_tokens:
+        return code
+    lines = code.split("\n")
+    head, in_import = 0, False
+    while head < len(lines):
+        line = lines[head]
+        if line.startswith("import"):
+            in_import = not re.search(r"\bfrom\s+['\"]|^import\s+['\"]", line)
+        elif in_import:
+            in_import = not re.search(r"\bfrom\s+['\"]", line)
+        elif line.strip():
+            break
+        head += 1
+    kept   = lines[:head] + ["// …"]
+    budget = max_tokens - count_tokens("\n".join(kept))
+    tail: List[str] = []
+    for line in reversed(lines[head:]):
+        cost = count_tokens(line) + 1
+        if cost > budget:
+            break
+        tail.append(line)
+        budget -= cost
+    return "\n".join(kept + tail[::-1])
+
+
+# ────────────────── budget ──────────────────
+class FittedSnippets(NamedTuple):
+    snippets: List[str]
+    tokens_before: int                              # the snippets as given
+    tokens_after: int                               # what is sent
+
+
+def fit_snippets(snippets: List[str], budget: int) -> FittedSnippets:
+    """
+    Compact *snippets* and, if they still exceed *budget* tokens together,
+    shorten the longest ones until they fit.
+    """
+    before   = sum(count_tokens(s) for s in snippets)
+    compact  = [compact_snippet(s) for s in snippets]
+    counts   = [count_tokens(s) for s in compact]
+    if sum(counts) > budget:
+        compact = [compact_snippet(s, keep=1) for s in snippets]
+        counts  = [count_tokens(s) for s in compact]
+    while sum(counts) > budget and compact:
+        # Shorten the longest snippet to an equal share of the budget (or by a quarter).
+        i      = max(range(len(compact)), key=counts.__getitem__)
+        target = max(budget // len(compact), counts[i] * 3 // 4, 1)
+        if target >= counts[i]:
+            target = counts[i] - 1
+        shorter = shorten(compact[i], target)
+        if shorter == compact[i]:
+            break                           # nothing left to drop
+        compact[i], counts[i] = shorter, count_tokens(shorter)
+    return FittedSnippets(compact, before, sum(counts))
+
+
+def output_budget(snippet_tokens: int) -> int:
+    """``max_tokens`` for a merge of snippets totalling *snippet_tokens*."""
+    expected = int(snippet_tokens * AI_OUTPUT_RATIO) + 200      # + the fence and a short preamble
+    return max(AI_MIN_OUTPUT_TOKENS, min(AI_MAX_OUTPUT_TOKENS, expected))
@@ -0,0 +1,116 @@
+"""
+Query normalisation and near-duplicate lookup over cached queries.
+
+"Login form!", "a login form" and "form for login" all normalise to the
+same key.  Beyond that, ``QueryMatcher`` finds the cached query with the
+highest token Jaccard similarity above a threshold, using an inverted
+index with prefix filtering so only queries sharing a rare token are
+compared.
+"""
+import math
+import os
+import re
+import threading
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+SIMILARITY_THRESHOLD = float(os.getenv("CACHE_SIMILARITY_THRESHOLD", "0.8"))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an the and or with for of to in on at by from into using use
+my our your me i we you it its this that these those some any
+please want need give show make create build generate get
+""".split())
+
+# Kept as tokens ("form without checkbox" is not "form with checkbox"), and a
+# near-duplicate must negate the same words as the query.
+NEGATIONS = frozenset({"no", "non", "not", "without"})
+
+
+def _stem(token: str) -> str:
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def query_tokens(query: str) -> Set[str]:
+    """Content tokens of *query*: lower-cased, punctuation and stopwords dropped."""
+    return {_stem(t) for t in TOKEN_RE.findall(query.lower()) if t not in STOPWORDS}
+
+
+def normalize_query(query: str) -> str:
+    """Order-insensitive canonical form, e.g. 'A Login form!' -> 'form login'."""
+    return " ".join(sorted(query_tokens(query)))
+
+
+class QueryMatcher:
+    """Normalised-key map plus a token index over a set of cached queries."""
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD):
+        self.threshold = min(max(threshold, 0.01), 1.0)
+        self._lock     = threading.Lock()
+        self._by_norm: Dict[str, str] = {}              # normalised key -> cache key
+        self._tokens:  Dict[str, Set[str]] = {}         # normalised key -> tokens
+        self._postings: Dict[str, Set[str]] = {}        # token -> normalised keys
+
+    def rebuild(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            self._by_norm, self._tokens, self._postings = {}, {}, {}
+            for key in keys:
+                self._add(key)
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            self._add(key)
+
+    def _add(self, key: str) -> None:
+        tokens = query_tokens(key)
+        if not tokens:
+            return
+        norm = " ".join(sorted(tokens))
+        self._by_norm[norm] = key
+        if norm not in self._tokens:
+            self._tokens[norm] = tokens
+            for token in tokens:
+                self._postings.setdefault(token, set()).add(norm)
+
+    def match(self, query: str) -> Optional[Tuple[str, str, float]]:
+        """
+        Return ``(cache_key, tier, similarity)`` for the best cached query,
+        tier being ``"normalized"`` or ``"similar"``, or None.
+        """
+        tokens = query_tokens(query)
+        if not tokens:
+            return None
+        norm = " ".join(sorted(tokens))
+        with self._lock:
+            if norm in self._by_norm:
+                return self._by_norm[norm], "normalized", 1.0
+
+            # Prefix filter: any candidate with Jaccard >= t shares at least one
+            # of the |q| - ceil(t·|q|) + 1 rarest query tokens.
+            rare = sorted(tokens, key=lambda t: len(self._postings.get(t, ())))
+            prefix = len(tokens) - math.ceil(self.threshold * len(tokens)) + 1
+            candidates: Set[str] = set()
+            for token in rare[:max(prefix, 1)]:
+                candidates.update(self._postings.get(token, ()))
+
+            negated = tokens & NEGATIONS
+            best: Optional[Tuple[str, float]] = None
+            for cand in candidates:
+                other = self._tokens[cand]
+                if not (self.threshold * len(tokens) <= len(other) <= len(tokens) / self.threshold):
+                    continue
+                if other & NEGATIONS != negated:
+                    continue
+                score = len(tokens & other) / len(tokens | other)
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (cand, score)
+            if best is None:
+                return None
+            return self._by_norm[best[0]], "similar", best[1]
+
+    def __len__(self) -> int:
+        return len(self._by_norm)
+
@@ -1,17 +1,48 @@
 """Pick matching components from a query string with proper scoring."""
-import json
+import hashlib
+import logging
+import os
 import re
-import pathlib
-from typing import List
+from typing import Dict, List, Tuple
 
-# Load the data
-DATA = json.loads(pathlib.Path("data/components.json").read_text("utf-8"))
-NAME2COMP = {c["component"]: c for c in DATA}
+import numpy as np
+
+from .catalog import CATALOG_HASH, COMPONENTS as DATA, NAME2COMP
+from .lazy import Lazy
+from .query_match import query_tokens
+from .shared_state import SHARED_STATE, shared_arrays
+
+log = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'\b\w+\b')
+
+# keyword | semantic | hybrid  (the last two need sentence-transformers + faiss-cpu)
+RETRIEVER_MODE     = os.getenv("RETRIEVER_MODE", "keyword").lower()
+HYBRID_ALPHA       = float(os.getenv("HYBRID_ALPHA", "0.5"))        # weight of the vector score
+SEMANTIC_MIN_SCORE = float(os.getenv("SEMANTIC_MIN_SCORE", "0.25"))
+
+# Field weights for a query word found in a component's name / description / tags
+NAME_WEIGHT, DESC_WEIGHT, TAG_WEIGHT = 10.0, 3.0, 5.0
+NAME_IN_QUERY_BONUS = 20.0
+PATTERN_EXACT_BONUS, PATTERN_PARTIAL_BONUS = 15.0, 8.0
+# ...and a query token found in a variant's name / description
+VARIANT_NAME_WEIGHT, VARIANT_DESC_WEIGHT = 2.0, 1.0
+
+# UI pattern bonuses
+UI_PATTERNS = {
+    'form': ['input', 'button', 'checkbox', 'textfield', 'select', 'textarea', 'label'],
+    'login': ['input', 'button', 'textfield', 'checkbox'],
+    'profile': ['avatar', 'badge', 'card', 'image'],
+    'navigation': ['button', 'link', 'breadcrumb', 'menu'],
+    'layout': ['card', 'container', 'grid', 'box'],
+    'data': ['table', 'list', 'card', 'grid'],
+    'user': ['avatar', 'badge', 'profile', 'card'],
+}
 
 def score_component_relevance(component: dict, query: str) -> float:
     """Score how relevant a component is to the query."""
     query_lower = query.lower()
-    query_words = set(re.findall(r'\b\w+\b', query_lower))
+    query_words = set(WORD_RE.findall(query_lower))
     
     if not query_words:
         return 0.0
@@ -21,68 +52,251 @@ def score_component_relevance(component: dict, query: str) -> float:
     # Component name exact match (highest weight)
     comp_name = component["component"].lower()
     if comp_name in query_lower:
-        score += 20.0
+        score += NAME_IN_QUERY_BONUS
     
     # Component name word matches
-    comp_words = set(re.findall(r'\b\w+\b', comp_name))
+    comp_words = set(WORD_RE.findall(comp_name))
     name_matches = query_words.intersection(comp_words)
-    score += len(name_matches) * 10.0
+    score += len(name_matches) * NAME_WEIGHT
     
     # Description word matches
     description = component.get("description", "").lower()
-    desc_words = set(re.findall(r'\b\w+\b', description))
+    desc_words = set(WORD_RE.findall(description))
     desc_matches = query_words.intersection(desc_words)
-    score += len(desc_matches) * 3.0
+    score += len(desc_matches) * DESC_WEIGHT
     
     # Tag matches
     tags = component.get("tags", [])
     tag_words = set()
     for tag in tags:
-        tag_words.update(re.findall(r'\b\w+\b', tag.lower()))
+        tag_words.update(WORD_RE.findall(tag.lower()))
     
     tag_matches = query_words.intersection(tag_words)
-    score += len(tag_matches) * 5.0
-    
-    # UI pattern bonuses
-    ui_patterns = {
-        'form': ['input', 'button', 'checkbox', 'textfield', 'select', 'textarea', 'label'],
-        'login': ['input', 'button', 'textfield', 'checkbox'],
-        'profile': ['avatar', 'badge', 'card', 'image'],
-        'navigation': ['button', 'link', 'breadcrumb', 'menu'],
-        'layout': ['card', 'container', 'grid', 'box'],
-        'data': ['table', 'list', 'card', 'grid'],
-        'user': ['avatar', 'badge', 'profile', 'card'],
-    }
+    score += len(tag_matches) * TAG_WEIGHT
     
-    for pattern, related_components in ui_patterns.items():
+    for pattern, related_components in UI_PATTERNS.items():
         if pattern in query_lower:
             if comp_name in related_components:
-                score += 15.0
+                score += PATTERN_EXACT_BONUS
             elif any(related in comp_name for related in related_components):
-                score += 8.0
+                score += PATTERN_PARTIAL_BONUS
     
     return score
 
+# ────────────────── compiled index ──────────────────
+# Built once at import.  Each vocabulary token owns one row of a CSR weight
+# matrix (token × component), so scoring a query is a sparse
+# indicator-vector · matrix product plus a few precomputed bonus vectors –
+# it does not touch components the query shares no words with.
+def _compile_index(data: List[dict]):
+    postings: Dict[str, Dict[int, float]] = {}
+
+    def add(words, idx: int, weight: float) -> None:
+        for word in words:
+            row = postings.setdefault(word, {})
+            row[idx] = row.get(idx, 0.0) + weight
+
+    pattern_bonus = {p: np.zeros(len(data)) for p in UI_PATTERNS}
+
+    for idx, comp in enumerate(data):
+        comp_name = comp["component"].lower()
+        tag_words = set()
+        for tag in comp.get("tags", []):
+            tag_words.update(WORD_RE.findall(tag.lower()))
+        add(set(WORD_RE.findall(comp_name)), idx, NAME_WEIGHT)
+        add(set(WORD_RE.findall(comp.get("description", "").lower())), idx, DESC_WEIGHT)
+        add(tag_words, idx, TAG_WEIGHT)
+
+        for pattern, related_components in UI_PATTERNS.items():
+            if comp_name in related_components:
+                pattern_bonus[pattern][idx] = PATTERN_EXACT_BONUS
+            elif any(related in comp_name for related in related_components):
+                pattern_bonus[pattern][idx] = PATTERN_PARTIAL_BONUS
+
+    return (*_to_csr(postings), _names_by_len(data), pattern_bonus)
+
+def _to_csr(postings: Dict[str, Dict[int, float]]):
+    """token -> {column: weight} as (vocab, indptr, indices, weights)."""
+    vocab   = {word: row for row, word in enumerate(postings)}
+    indptr  = np.zeros(len(vocab) + 1, dtype=np.int64)
+    indices = []
+    weights = []
+    for word, row in vocab.items():
+        cols = sorted(postings[word])
+        indices.extend(cols)
+        weights.extend(postings[word][c] for c in cols)
+        indptr[row + 1] = indptr[row] + len(cols)
+    return vocab, indptr, np.asarray(indices, dtype=np.int64), np.asarray(weights, dtype=np.float64)
+
+# Variants get their own, smaller matrix (token × variant) over their name and
+# description, compared on content tokens only so filler words like "a" or
+# "that" do not favour long descriptions.  Component i owns the variant
+# columns V_OFFSETS[i]:V_OFFSETS[i + 1].
+def _compile_variant_index(data: List[dict]):
+    postings: Dict[str, Dict[int, float]] = {}
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    col = 0
+    for idx, comp in enumerate(data):
+        for variant in comp.get("variants", []):
+            for words, weight in ((query_tokens(variant.get("name", "")), VARIANT_NAME_WEIGHT),
+                                  (query_tokens(variant.get("description", "")), VARIANT_DESC_WEIGHT)):
+                for word in words:
+                    row = postings.setdefault(word, {})
+                    row[col] = row.get(col, 0.0) + weight
+            col += 1
+        offsets[idx + 1] = col
+    return (*_to_csr(postings), offsets)
+
+def _names_by_len(data: List[dict]) -> Dict[int, Dict[str, List[int]]]:
+    names_by_len: Dict[int, Dict[str, List[int]]] = {}
+    for idx, comp in enumerate(data):
+        comp_name = comp["component"].lower()
+        names_by_len.setdefault(len(comp_name), {}).setdefault(comp_name, []).append(idx)
+    return names_by_len
+
+def _index_arrays(data: List[dict]) -> Dict[str, np.ndarray]:
+    """The compiled index as plain arrays, for the shared memory-mapped copy."""
+    vocab, indptr, indices, weights, _, pattern_bonus = _compile_index(data)
+    v_vocab, v_indptr, v_indices, v_weights, v_offsets = _compile_variant_index(data)
+    return {
+        "vocab":         np.array(list(vocab), dtype=str),
+        "indptr":        indptr,
+        "indices":       indices,
+        "weights":       weights,
+        "pattern_bonus": np.stack([pattern_bonus[p] for p in UI_PATTERNS]),
+        "v_vocab":       np.array(list(v_vocab), dtype=str),
+        "v_indptr":      v_indptr,
+        "v_indices":     v_indices,
+        "v_weights":     v_weights,
+        "v_offsets":     v_offsets,
+    }
+
+def _index_key() -> str:
+    """Catalog plus scoring constants: a new key whenever the index would differ."""
+    params = repr((NAME_WEIGHT, DESC_WEIGHT, TAG_WEIGHT, PATTERN_EXACT_BONUS, PATTERN_PARTIAL_BONUS,
+                   VARIANT_NAME_WEIGHT, VARIANT_DESC_WEIGHT, sorted(UI_PATTERNS.items())))
+    return CATALOG_HASH + hashlib.sha256(params.encode("utf-8")).hexdigest()[:8]
+
+if SHARED_STATE:
+    # Every worker maps the same read-only files; only the first one tokenises
+    _arrays       = shared_arrays("retrieval", _index_key(), lambda: _index_arrays(DATA))
+    VOCAB         = {str(word): row for row, word in enumerate(_arrays["vocab"])}
+    W_INDPTR      = _arrays["indptr"]
+    W_INDICES     = _arrays["indices"]
+    W_DATA        = _arrays["weights"]
+    PATTERN_BONUS = dict(zip(UI_PATTERNS, _arrays["pattern_bonus"]))
+    NAMES_BY_LEN  = _names_by_len(DATA)
+    V_VOCAB       = {str(word): row for row, word in enumerate(_arrays["v_vocab"])}
+    V_INDPTR      = _arrays["v_indptr"]
+    V_INDICES     = _arrays["v_indices"]
+    V_DATA        = _arrays["v_weights"]
+    V_OFFSETS     = _arrays["v_offsets"]
+else:
+    VOCAB, W_INDPTR, W_INDICES, W_DATA, NAMES_BY_LEN, PATTERN_BONUS = _compile_index(DATA)
+    V_VOCAB, V_INDPTR, V_INDICES, V_DATA, V_OFFSETS = _compile_variant_index(DATA)
+COMPONENT_NAMES = [c["component"] for c in DATA]
+COMPONENT_INDEX = {name: idx for idx, name in enumerate(COMPONENT_NAMES)}
+
+def score_all(query: str) -> np.ndarray:
+    """Relevance of every component to *query*, same values as score_component_relevance."""
+    scores = np.zeros(len(DATA))
+    query_lower = query.lower()
+    query_words = set(WORD_RE.findall(query_lower))
+    if not query_words:
+        return scores
+
+    # query words · weight matrix
+    rows = [VOCAB[w] for w in query_words if w in VOCAB]
+    if rows:
+        cols = np.concatenate([W_INDICES[W_INDPTR[r]:W_INDPTR[r + 1]] for r in rows])
+        vals = np.concatenate([W_DATA[W_INDPTR[r]:W_INDPTR[r + 1]] for r in rows])
+        scores += np.bincount(cols, weights=vals, minlength=len(DATA))
+
+    # component name appears verbatim in the query (each name counts once)
+    named = set()
+    for length, names in NAMES_BY_LEN.items():
+        for start in range(len(query_lower) - length + 1):
+            named.update(names.get(query_lower[start:start + length], ()))
+    if named:
+        scores[list(named)] += NAME_IN_QUERY_BONUS
+
+    for pattern, bonus in PATTERN_BONUS.items():
+        if pattern in query_lower:
+            scores += bonus
+
+    return scores
+
+def score_variants(query: str) -> np.ndarray:
+    """Relevance of every variant of the catalog to *query* (see V_OFFSETS)."""
+    n_variants = int(V_OFFSETS[-1])
+    rows = [V_VOCAB[t] for t in query_tokens(query) if t in V_VOCAB]
+    if not rows:
+        return np.zeros(n_variants)
+    cols = np.concatenate([V_INDICES[V_INDPTR[r]:V_INDPTR[r + 1]] for r in rows])
+    vals = np.concatenate([V_DATA[V_INDPTR[r]:V_INDPTR[r + 1]] for r in rows])
+    return np.bincount(cols, weights=vals, minlength=n_variants)
+
+def best_variants(query: str, components: List[str]) -> List[int]:
+    """
+    Index of the best-matching variant of each component for *query*;
+    0 (the catalog's default) when nothing in the query tells them apart.
+    """
+    scores = score_variants(query)
+    picks  = []
+    for name in components:
+        idx = COMPONENT_INDEX[name]
+        start, end = int(V_OFFSETS[idx]), int(V_OFFSETS[idx + 1])
+        picks.append(int(np.argmax(scores[start:end])) if end > start else 0)
+    return picks
+
+def _ranked(scores: np.ndarray, floor: float = 0.0) -> List[Tuple[str, float]]:
+    order = np.argsort(-scores, kind="stable")
+    return [(COMPONENT_NAMES[i], float(scores[i])) for i in order if scores[i] > floor]
+
+def _load_semantic_index():
+    from .semantic import get_index
+    index = get_index(DATA)
+    if index is None:                               # said once: the Lazy keeps the None
+        log.warning("RETRIEVER_MODE=%s needs sentence-transformers and faiss-cpu; using keyword scoring", RETRIEVER_MODE)
+    return index
+
+# Loading the embedding model takes seconds: built by the warm-up, and only when it is used.
+SEMANTIC_INDEX = Lazy("semantic_index", _load_semantic_index,
+                      warm=lambda: RETRIEVER_MODE in ("semantic", "hybrid"))
+
+def _semantic_scores(query: str):
+    index = SEMANTIC_INDEX.get()
+    if index is None:
+        return None
+    return index.score_all(query)
+
+def rank_components(query: str, mode: str = RETRIEVER_MODE) -> List[Tuple[str, float]]:
+    """All relevant components, best first (ties keep catalog order)."""
+    if mode in ("semantic", "hybrid"):
+        vector = _semantic_scores(query)
+        if vector is not None:
+            if mode == "semantic":
+                return _ranked(vector, SEMANTIC_MIN_SCORE)
+            keyword = score_all(query)
+            if keyword.max() > 0:
+                keyword = keyword / keyword.max()
+            vector = np.where(vector >= SEMANTIC_MIN_SCORE, vector, 0.0)
+            return _ranked(HYBRID_ALPHA * vector + (1.0 - HYBRID_ALPHA) * keyword)
+    return _ranked(score_all(query))
+
 def top_components(query: str, k: int = 3) -> List[str]:
     """Return top k component names ranked by relevance to query."""
     
-    print(f"🔍 Processing query: '{query}'")
+    log.debug("Processing query: %r", query)
     
     if not query.strip():
         # Return first k components as fallback
         fallback = [comp["component"] for comp in DATA[:k]]
-        print(f"📦 Empty query, returning: {fallback}")
+        log.debug("Empty query, returning: %s", fallback)
         return fallback
     
-    # Score all components
-    scored_components = []
-    for component in DATA:
-        score = score_component_relevance(component, query)
-        if score > 0:
-            scored_components.append((component["component"], score))
-    
-    # Sort by score descending
-    scored_components.sort(key=lambda x: x[1], reverse=True)
+    # Score all components, sorted by score descending
+    scored_components = rank_components(query)
     
     # Get top k component names
     result = [comp_name for comp_name, score in scored_components[:k]]
@@ -110,8 +324,8 @@ def top_components(query: str, k: int = 3) -> List[str]:
     final_result = result[:k]
     
     # Debug output
-    print(f"📦 Selected components: {final_result}")
-    if scored_components:
-        print(f"Top scored components: {[(name, f'{score:.1f}') for name, score in scored_components[:5]]}")
+    log.debug("Selected components: %s", final_result)
+    if scored_components and log.isEnabledFor(logging.DEBUG):
+        log.debug("Top scored components: %s", [(name, f"{score:.1f}") for name, score in scored_components[:5]])
     
     return final_result
\ No newline at end of file
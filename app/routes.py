@@ -1,18 +1,40 @@
 # app/routes.py
+import asyncio
+import base64
+import binascii
+import json
 import os
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
-from .assembler import build_snippet, check_ai_setup   # <-- still valid
+from .assembler import (
+    BATCH_CONCURRENCY, SnippetResult, batch_key, check_ai_setup, resolve_many_async, resolve_snippet_async,
+    stream_snippet_async,
+)
+from .http_cache import (
+    CATALOG_CACHE_CONTROL, PATTERNS_CACHE_CONTROL, SUGGEST_CACHE_CONTROL, BodyCache, VersionedBody,
+    prepared_response,
+)
+
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "100"))
+PATTERNS_PAGE_MAX = int(os.getenv("PATTERNS_PAGE_MAX", "1000"))
 
 router = APIRouter()
 
+# Prepared (serialised + compressed) bodies of responses served from a cache
+SUGGESTION_BODIES = BodyCache()
+PATTERN_PAGES     = BodyCache(max_entries=256)
+COMPONENTS_BODY   = VersionedBody()
+CACHE_SERVED      = {"exact", "normalized", "similar"}
+
 # ─────────── request / response models ───────────
 class SuggestionRequest(BaseModel):
     query: str
     use_ai: Optional[bool] = True          # client can force regex path
+    latency_budget_ms: Optional[int] = Field(None, ge=0)   # AI merge time before the regex merge answers (floored)
 
 class SuggestionResponse(BaseModel):
     success: bool
@@ -21,32 +43,57 @@ class SuggestionResponse(BaseModel):
     ai_powered: bool
     query: str
     export_name: str
+    cache_tier: str                        # exact | normalized | similar | combo | coalesced | miss
+    provisional: bool = False              # regex merge; an AI merge will replace it (AI_UPGRADE)
+
+class BatchSuggestionRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1)
+    use_ai: Optional[bool] = True
+    concurrency: Optional[int] = None      # capped at BATCH_CONCURRENCY
+
+def _suggestion_response(query: str, result: SnippetResult, use_ai: Optional[bool]) -> SuggestionResponse:
+    if result.provisional:
+        ai_powered = False
+    elif result.merged_by is not None:     # merged for this request: we know which path answered
+        ai_powered = result.merged_by == "ai"
+    else:
+        has_key   = bool(os.getenv("OPENAI_API_KEY"))
+        ai_global = os.getenv("USE_AI_MERGING", "true").lower() == "true"
+        ai_powered = has_key and ai_global and use_ai
+
+    export_name = (
+        "".join(word.title() for word in query.split()) or "Generated"
+    )
+
+    return SuggestionResponse(
+        success=True,
+        snippet=result.code,
+        components_used=result.components,
+        ai_powered=ai_powered,
+        query=query,
+        export_name=export_name,
+        cache_tier=result.cache_tier,
+        provisional=result.provisional,
+    )
 
 # ─────────── routes ───────────
 @router.post("/suggest", response_model=SuggestionResponse)
-async def get_component_suggestions(req: SuggestionRequest):
+async def get_component_suggestions(req: SuggestionRequest, request: Request):
     """
     Generate a React component based on the user's query.
     """
     try:
-        snippet, used_components = build_snippet(req.query)
-
-        has_key   = bool(os.getenv("OPENAI_API_KEY"))
-        ai_global = os.getenv("USE_AI_MERGING", "true").lower() == "true"
-        ai_powered = has_key and ai_global and req.use_ai
-
-        export_name = (
-            "".join(word.title() for word in req.query.split()) or "Generated"
-        )
-
-        return SuggestionResponse(
-            success=True,
-            snippet=snippet,
-            components_used=used_components,
-            ai_powered=ai_powered,
-            query=req.query,
-            export_name=export_name,
+        budget = req.latency_budget_ms / 1000 if req.latency_budget_ms is not None else None
+        result = await resolve_snippet_async(req.query, req.use_ai, budget)
+        if result.cache_tier not in CACHE_SERVED:
+            return _suggestion_response(req.query, result, req.use_ai)
+        # A cache hit: reuse the body prepared for the same query and snippet
+        key  = (req.query, req.use_ai, check_ai_setup(), result.cache_tier,
+                tuple(result.components), result.code)
+        body = SUGGESTION_BODIES.get_or_prepare(
+            key, lambda: _suggestion_response(req.query, result, req.use_ai).model_dump_json().encode("utf-8"),
         )
+        return prepared_response(request, body, SUGGEST_CACHE_CONTROL, conditional=False)
 
     except Exception as e:
         raise HTTPException(
@@ -58,35 +105,134 @@ async def get_component_suggestions(req: SuggestionRequest):
             },
         )
 
+@router.post("/suggest/batch")
+async def get_batch_suggestions(req: BatchSuggestionRequest):
+    """
+    Suggestions for many queries at once, streamed back as NDJSON – one
+    line per input query, in completion order, each tagged with its index.
+    """
+    if len(req.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=413,
+            detail={"error": f"At most {BATCH_MAX_QUERIES} queries per batch."},
+        )
+
+    positions = {}
+    for i, q in enumerate(req.queries):
+        positions.setdefault(batch_key(q), []).append(i)
+    concurrency = min(req.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+
+    async def lines():
+        async for query, result in resolve_many_async(req.queries, concurrency, req.use_ai):
+            if isinstance(result, Exception):
+                body = {"success": False, "query": query, "error": str(result)}
+            else:
+                body = _suggestion_response(query, result, req.use_ai).model_dump()
+            for index in positions[batch_key(query)]:
+                yield json.dumps({"index": index, **body}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.post("/suggest/stream")
+async def stream_component_suggestion(req: SuggestionRequest):
+    """
+    Streaming /suggest: NDJSON events – ``components`` first, then ``delta``
+    chunks of TSX as the LLM produces them, then ``final`` with the validated
+    snippet (``fallback: true`` means the streamed text was discarded in
+    favour of the regex merge).
+    """
+    export_name = "".join(word.title() for word in req.query.split()) or "Generated"
+
+    async def lines():
+        try:
+            async for event in stream_snippet_async(req.query, req.use_ai):
+                if event["event"] == "final":
+                    event.update(
+                        query=req.query,
+                        export_name=export_name,
+                        ai_powered=check_ai_setup() and bool(req.use_ai) and not event["fallback"],
+                    )
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({"event": "error", "error": str(e), "query": req.query}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _encode_cursor(key: str) -> str:
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail={"error": "Invalid cursor."})
+
 @router.get("/patterns")
-async def get_cached_patterns():
+async def get_cached_patterns(
+    request: Request,
+    limit: int = Query(100, ge=1, le=PATTERNS_PAGE_MAX),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    prefix: str = Query("", description="queries starting with this text"),
+    q: str = Query("", description="queries containing this text"),
+    component: Optional[str] = Query(None, description="queries whose snippet uses this component"),
+):
     """
-    Return all queries already saved in the CSV cache.
+    Page through the queries saved in the pattern cache, in alphabetical
+    order.  Pass ``next_cursor`` back as ``cursor`` for the next page; it
+    is null on the last one.  ``count`` is the number of matching queries
+    over all pages, not the size of this one.
     """
-    from .assembler import _load_cache      # local import avoids circular refs
-    patterns = list(_load_cache().keys())
-    return {"success": True, "patterns": patterns, "count": len(patterns)}
+    from .assembler import PATTERN_CACHE   # local import avoids circular refs
+
+    after = _decode_cursor(cursor) if cursor else ""
+    prefix, q = prefix.strip().lower(), q.strip().lower()
+
+    def render() -> bytes:
+        patterns, last = PATTERN_CACHE.search(limit, after, prefix, q, component)
+        return json.dumps({
+            "success": True,
+            "patterns": patterns,
+            "count": PATTERN_CACHE.search_count(prefix, q, component),
+            "next_cursor": _encode_cursor(last) if last is not None else None,
+        }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def page():
+        key = (PATTERN_CACHE.stamp(), limit, after, prefix, q, component)
+        return PATTERN_PAGES.get_or_prepare(key, render)
+
+    # A stale index is rebuilt from the backend: keep that off the event loop
+    body = await asyncio.to_thread(page)
+    return prepared_response(request, body, PATTERNS_CACHE_CONTROL)
 
 @router.get("/components")
-async def get_available_components():
+async def get_available_components(request: Request):
     """
     List every component in components.json with variant counts.
     """
-    from .assembler import NAME2COMP
-    components = [
-        {"name": n, "variants_count": len(c.get("variants", []))}
-        for n, c in NAME2COMP.items()
-    ]
-    return {"success": True, "components": components, "count": len(components)}
+    from .catalog import CATALOG_HASH, NAME2COMP
+
+    def render() -> bytes:
+        components = [
+            {"name": n, "variants_count": len(c.get("variants", []))}
+            for n, c in NAME2COMP.items()
+        ]
+        return json.dumps({"success": True, "components": components, "count": len(components)},
+                          ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    body = COMPONENTS_BODY.get(CATALOG_HASH, render)
+    return prepared_response(request, body, CATALOG_CACHE_CONTROL)
 
 @router.get("/status")
 async def get_system_status():
     """
-    Health + AI setup info.
+    Health + AI setup info, with the AI/regex merge routing stats.
     """
+    from .merge_router import route_status
+
     return {
         "success": True,
         "ai_setup": check_ai_setup(),
+        "merge_routing": route_status(),
         "environment": {
             "has_openai_key": bool(os.getenv("OPENAI_API_KEY")),
             "ai_enabled": os.getenv("USE_AI_MERGING", "true").lower() == "true",
@@ -98,10 +244,10 @@ async def get_system_status():
 @router.post("/test")
 async def test_component_generation():
     test_query = "login form"
-    snippet, comps = build_snippet(test_query)
+    result = await resolve_snippet_async(test_query)
     return {
         "success": True,
         "test_query": test_query,
-        "snippet": snippet,
-        "components_used": comps,
+        "snippet": result.code,
+        "components_used": result.components,
     }
@@ -0,0 +1,126 @@
+"""
+Embedding-based component retrieval (sentence-transformers + FAISS).
+
+Every component contributes one document (name, description, tags) and one
+per variant (name + description).  Documents are embedded once and stored
+in a FAISS inner-product index next to ``data/components.json``; the index
+is rebuilt only when the catalog (or the embedding model) changes.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import faiss  # type: ignore
+    from sentence_transformers import SentenceTransformer  # type: ignore
+except ImportError:                                  # optional dependencies
+    faiss = None
+    SentenceTransformer = None
+
+DATA_DIR    = pathlib.Path(__file__).resolve().parents[1] / "data"
+INDEX_PATH  = DATA_DIR / "components.faiss"
+META_PATH   = DATA_DIR / "components.faiss.json"
+MODEL_NAME  = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+
+def available() -> bool:
+    """True when both optional dependencies are importable."""
+    return faiss is not None and SentenceTransformer is not None
+
+
+def catalog_hash(data: List[dict], model_name: str = MODEL_NAME) -> str:
+    """Fingerprint of everything that ends up in the index."""
+    h = hashlib.sha256(model_name.encode("utf-8"))
+    h.update(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+def component_documents(data: List[dict]) -> List[Tuple[int, str]]:
+    """(component index, text) pairs that get embedded."""
+    docs = []
+    for idx, comp in enumerate(data):
+        docs.append((idx, ". ".join(filter(None, [
+            comp["component"],
+            comp.get("description", ""),
+            ", ".join(comp.get("tags", [])),
+        ]))))
+        for variant in comp.get("variants", []):
+            text = ". ".join(filter(None, [variant.get("name", ""), variant.get("description", "")]))
+            if text:
+                docs.append((idx, f"{comp['component']}: {text}"))
+    return docs
+
+
+class SemanticIndex:
+    """FAISS index over the catalog documents, loaded from disk when current."""
+
+    def __init__(self, data: List[dict], model_name: str = MODEL_NAME,
+                 index_path: pathlib.Path = INDEX_PATH, meta_path: pathlib.Path = META_PATH):
+        if not available():
+            raise RuntimeError("sentence-transformers and faiss-cpu are required for semantic retrieval")
+        self.data       = data
+        self.model      = SentenceTransformer(model_name)
+        self.index_path = index_path
+        self.meta_path  = meta_path
+        self.hash       = catalog_hash(data, model_name)
+        self.doc_owner: np.ndarray
+        self.index = self._load() or self._build()
+
+    def _load(self):
+        if not (self.index_path.exists() and self.meta_path.exists()):
+            return None
+        meta = json.loads(self.meta_path.read_text("utf-8"))
+        if meta.get("catalog_hash") != self.hash:
+            return None
+        self.doc_owner = np.asarray(meta["doc_owner"], dtype=np.int64)
+        return faiss.read_index(str(self.index_path))
+
+    def _build(self):
+        docs = component_documents(self.data)
+        vectors = self._embed([text for _, text in docs])
+        index = faiss.IndexFlatIP(vectors.shape[1])
+        index.add(vectors)
+        self.doc_owner = np.asarray([idx for idx, _ in docs], dtype=np.int64)
+
+        faiss.write_index(index, str(self.index_path))
+        self.meta_path.write_text(json.dumps({
+            "catalog_hash": self.hash,
+            "doc_owner": self.doc_owner.tolist(),
+        }), "utf-8")
+        return index
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def score_all(self, query: str, depth: int = 64) -> np.ndarray:
+        """Cosine similarity of *query* to every component (best matching document)."""
+        scores = np.zeros(len(self.data))
+        depth = min(depth, self.index.ntotal)
+        if depth == 0 or not query.strip():
+            return scores
+        sims, docs = self.index.search(self._embed([query]), depth)
+        for sim, doc in zip(sims[0], docs[0]):
+            if doc < 0:
+                continue
+            owner = self.doc_owner[doc]
+            scores[owner] = max(scores[owner], float(sim))
+        return scores
+
+
+_INDEXES: Dict[int, SemanticIndex] = {}
+_LOCK = threading.Lock()
+
+def get_index(data: List[dict]) -> Optional[SemanticIndex]:
+    """Shared index for *data*, or None when the optional dependencies are missing."""
+    if not available():
+        return None
+    with _LOCK:
+        if id(data) not in _INDEXES:
+            _INDEXES[id(data)] = SemanticIndex(data)
+        return _INDEXES[id(data)]
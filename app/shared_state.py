@@ -0,0 +1,167 @@
+"""
+State shared by every worker on a host when ``SHARED_STATE=true``.
+
+* Numeric indexes (the retrieval weight matrix and bonus vectors) are
+  written once to ``SHARED_STATE_DIR`` as ``.npy`` files and memory-mapped
+  read-only by each worker, so their pages live once in the page cache
+  instead of once per process.
+* A :class:`Generation` counter – eight bytes in a memory-mapped file – is
+  bumped by every pattern-cache write.  Workers compare it on each lookup
+  (a memory read, no syscall) instead of polling file stamps, and when it
+  moved read the keys written since from its change log, so they catch up
+  key by key rather than reloading everything.
+
+Python objects themselves (the parsed catalog, LRU entries) cannot be
+shared between interpreter processes; they stay per worker.
+"""
+import json
+import mmap
+import os
+import pathlib
+import struct
+import tempfile
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+
+try:
+    import fcntl                                    # POSIX only
+except ImportError:                                 # pragma: no cover
+    fcntl = None
+
+SHARED_STATE = os.getenv("SHARED_STATE", "false").lower() == "true"
+
+def _default_dir() -> pathlib.Path:
+    base = pathlib.Path("/dev/shm") if pathlib.Path("/dev/shm").is_dir() else pathlib.Path(tempfile.gettempdir())
+    return base / "vpds-rec"
+
+SHARED_STATE_DIR = pathlib.Path(os.getenv("SHARED_STATE_DIR", _default_dir()))
+CHANGE_LOG_MAX_BYTES = 1 << 20                      # the change log starts over beyond this
+
+
+@contextmanager
+def _locked(path: pathlib.Path) -> Iterator[None]:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def shared_arrays(name: str, key: str, build: Callable[[], Dict[str, "np.ndarray"]],
+                  directory: pathlib.Path = SHARED_STATE_DIR) -> Dict[str, "np.ndarray"]:
+    """
+    Read-only memory maps of the arrays ``build()`` returns, stored under
+    ``<directory>/<name>-<key>/``.  The first worker to get here builds and
+    writes them; the rest (and later restarts) only map the files.
+    """
+    import numpy as np                              # only the retriever needs it
+
+    target = directory / f"{name}-{key}"
+    done   = target / ".complete"
+    with _locked(directory / f"{name}-{key}.lock"):
+        if not done.exists():
+            target.mkdir(parents=True, exist_ok=True)
+            for field, array in build().items():
+                np.save(target / f"{field}.npy", np.ascontiguousarray(array))
+            done.touch()
+    return {
+        path.stem: np.load(path, mmap_mode="r")
+        for path in sorted(target.glob("*.npy"))
+    }
+
+
+class Generation:
+    """
+    Cross-process change counter backed by an 8-byte memory-mapped file,
+    with a change log (``<name>.changes``, one JSON line per bump) saying
+    which keys each bump was for.
+    """
+
+    _FMT = "<Q"
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self._lock_path = path.with_name(path.name + ".lock")
+        self._log_path  = path.with_name(path.name + ".changes")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with _locked(self._lock_path):
+            if not path.exists() or path.stat().st_size < 8:
+                path.write_bytes(struct.pack(self._FMT, 0))
+        self._fh = open(path, "r+b")
+        self._mm = mmap.mmap(self._fh.fileno(), 8)
+        self._read = (0, 0, 0)                      # (generation, log offset, log inode) read up to
+
+    def value(self) -> int:
+        return struct.unpack_from(self._FMT, self._mm, 0)[0]
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Hold the writer lock, e.g. across check → write → bump."""
+        with _locked(self._lock_path):
+            yield
+
+    def bump(self, keys: Optional[Iterable[str]] = None) -> int:
+        """
+        Increment (callers hold :meth:`locked`) and return the new value.
+        *keys* are what changed; None means anything may have.
+        """
+        value = self.value() + 1
+        if self._log_path.exists() and self._log_path.stat().st_size > CHANGE_LOG_MAX_BYTES:
+            self._trim_log()
+        with self._log_path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps({"gen": value, "keys": None if keys is None else list(keys)}) + "\n")
+        struct.pack_into(self._FMT, self._mm, 0, value)   # logged before it is visible
+        return value
+
+    def _trim_log(self) -> None:
+        """Keep the newer half of the change log (callers hold :meth:`locked`)."""
+        lines = self._log_path.read_bytes().splitlines(keepends=True)
+        tmp = self._log_path.with_name(self._log_path.name + ".tmp")
+        tmp.write_bytes(b"".join(lines[len(lines) // 2:]))
+        os.replace(tmp, self._log_path)
+
+    def changes(self, since: int, until: int) -> Optional[List[str]]:
+        """
+        Keys written by the bumps after *since* up to *until*, or None when
+        the log cannot tell (a bump without keys, or one trimmed away).
+        """
+        keys: List[str] = []
+        expected = since + 1
+        try:
+            with self._log_path.open("rb") as f:
+                inode = os.fstat(f.fileno()).st_ino
+                start, offset, read_inode = self._read
+                if read_inode != inode or start > since:
+                    start, offset = 0, 0            # trimmed since, or asked about older bumps
+                f.seek(offset)
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break
+                    offset += len(raw)
+                    record = json.loads(raw)
+                    if record["gen"] <= since:
+                        continue
+                    if record["gen"] != expected or record["keys"] is None:
+                        break
+                    keys.extend(record["keys"])
+                    start, expected = record["gen"], expected + 1
+                    if record["gen"] == until:
+                        break
+        except (OSError, ValueError, KeyError):
+            expected = None
+        if expected != until + 1:
+            self._read = (0, 0, 0)
+            return None
+        self._read = (start, offset, inode)
+        return keys
+
+
+def generation(name: str, directory: pathlib.Path = SHARED_STATE_DIR) -> Generation:
+    return Generation(directory / f"{name}.generation")
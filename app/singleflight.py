@@ -0,0 +1,49 @@
+"""
+In-flight request coalescing ("single flight").
+
+The first caller for a key runs the work; callers that arrive while it is
+still running await the same future instead of repeating it.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """Deduplicate concurrent async calls that share a key."""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run ``fn()`` once per concurrent burst of *key*.
+        Returns ``(result, shared)`` where *shared* is True for the followers.
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise                   # we were cancelled ourselves
+                return await self.do(key, fn)   # the leader was; take over
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()          # followers re-raise it; don't warn if there are none
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self._inflight.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._inflight)
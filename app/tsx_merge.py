@@ -0,0 +1,581 @@
+"""
+Structure-aware merging of the TSX snippets in components.json.
+
+A small scanner walks the TSX subset the catalog uses – imports, type and
+const declarations, an exported arrow-function component, strings,
+template literals, comments, and JSX with nested expression containers –
+keeping brackets and tags balanced.  The merger then combines imports per
+module at the specifier level, renames colliding declarations, and emits
+one default-exported component around the chosen layout.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+
+class TSXParseError(ValueError):
+    """The snippet uses syntax outside the supported TSX subset."""
+
+
+class Token(NamedTuple):
+    kind: str           # ident | punct
+    text: str
+    start: int
+    end: int
+    depth: int          # open brackets around the token
+    role: str = ""      # idents: ref | key | shorthand | member | tag
+
+
+IDENT_RE    = re.compile(r"[A-Za-z_$][\w$]*")
+NUMBER_RE   = re.compile(r"\.?\d[\w.]*")
+JSX_NAME_RE = re.compile(r"[A-Za-z_$][\w$.:-]*")
+ATTR_RE     = re.compile(r"[A-Za-z_$][\w$:.-]*")
+GENERIC_RE  = re.compile(r"<\s*[A-Za-z_$][\w$]*\s*(?:,|extends\b)")
+
+PUNCTUATORS = sorted([
+    "===", "!==", "...", "**=", "<<=", ">>=", ">>>", "&&=", "||=", "??=",
+    "=>", "==", "!=", "<=", ">=", "&&", "||", "??", "?.", "++", "--",
+    "+=", "-=", "*=", "/=", "%=", "&=", "|=", "^=", "**", "<<", ">>",
+], key=len, reverse=True)
+
+# Tokens after which `<` opens JSX and `/` opens a regex literal
+EXPR_START = {
+    None, "(", "[", "{", ",", ";", "=", ":", "?", "=>", "&&", "||", "??", "!",
+    "+", "-", "*", "%", "==", "===", "!=", "!==", "...", "return", "typeof",
+    "case", "default", "else", "yield", "await", "in", "of", "${",
+}
+# Tokens after which `{` opens a block rather than an object literal
+BLOCK_BEFORE = {None, ")", "=>", "else", "try", "finally", "do", ";", "}"}
+
+CLOSERS = {"(": ")", "[": "]", "{": "}"}
+DECL_KEYWORDS = {"const", "let", "var", "function"}
+
+
+class _Scanner:
+    """Single pass over a snippet collecting tokens, bracket pairs and statement starts."""
+
+    def __init__(self, src: str):
+        self.src    = src
+        self.n      = len(src)
+        self.tokens: List[Token] = []
+        self.pairs:  Dict[int, int] = {}        # open bracket offset -> close offset
+        self.starts: List[int] = [0]            # top-level lines that start a statement
+        self.stack:  List[str] = []             # ( [ { b{ (block)  j{ (jsx)  ${
+        self.prev:   Optional[str] = None
+
+    def fail(self, msg: str, pos: int):
+        raise TSXParseError(f"{msg} at offset {pos}")
+
+    def _emit(self, kind: str, start: int, end: int, role: str = "") -> None:
+        text = self.src[start:end]
+        self.tokens.append(Token(kind, text, start, end, len(self.stack), role))
+        self.prev = text
+
+    def _skip_ws(self, i: int) -> int:
+        while i < self.n and self.src[i] in " \t\r\n":
+            i += 1
+        return i
+
+    def _string_end(self, i: int) -> int:
+        quote, j = self.src[i], i + 1
+        while j < self.n:
+            c = self.src[j]
+            if c == "\\":
+                j += 2
+                continue
+            if c == quote:
+                return j + 1
+            if c == "\n":
+                break
+            j += 1
+        self.fail("unterminated string", i)
+
+    def _regex_end(self, i: int) -> int:
+        j, in_class = i + 1, False
+        while j < self.n:
+            c = self.src[j]
+            if c == "\\":
+                j += 2
+                continue
+            if c == "[":
+                in_class = True
+            elif c == "]":
+                in_class = False
+            elif c == "/" and not in_class:
+                m = IDENT_RE.match(self.src, j + 1)
+                return m.end() if m else j + 1
+            elif c == "\n":
+                break
+            j += 1
+        self.fail("unterminated regex", i)
+
+    def _template(self, i: int) -> int:
+        j = i + 1
+        while j < self.n:
+            c = self.src[j]
+            if c == "\\":
+                j += 2
+                continue
+            if c == "`":
+                self.prev = "`"
+                return j + 1
+            if self.src.startswith("${", j):
+                self.stack.append("${")
+                self.prev = "${"
+                j = self.scan_js(j + 2, "}")
+                self.stack.pop()
+                continue
+            j += 1
+        self.fail("unterminated template literal", i)
+
+    def _ident_role(self, end: int) -> str:
+        if self.prev in (".", "?."):
+            return "member"
+        if self.stack and self.stack[-1] == "{" and self.prev in ("{", ","):
+            nxt = self._skip_ws(end)
+            c = self.src[nxt] if nxt < self.n else ""
+            if c == ":":
+                return "key"
+            if c in ",}=":
+                return "shorthand"
+        return "ref"
+
+    def _jsx_starts(self, i: int) -> bool:
+        if self.prev not in EXPR_START:
+            return False
+        nxt = self.src[i + 1:i + 2]
+        if not (nxt == ">" or nxt.isalpha() or nxt in "_$"):
+            return False
+        return not GENERIC_RE.match(self.src, i)
+
+    # ---- JS / TS ----
+    def scan_js(self, i: int, closer: Optional[str]) -> int:
+        """Scan until the bracket matching *closer*; return the offset just after it."""
+        src = self.src
+        while i < self.n:
+            c = src[i]
+            if c in " \t\r":
+                i += 1
+            elif c == "\n":
+                i += 1
+                if not self.stack and i < self.n and src[i] not in " \t\r\n)]}":
+                    self.starts.append(i)
+            elif src.startswith("//", i):
+                j = src.find("\n", i)
+                i = self.n if j < 0 else j
+            elif src.startswith("/*", i):
+                j = src.find("*/", i + 2)
+                if j < 0:
+                    self.fail("unterminated comment", i)
+                i = j + 2
+            elif c in "'\"":
+                i = self._string_end(i)
+                self.prev = "'"
+            elif c == "`":
+                i = self._template(i)
+            elif c.isdigit() or (c == "." and src[i + 1:i + 2].isdigit()):
+                i = NUMBER_RE.match(src, i).end()
+                self.prev = "0"
+            elif c.isalpha() or c in "_$":
+                end = IDENT_RE.match(src, i).end()
+                self._emit("ident", i, end, self._ident_role(end))
+                i = end
+            elif c in "([{":
+                kind = c
+                if c == "{" and self.prev in BLOCK_BEFORE:
+                    kind = "b{"
+                self._emit("punct", i, i + 1)
+                self.stack.append(kind)
+                j = self.scan_js(i + 1, CLOSERS[c])
+                self.stack.pop()
+                self.pairs[i] = j - 1
+                self._emit("punct", j - 1, j)
+                i = j
+            elif c in ")]}":
+                if c == closer:
+                    return i + 1
+                self.fail(f"unbalanced '{c}'", i)
+            elif c == "<" and self._jsx_starts(i):
+                i = self.scan_jsx(i)
+                self.prev = "<jsx>"
+            elif c == "/" and self.prev in EXPR_START:
+                i = self._regex_end(i)
+                self.prev = "/re/"
+            else:
+                op = next((p for p in PUNCTUATORS if src.startswith(p, i)), c)
+                self._emit("punct", i, i + len(op))
+                i += len(op)
+        if closer is not None:
+            self.fail(f"missing '{closer}'", i)
+        return i
+
+    # ---- JSX ----
+    def _jsx_expression(self, i: int) -> int:
+        self.stack.append("j{")
+        self.prev = "{"
+        j = self.scan_js(i + 1, "}")
+        self.stack.pop()
+        self.pairs[i] = j - 1
+        return j
+
+    def scan_jsx(self, i: int) -> int:
+        """Scan one JSX element (or fragment) starting at '<'; return the offset after it."""
+        src = self.src
+        j = self._skip_ws(i + 1)
+        if src.startswith(">", j):
+            return self._jsx_children(j + 1, "")
+        m = JSX_NAME_RE.match(src, j)
+        if not m:
+            self.fail("bad JSX tag", j)
+        name = m.group()
+        head = IDENT_RE.match(name).group()
+        if head[0].isupper():
+            self.tokens.append(Token("ident", head, j, j + len(head), len(self.stack), "tag"))
+        j = m.end()
+        while True:
+            j = self._skip_ws(j)
+            if j >= self.n:
+                self.fail(f"unclosed <{name}>", i)
+            if src.startswith("/>", j):
+                return j + 2
+            if src[j] == ">":
+                return self._jsx_children(j + 1, name)
+            if src[j] == "{":
+                j = self._jsx_expression(j)
+                continue
+            m = ATTR_RE.match(src, j)
+            if not m:
+                self.fail("bad JSX attribute", j)
+            j = self._skip_ws(m.end())
+            if src.startswith("=", j):
+                j = self._skip_ws(j + 1)
+                if src[j] in "'\"":
+                    k = src.find(src[j], j + 1)
+                    if k < 0:
+                        self.fail("unterminated attribute", j)
+                    j = k + 1
+                elif src[j] == "{":
+                    j = self._jsx_expression(j)
+                elif src[j] == "<":
+                    j = self.scan_jsx(j)
+                else:
+                    self.fail("bad attribute value", j)
+
+    def _jsx_children(self, j: int, name: str) -> int:
+        src = self.src
+        while j < self.n:
+            if src.startswith("</", j):
+                k = src.find(">", j)
+                if k < 0 or src[j + 2:k].strip() != name:
+                    self.fail(f"mismatched closing tag for <{name}>", j)
+                return k + 1
+            c = src[j]
+            if c == "{":
+                j = self._jsx_expression(j)
+            elif c == "<":
+                j = self.scan_jsx(j)
+            else:
+                j += 1
+        self.fail(f"unclosed <{name}>", j)
+
+
+# ────────────────── parsed module ──────────────────
+class ImportDecl(NamedTuple):
+    module: str
+    default: Optional[str]
+    namespace: Optional[str]
+    named: Tuple[str, ...]              # specifier text, e.g. "Button", "type Item", "A as B"
+
+
+class Statement(NamedTuple):
+    kind: str                           # import | decl | type | function | other
+    start: int                          # offsets in the snippet (leading comments excluded)
+    end: int
+    names: Tuple[str, ...]              # names it declares
+    exported: bool
+
+
+class ParsedModule(NamedTuple):
+    src: str
+    tokens: Tuple[Token, ...]
+    imports: Tuple[ImportDecl, ...]
+    statements: Tuple[Statement, ...]   # top-level, minus imports and the component
+    component: str
+    body: Tuple[int, int]               # component statements before `return`
+    body_names: Tuple[str, ...]
+    jsx: Tuple[int, int]                # the returned JSX expression
+
+    @property
+    def imported_names(self) -> Set[str]:
+        names = set()
+        for imp in self.imports:
+            names.update(filter(None, (imp.default, imp.namespace)))
+            names.update(spec.split()[-1] for spec in imp.named)
+        return names
+
+
+IMPORT_RE = re.compile(
+    r"import\s+(?P<type>type\s+)?"
+    r"(?:(?P<default>[A-Za-z_$][\w$]*)\s*,?\s*)?"
+    r"(?:\*\s*as\s+(?P<ns>[A-Za-z_$][\w$]*)\s*)?"
+    r"(?:\{(?P<named>[^}]*)\}\s*)?"
+    r"from\s*(?P<q>['\"])(?P<module>[^'\"]+)(?P=q)"
+    r"|import\s*(?P<q2>['\"])(?P<bare>[^'\"]+)(?P=q2)",
+    re.DOTALL,
+)
+HEAD_RE = re.compile(
+    r"(?P<export>export\s+)?(?:default\s+)?(?P<kw>import|const|let|var|type|interface|function)\b"
+)
+TYPE_NAME_RE = re.compile(r"(?:export\s+)?(?:type|interface)\s+([A-Za-z_$][\w$]*)")
+LEADING_COMMENTS_RE = re.compile(r"(?:\s+|//[^\n]*|/\*.*?\*/)*", re.DOTALL)
+
+
+def _parse_import(text: str) -> ImportDecl:
+    m = IMPORT_RE.match(text)
+    if not m:
+        raise TSXParseError(f"unsupported import: {text.strip()[:60]}")
+    if m.group("bare"):
+        return ImportDecl(m.group("bare"), None, None, ())
+    prefix = "type " if m.group("type") else ""
+    named = tuple(
+        prefix + " ".join(spec.split())
+        for spec in (m.group("named") or "").split(",") if spec.strip()
+    )
+    return ImportDecl(m.group("module"), m.group("default"), m.group("ns"), named)
+
+
+def _declared_names(tokens: List[Token], pairs: Dict[int, int], depth: int) -> List[str]:
+    """Names bound by const/let/var/function keywords at *depth*."""
+    names = []
+    for idx, tok in enumerate(tokens):
+        if tok.kind != "ident" or tok.depth != depth or tok.text not in DECL_KEYWORDS or idx + 1 >= len(tokens):
+            continue
+        target = tokens[idx + 1]
+        if target.kind == "ident":
+            names.append(target.text)
+        elif target.text in "[{" and target.start in pairs:
+            close = pairs[target.start]
+            names.extend(
+                t.text for t in tokens[idx + 2:]
+                if t.start < close and t.kind == "ident" and t.role in ("ref", "shorthand")
+                and t.depth == depth + 1
+            )
+    return names
+
+
+@lru_cache(maxsize=4096)
+def parse_module(src: str) -> ParsedModule:
+    """Parse one catalog snippet; raises TSXParseError outside the supported subset."""
+    scanner = _Scanner(src)
+    scanner.scan_js(0, None)
+    tokens, pairs = scanner.tokens, scanner.pairs
+
+    bounds = sorted(set(scanner.starts)) + [len(src)]
+    imports: List[ImportDecl] = []
+    statements: List[Statement] = []
+    for start, end in zip(bounds, bounds[1:]):
+        start = LEADING_COMMENTS_RE.match(src, start).end()
+        if start >= end:
+            continue                                # comment-only line: belongs to the next one
+        text = src[start:end]
+        head = HEAD_RE.match(text)
+        kind = head.group("kw") if head else "other"
+        if kind == "import":
+            imports.append(_parse_import(text))
+            continue
+        stmt_tokens = [t for t in tokens if start <= t.start < end]
+        if kind in ("type", "interface"):
+            name = TYPE_NAME_RE.match(text)
+            names = (name.group(1),) if name else ()
+            kind = "type"
+        elif kind in ("const", "let", "var", "function"):
+            names = tuple(_declared_names(stmt_tokens, pairs, 0))
+            kind = "function" if kind == "function" else "decl"
+        else:
+            names = ()
+        statements.append(Statement(kind, start, end, names, bool(head and head.group("export"))))
+
+    # The component: last exported declaration with a capitalised name
+    component = next(
+        (s for s in reversed(statements)
+         if s.exported and s.kind in ("decl", "function") and s.names and s.names[0][:1].isupper()),
+        None,
+    )
+    if component is None:
+        raise TSXParseError("no exported component found")
+    comp_tokens = [t for t in tokens if component.start <= t.start < component.end]
+
+    if component.kind == "function":
+        opener = next((t for t in comp_tokens if t.text == "{" and t.depth == 0), None)
+    else:
+        arrow = next((i for i, t in enumerate(comp_tokens) if t.text == "=>" and t.depth == 0), None)
+        if arrow is None or arrow + 1 >= len(comp_tokens):
+            raise TSXParseError(f"{component.names[0]} is not an arrow function")
+        opener = comp_tokens[arrow + 1]
+        if opener.text == "(":                      # () => ( <jsx/> )
+            close = pairs[opener.start]
+            return ParsedModule(
+                src, tuple(tokens), tuple(imports),
+                tuple(s for s in statements if s is not component),
+                component.names[0], (opener.start, opener.start), (),
+                (opener.start + 1, close),
+            )
+    if opener is None or opener.text != "{":
+        raise TSXParseError(f"{component.names[0]} has no block body")
+
+    body_end = pairs[opener.start]
+    body_tokens = [t for t in comp_tokens if opener.start < t.start < body_end]
+    returns = [i for i, t in enumerate(body_tokens) if t.text == "return" and t.depth == 1]
+    if not returns:
+        raise TSXParseError(f"{component.names[0]} has no return statement")
+    ret = body_tokens[returns[-1]]
+    after = body_tokens[returns[-1] + 1] if returns[-1] + 1 < len(body_tokens) else None
+    if after is not None and after.text == "(":
+        jsx = (after.start + 1, pairs[after.start])
+    else:
+        stop = next((t.start for t in body_tokens[returns[-1] + 1:] if t.text == ";" and t.depth == 1), body_end)
+        jsx = (ret.end, stop)
+
+    body_decl_tokens = [t for t in body_tokens if t.start < ret.start]
+    return ParsedModule(
+        src=src,
+        tokens=tuple(tokens),
+        imports=tuple(imports),
+        statements=tuple(s for s in statements if s is not component),
+        component=component.names[0],
+        body=(opener.start + 1, ret.start),
+        body_names=tuple(_declared_names(body_decl_tokens, pairs, 1)),
+        jsx=jsx,
+    )
+
+
+# ────────────────── rendering ──────────────────
+def _render(mod: ParsedModule, start: int, end: int, renames: Dict[str, str]) -> str:
+    """Source text of [start, end) with *renames* applied to identifier references."""
+    if not renames:
+        return mod.src[start:end]
+    out, pos = [], start
+    for tok in mod.tokens:
+        if tok.start < start or tok.start >= end or tok.kind != "ident" or tok.text not in renames:
+            continue
+        if tok.role in ("key", "member"):
+            continue
+        new = renames[tok.text]
+        out.append(mod.src[pos:tok.start])
+        out.append(f"{tok.text}: {new}" if tok.role == "shorthand" else new)
+        pos = tok.end
+    out.append(mod.src[pos:end])
+    return "".join(out)
+
+
+def _reindent(text: str, indent: str) -> str:
+    """First line stripped; later lines moved from their common indentation to *indent*."""
+    lines = text.strip("\n").rstrip().split("\n")
+    rest = [l for l in lines[1:] if l.strip()]
+    base = min((len(l) - len(l.lstrip()) for l in rest), default=0)
+    return "\n".join([lines[0].strip()] + [indent + l[base:] if l.strip() else "" for l in lines[1:]])
+
+
+def _format_import(module: str, default: Optional[str], named: List[str]) -> str:
+    parts = [default] if default else []
+    if named:
+        parts.append("{ " + ", ".join(named) + " }")
+    line = f"import {', '.join(parts)} from '{module}';"
+    if len(line) <= 100 or not named:
+        return line
+    head = f"{default}, " if default else ""
+    return f"import {head}{{\n" + "".join(f"  {n},\n" for n in named) + f"}} from '{module}';"
+
+
+def merge_imports(modules: List[ParsedModule]) -> str:
+    """One import per module, specifiers deduplicated and sorted."""
+    order: List[str] = []
+    defaults: Dict[str, Optional[str]] = {}
+    namespaces: Dict[str, Set[str]] = {}
+    named: Dict[str, Dict[str, None]] = {}
+    for mod in modules:
+        for imp in mod.imports:
+            if imp.module not in named:
+                order.append(imp.module)
+                named[imp.module] = {}
+                defaults[imp.module] = None
+                namespaces[imp.module] = set()
+            defaults[imp.module] = defaults[imp.module] or imp.default
+            if imp.namespace:
+                namespaces[imp.module].add(imp.namespace)
+            for spec in imp.named:
+                # a value import subsumes the type-only import of the same name
+                bare = spec[5:] if spec.startswith("type ") else spec
+                if bare in named[imp.module]:
+                    continue
+                named[imp.module].pop("type " + bare, None)
+                named[imp.module][spec] = None
+
+    lines = []
+    for module in order:
+        specs = sorted(named[module], key=lambda s: s[5:] if s.startswith("type ") else s)
+        for ns in sorted(namespaces[module]):
+            lines.append(f"import * as {ns} from '{module}';")
+        if defaults[module] or specs or not namespaces[module]:
+            lines.append(_format_import(module, defaults[module], specs))
+    return "\n".join(lines)
+
+
+def merge_snippets(code_snippets: List[str], export_name: str) -> str:
+    """
+    Merge catalog snippets into one default-exported component.
+    Raises TSXParseError if any snippet cannot be parsed.
+    """
+    from .manual_merge import TEMPLATES, select_layout
+
+    modules = [parse_module(code) for code in code_snippets]
+    imported = set().union(*(m.imported_names for m in modules))
+    declared: Dict[str, Optional[str]] = {}     # name -> rendered declaration (None: body-level)
+
+    def fresh(name: str, k: int) -> str:
+        candidate, n = f"{name}{k + 1}", k + 1
+        while candidate in declared or candidate in imported:
+            n += 1
+            candidate = f"{name}{n}"
+        return candidate
+
+    top_level, bodies, components = [], [], []
+    for k, mod in enumerate(modules):
+        renames: Dict[str, str] = {}
+        for stmt in mod.statements:
+            text = _render(mod, stmt.start, stmt.end, renames).strip()
+            if stmt.exported:
+                text = re.sub(r"^export\s+", "", text)
+            if stmt.names and all(declared.get(n, "") == text for n in stmt.names):
+                continue                            # identical declaration already emitted
+            clashes = [n for n in stmt.names if n in declared or n in imported]
+            if clashes:
+                for name in clashes:
+                    renames[name] = fresh(name, k)
+                text = _render(mod, stmt.start, stmt.end, renames).strip()
+                if stmt.exported:
+                    text = re.sub(r"^export\s+", "", text)
+            for name in stmt.names:
+                declared[renames.get(name, name)] = text
+            top_level.append(text)
+
+        for name in mod.body_names:
+            if name in declared or name in imported:
+                renames[name] = fresh(name, k)
+            declared[renames.get(name, name)] = None
+
+        body = _render(mod, *mod.body, renames)
+        if body.strip():
+            bodies.append("  " + _reindent(body, "  "))
+        jsx = _render(mod, *mod.jsx, renames).strip()
+        components.append({"name": mod.component, "jsx": _reindent(jsx, " " * 8)})
+
+    main_jsx = select_layout(export_name)(components, export_name)
+
+    return TEMPLATES.get_template("merged.tsx.j2").render(
+        imports=merge_imports(modules),
+        declarations="\n\n".join(top_level),
+        export_name=export_name,
+        body="\n\n".join(bodies),
+        jsx_body=main_jsx,
+    )
@@ -0,0 +1,234 @@
+"""
+Background upgrade of regex merges to AI merges (``AI_UPGRADE=true``).
+
+A miss is answered at once with the regex merge, which is cached as
+*provisional* and queued here.  A bounded pool of workers
+(``AI_UPGRADE_WORKERS`` per process) runs the AI merge for each queued
+query and, once the reply passes validation, swaps it in for the
+provisional entry, so the next request gets it at cache-hit latency.
+
+The queue is a SQLite table (``AI_UPGRADE_QUEUE``) shared by every worker
+process and kept across restarts.  A job is leased while it runs; the job
+of a worker that died is picked up again when the lease runs out.  A
+failed merge is retried with backoff, ``AI_UPGRADE_MAX_ATTEMPTS`` times in
+all, after which the regex merge stays.  While the AI circuit breaker is
+open (see :mod:`app.merge_router`) jobs wait.
+"""
+import asyncio
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from .metrics import AI_UPGRADES
+
+log = logging.getLogger(__name__)
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+
+AI_UPGRADE              = os.getenv("AI_UPGRADE", "false").lower() == "true"
+AI_UPGRADE_QUEUE        = pathlib.Path(os.getenv("AI_UPGRADE_QUEUE", ROOT / "data" / "upgrade-queue.sqlite3"))
+AI_UPGRADE_WORKERS      = int(os.getenv("AI_UPGRADE_WORKERS", "2"))
+AI_UPGRADE_MAX_PENDING  = int(os.getenv("AI_UPGRADE_MAX_PENDING", "10000"))   # new jobs are dropped beyond
+AI_UPGRADE_MAX_ATTEMPTS = int(os.getenv("AI_UPGRADE_MAX_ATTEMPTS", "3"))
+AI_UPGRADE_RETRY_DELAY  = float(os.getenv("AI_UPGRADE_RETRY_DELAY", "60"))    # seconds, doubled per attempt
+AI_UPGRADE_LEASE        = float(os.getenv("AI_UPGRADE_LEASE", "300"))         # seconds a running job is held
+
+POLL_INTERVAL = 5.0                                 # seconds between queue checks when idle
+
+
+class Job(NamedTuple):
+    key: str                                        # pattern cache key
+    query: str
+    snippets: List[str]                             # the variant codes the regex merge used
+    export_name: str
+    attempts: int
+
+
+class UpgradeQueue:
+    """Persistent job queue; one row per cache key."""
+
+    def __init__(self, path: pathlib.Path = AI_UPGRADE_QUEUE, max_pending: int = AI_UPGRADE_MAX_PENDING):
+        self.path        = path
+        self.max_pending = max_pending
+        self._lock       = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " key TEXT PRIMARY KEY,"
+                " query TEXT NOT NULL,"
+                " snippets TEXT NOT NULL,"
+                " export_name TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " due REAL NOT NULL,"
+                " leased_until REAL NOT NULL DEFAULT 0)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (due)")
+            self._db = db
+        return self._db
+
+    def push(self, key: str, query: str, snippets: List[str], export_name: str) -> bool:
+        """Queue *key* (no-op if it already is); False when the queue is full."""
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                if db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] >= self.max_pending:
+                    return False
+                db.execute(
+                    "INSERT INTO jobs (key, query, snippets, export_name, due) VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT(key) DO NOTHING",
+                    (key, query, json.dumps(snippets), export_name, time.time()),
+                )
+                return True
+            finally:
+                db.execute("COMMIT")
+
+    def claim(self, lease: float = AI_UPGRADE_LEASE) -> Optional[Job]:
+        """Lease the job due first, or None if nothing is due."""
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT key, query, snippets, export_name, attempts FROM jobs"
+                    " WHERE due <= ? AND leased_until <= ? ORDER BY due LIMIT 1", (now, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                db.execute("UPDATE jobs SET leased_until = ? WHERE key = ?", (now + lease, row[0]))
+            finally:
+                db.execute("COMMIT")
+        return Job(row[0], row[1], json.loads(row[2]), row[3], row[4])
+
+    def done(self, key: str) -> None:
+        with self._lock:
+            self._conn().execute("DELETE FROM jobs WHERE key = ?", (key,))
+
+    def retry(self, key: str, delay: float, count_attempt: bool = True) -> None:
+        """Release *key* and make it due again in *delay* seconds."""
+        with self._lock:
+            self._conn().execute(
+                "UPDATE jobs SET attempts = attempts + ?, due = ?, leased_until = 0 WHERE key = ?",
+                (int(count_attempt), time.time() + delay, key),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+UPGRADE_QUEUE = UpgradeQueue()
+_wake: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = None
+
+
+def _get_wake() -> asyncio.Event:
+    """Set when a job is queued, to wake idle workers on this event loop."""
+    global _wake
+    loop = asyncio.get_running_loop()
+    if _wake is None or _wake[0] is not loop:
+        _wake = (loop, asyncio.Event())
+    return _wake[1]
+
+
+def wants_upgrade(use_ai: Optional[bool] = True) -> bool:
+    """Whether a miss should be answered with a provisional regex merge and upgraded later."""
+    from .ai_merge import _ai_enabled
+    return AI_UPGRADE and use_ai is not False and _ai_enabled()
+
+
+def enqueue_sync(key: str, query: str, snippets: List[str], export_name: str) -> bool:
+    """Queue an upgrade from blocking code (idle workers notice within ``POLL_INTERVAL``)."""
+    queued = UPGRADE_QUEUE.push(key, query, snippets, export_name)
+    AI_UPGRADES.inc(result="queued" if queued else "dropped")
+    if not queued:
+        log.warning("Upgrade queue is full (%d jobs); %r keeps its regex merge", UPGRADE_QUEUE.max_pending, key)
+    return queued
+
+
+async def enqueue(key: str, query: str, snippets: List[str], export_name: str) -> None:
+    if await asyncio.to_thread(enqueue_sync, key, query, snippets, export_name):
+        _get_wake().set()
+
+
+# ────────────────── workers ──────────────────
+async def upgrade(job: Job, queue: UpgradeQueue = UPGRADE_QUEUE) -> str:
+    """Run one job → upgraded | obsolete | waiting | retried | failed."""
+    from .ai_merge import _fallback_reason, ai_merge_async
+    from .assembler import PATTERN_CACHE
+    from .manual_merge import is_broken_merge
+    from .merge_router import AI_BREAKER_COOLDOWN, BREAKER, record_ai
+
+    entry = await asyncio.to_thread(PATTERN_CACHE.get, job.key)
+    if entry is None or not entry.provisional:
+        await asyncio.to_thread(queue.done, job.key)    # dropped, or rewritten since
+        return "obsolete"
+    if not BREAKER.allow():
+        await asyncio.to_thread(queue.retry, job.key, AI_BREAKER_COOLDOWN, False)
+        return "waiting"
+
+    started = time.perf_counter()
+    try:
+        code = await ai_merge_async(job.snippets, job.query, job.export_name)
+        if is_broken_merge(code):
+            raise ValueError("AI merge lost a snippet's JSX")
+    except Exception as exc:
+        reason = _fallback_reason(exc)
+        record_ai(False, time.perf_counter() - started, reason)
+        if job.attempts + 1 >= AI_UPGRADE_MAX_ATTEMPTS:
+            log.info("Giving up upgrading %r after %d attempts (%s)", job.key, job.attempts + 1, reason)
+            await asyncio.to_thread(queue.done, job.key)
+            return "failed"
+        await asyncio.to_thread(queue.retry, job.key, AI_UPGRADE_RETRY_DELAY * 2 ** job.attempts)
+        return "retried"
+    record_ai(True, time.perf_counter() - started)
+
+    replaced = await asyncio.to_thread(PATTERN_CACHE.replace_provisional, job.key, entry.code, code)
+    await asyncio.to_thread(queue.done, job.key)
+    return "upgraded" if replaced else "obsolete"
+
+
+async def _worker(queue: UpgradeQueue) -> None:
+    wake = _get_wake()
+    while True:
+        job = await asyncio.to_thread(queue.claim)
+        if job is None:
+            try:
+                await asyncio.wait_for(wake.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            continue
+        try:
+            result = await upgrade(job, queue)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back (if this is cut short too, its lease runs out instead)
+            await asyncio.to_thread(queue.retry, job.key, 0, False)
+            raise
+        except Exception as exc:                    # keep the worker alive
+            log.warning("Upgrade of %r crashed: %r", job.key, exc)
+            if job.attempts + 1 >= AI_UPGRADE_MAX_ATTEMPTS:
+                result = "failed"
+                await asyncio.to_thread(queue.done, job.key)
+            else:
+                result = "retried"
+                await asyncio.to_thread(queue.retry, job.key, AI_UPGRADE_RETRY_DELAY * 2 ** job.attempts)
+        AI_UPGRADES.inc(result=result)
+        log.debug("Upgrade of %r: %s", job.key, result)
+
+
+def start_workers(n: int = AI_UPGRADE_WORKERS, queue: UpgradeQueue = UPGRADE_QUEUE) -> List[asyncio.Task]:
+    """The worker pool, run on the current event loop until cancelled."""
+    return [asyncio.create_task(_worker(queue)) for _ in range(max(1, n))]
@@ -0,0 +1,292 @@
+"""
+Fill the pattern cache ahead of traffic, e.g. after a deploy or a cache reset.
+
+    python -m app.warmup queries traffic.jsonl [more files] [--limit 500]
+    python -m app.warmup combos [--top 12] [--sizes 2,3]
+
+``queries`` reads query lists – plain text (one query per line), JSON lines
+with a ``query`` (or ``queries``) field such as a request log, or a
+``pattern-dataset.csv`` – and resolves the most frequent queries first
+through the normal suggest pipeline, so each lands in the cache exactly as
+a live request would put it there.
+
+``combos`` merges every pair and triple of the most used components
+(default variants) offline.  A live miss whose retrieval picks one of those
+combinations is then answered from the cache (tier ``combo``) instead of
+calling the LLM.  A combination the AI merge could not do (failure, open
+circuit) is not stored – status ``fallback`` – and is tried again next run.
+
+Both run at most ``--concurrency`` merges at once and start at most
+``--rate`` per second.  Every finished item is appended to a journal
+(``--state``), so a crashed or interrupted run picks up where it stopped.
+Journal entries only count for the same cache store and catalog, and an
+item is only skipped while its key is still in the cache, so a deploy or a
+cache reset warms everything again; ``--fresh`` ignores the journal.
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import itertools
+import json
+import logging
+import os
+import pathlib
+import sys
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .assembler import (
+    COMBO_PREFIX, PATTERN_CACHE, ROOT, _append_cache, _cache_as, _export_name, combo_key, resolve_snippet_async,
+)
+from .catalog import CATALOG_HASH, COMPONENTS, NAME2COMP
+from .query_match import normalize_query
+
+log = logging.getLogger(__name__)
+
+WARMUP_STATE       = pathlib.Path(os.getenv("WARMUP_STATE", ROOT / "data" / "warmup-state.jsonl"))
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "4"))
+WARMUP_RATE        = float(os.getenv("WARMUP_RATE", "2"))     # merges started per second; 0 = unlimited
+
+
+# ────────────────── query sources ──────────────────
+def _queries_in(value) -> Iterator[str]:
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for field in ("query", "q"):
+            if isinstance(value.get(field), str):
+                yield value[field]
+        for query in value.get("queries") or []:       # /api/suggest/batch bodies
+            if isinstance(query, str):
+                yield query
+
+
+def read_queries(path: pathlib.Path) -> Iterator[str]:
+    """Every query in a text, JSON-lines or pattern-dataset CSV file, repeats included."""
+    with path.open(newline="", encoding="utf-8") as f:
+        if path.suffix == ".csv":
+            for row in csv.DictReader(f):
+                if row.get("query"):
+                    yield row["query"]
+            return
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line[0] in "{[\"":
+                try:
+                    yield from _queries_in(json.loads(line))
+                    continue
+                except json.JSONDecodeError:
+                    pass
+            yield line
+
+
+def rank_queries(paths: Iterable[pathlib.Path]) -> List[str]:
+    """Distinct queries, most frequent (by normalised form) first, first spelling wins."""
+    counts: Counter = Counter()
+    spelling: Dict[str, str] = {}
+    for path in paths:
+        for query in read_queries(path):
+            query = query.strip()
+            if not query:
+                continue
+            norm = normalize_query(query) or query.lower()
+            counts[norm] += 1
+            spelling.setdefault(norm, query)
+    return [spelling[norm] for norm, _ in counts.most_common()]
+
+
+def top_components(n: int) -> List[str]:
+    """The *n* components cached queries use most, topped up in catalog order."""
+    usage: Counter = Counter()
+    for key, entry in PATTERN_CACHE.backend.load():
+        if not key.startswith(COMBO_PREFIX):
+            usage.update(c for c in entry.components if c in NAME2COMP)
+    ranked = [name for name, _ in usage.most_common()]
+    ranked += [c["component"] for c in COMPONENTS if c["component"] not in usage]
+    return ranked[:n]
+
+
+# ────────────────── journal ──────────────────
+def journal_scope() -> str:
+    """What journal entries are valid for: this cache store with this catalog."""
+    store = str(PATTERN_CACHE.backend.path)
+    return hashlib.sha256(f"{store}\n{CATALOG_HASH}".encode("utf-8")).hexdigest()[:12]
+
+
+class Journal:
+    """
+    Append-only JSON lines of finished items; the last status of a key wins.
+    Entries written under another *scope* are ignored; *fresh* drops them all.
+    """
+
+    def __init__(self, path: pathlib.Path, scope: str = "", fresh: bool = False):
+        self.path  = path
+        self.scope = scope
+        self.done: Dict[str, str] = {}
+        if path.exists() and not fresh:
+            with path.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue                    # torn last line of a crashed run
+                    if record.get("scope", "") == scope:
+                        self.done[record["key"]] = record["status"]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = path.open("w" if fresh else "a", encoding="utf-8")
+
+    def record(self, key: str, status: str, **extra) -> None:
+        self.done[key] = status
+        self._fh.write(json.dumps({"key": key, "status": status, "scope": self.scope, "at": time.time(),
+                                   **extra}) + "\n")
+        self._fh.flush()
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class RateLimiter:
+    """Spaces starts at least ``1 / rate`` seconds apart (no limit when rate <= 0)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next    = 0.0
+        self._lock    = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+            self._next = max(now, self._next) + self.interval
+
+
+# ────────────────── runner ──────────────────
+Task = Tuple[str, Callable[[], Awaitable[str]]]     # (journal key, job returning a status)
+
+async def run_tasks(tasks: List[Task], journal: Journal, concurrency: int = WARMUP_CONCURRENCY,
+                    rate: float = WARMUP_RATE, retry_failed: bool = False) -> Counter:
+    """Run the jobs not yet in *journal* (or since dropped from the cache); returns how many ended in each status."""
+    def finished(key: str) -> bool:
+        status = journal.done.get(key)
+        if status in ("ok", "cached"):
+            return key in PATTERN_CACHE
+        return status == "failed" and not retry_failed
+
+    skipped = await asyncio.to_thread(lambda: {key for key, _ in tasks if finished(key)})
+    pending = [(key, job) for key, job in tasks if key not in skipped]
+    totals  = Counter(resumed=len(tasks) - len(pending))
+    slots   = asyncio.Semaphore(max(1, concurrency))
+    limiter = RateLimiter(rate)
+    started = time.perf_counter()
+
+    async def run(key: str, job: Callable[[], Awaitable[str]]) -> None:
+        async with slots:
+            await limiter.wait()
+            try:
+                status = await job()
+                journal.record(key, status)
+            except Exception as exc:
+                status = "failed"
+                journal.record(key, status, error=repr(exc))
+                log.warning("Warm-up of %r failed: %r", key, exc)
+        totals[status] += 1
+        done = sum(totals.values()) - totals["resumed"]
+        if done % 25 == 0 or done == len(pending):
+            log.info("%d/%d done (%.1fs)", done, len(pending), time.perf_counter() - started)
+
+    await asyncio.gather(*(run(key, job) for key, job in pending))
+    return totals
+
+
+def query_tasks(queries: List[str]) -> List[Task]:
+    def job(query: str) -> Callable[[], Awaitable[str]]:
+        async def resolve() -> str:
+            result = await resolve_snippet_async(query, budget=0)       # offline: wait for the AI merge
+            if result.cache_tier not in ("miss", "combo", "coalesced"):
+                return "cached"
+            # A merge that failed the sanity check is answered but not stored
+            return "ok" if query.strip().lower() in PATTERN_CACHE else "failed"
+        return resolve
+    return [(query.strip().lower(), job(query)) for query in queries]
+
+
+def combo_tasks(components: List[str], sizes: Iterable[int]) -> List[Task]:
+    def job(comps: Tuple[str, ...]) -> Callable[[], Awaitable[str]]:
+        async def merge() -> str:
+            key = combo_key(list(comps), [0] * len(comps))
+            if key in PATTERN_CACHE:
+                return "cached"
+            codes       = [NAME2COMP[c]["variants"][0]["code"] for c in comps]
+            query       = " and ".join(c.lower() for c in comps)
+            export_name = _export_name(query)
+            from .merge_router import route_merge_async
+            code, merged_by, reason = await route_merge_async(codes, query, export_name, budget=0)
+            if _cache_as(merged_by, reason) is not False:
+                # A regex stand-in would be copied under live queries as final; try again next run
+                return "fallback"
+            await asyncio.to_thread(_append_cache, key, list(comps), code)
+            return "ok" if key in PATTERN_CACHE else "failed"
+        return merge
+    return [
+        (combo_key(list(comps), [0] * len(comps)), job(comps))
+        for size in sizes
+        for comps in itertools.combinations(components, size)
+    ]
+
+
+# ────────────────── CLI ──────────────────
+def _int_list(text: str) -> Tuple[int, ...]:
+    return tuple(int(x) for x in text.split(",") if x)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.warmup", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    queries = sub.add_parser("queries", help="resolve queries from files (most frequent first)")
+    queries.add_argument("files", nargs="+", type=pathlib.Path)
+    queries.add_argument("--limit", type=int, default=None, help="only the N most frequent queries")
+    combos = sub.add_parser("combos", help="precompute merges of component pairs / triples")
+    combos.add_argument("--top", type=int, default=12, help="how many of the most used components")
+    combos.add_argument("--sizes", type=_int_list, default=(2, 3), help="combination sizes (default 2,3)")
+    for p in (queries, combos):
+        p.add_argument("--concurrency", type=int, default=WARMUP_CONCURRENCY)
+        p.add_argument("--rate", type=float, default=WARMUP_RATE, help="merges started per second (0 = no limit)")
+        p.add_argument("--state", type=pathlib.Path, default=WARMUP_STATE, help="resume journal")
+        p.add_argument("--retry-failed", action="store_true", help="retry items that failed last time")
+        p.add_argument("--fresh", action="store_true", help="ignore the journal and start over")
+        p.add_argument("--dry-run", action="store_true", help="list what would be warmed and exit")
+    args = parser.parse_args(argv)
+
+    if args.command == "queries":
+        ranked = rank_queries(args.files)
+        tasks  = query_tasks(ranked[:args.limit] if args.limit else ranked)
+    else:
+        tasks = combo_tasks(top_components(args.top), args.sizes)
+
+    if args.dry_run:
+        for key, _ in tasks:
+            print(key)
+        return 0
+
+    journal = Journal(args.state, journal_scope(), args.fresh)
+    try:
+        totals = asyncio.run(run_tasks(tasks, journal, args.concurrency, args.rate, args.retry_failed))
+    finally:
+        journal.close()
+    print(", ".join(f"{status}: {n}" for status, n in sorted(totals.items())) or "nothing to do")
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    sys.exit(main())
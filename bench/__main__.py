@@ -0,0 +1,104 @@
+"""
+python -m bench [micro|load|startup|all] [options]
+
+Runs the benchmarks, prints p50/p95/p99 and throughput per case, writes the
+results as JSON and compares them with the stored baseline.  Exits with
+status 1 when a case regressed beyond --threshold, or when importing the
+app took longer than --import-budget.
+"""
+import argparse
+import pathlib
+import sys
+
+from . import report
+
+
+def _int_list(text: str):
+    return tuple(int(x.replace("_", "")) for x in text.split(",") if x)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("suite", nargs="?", default="all", choices=["micro", "load", "startup", "all"])
+    parser.add_argument("--out", type=pathlib.Path, default=report.ROOT / "bench_output.json",
+                        help="where to write this run's results")
+    parser.add_argument("--baseline", type=pathlib.Path, default=report.BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store this run as the new baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=report.REGRESSION_THRESHOLD,
+                        help="allowed p50 slowdown as a fraction (default %(default)s)")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds per micro case")
+    parser.add_argument("--sizes", type=_int_list, default=None,
+                        help="cache sizes, e.g. 1000,100000,1000000")
+    parser.add_argument("--backends", default=None, help="cache backends, e.g. sqlite,csv")
+    parser.add_argument("--requests", type=int, default=None, help="load test: total requests")
+    parser.add_argument("--concurrency", type=int, default=None, help="load test: requests in flight")
+    parser.add_argument("--miss-ratio", type=float, default=None, help="load test: share of uncached queries")
+    parser.add_argument("--stub-latency", type=float, default=None, help="load test: seconds per LLM call")
+    parser.add_argument("--no-ai", action="store_true", help="load test: regex merge instead of the stub LLM")
+    parser.add_argument("--import-budget", type=float, default=None,
+                        help="startup: max seconds for `import app.main` (p50)")
+    args = parser.parse_args(argv)
+
+    results, setup = {}, {}
+    over_budget = []
+
+    # Fresh interpreters, so it does not matter what this process imported
+    if args.suite in ("startup", "all"):
+        from . import startup
+        r, s = startup.run()
+        results.update(r)
+        setup.update(s)
+        over_budget = startup.over_budget(r, args.import_budget or startup.IMPORT_BUDGET_S)
+
+    # The load test configures the app's environment before importing it,
+    # so it has to run before the micro-benchmarks pull the app in.
+    if args.suite in ("load", "all"):
+        from . import load
+        kwargs = {k: v for k, v in dict(
+            requests=args.requests, concurrency=args.concurrency,
+            miss_ratio=args.miss_ratio, stub_latency=args.stub_latency,
+        ).items() if v is not None}
+        r, s = load.run(use_ai=not args.no_ai, **kwargs)
+        results.update(r)
+        setup.update(s)
+
+    if args.suite in ("micro", "all"):
+        from . import micro
+        kwargs = {"min_time": args.min_time}
+        if args.sizes:
+            kwargs["sizes"] = args.sizes
+        if args.backends:
+            kwargs["backends"] = tuple(b for b in args.backends.split(",") if b)
+        r, s = micro.run(**kwargs)
+        results.update(r)
+        setup.update(s)
+
+    current = {"meta": report.environment(), "setup": setup, "results": results}
+    report.print_results(current)
+    report.save(current, args.out)
+    print(f"\nResults written to {args.out}")
+    for problem in over_budget:
+        print(f"Over the import-time budget: {problem}")
+
+    if args.update_baseline:
+        report.save(current, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+        return 1 if over_budget else 0
+
+    baseline = report.load(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+        return 1 if over_budget else 0
+    regressions = report.compare(current, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}")
+        return 1
+    print("\nNo regressions against the baseline.")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
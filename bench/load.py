@@ -0,0 +1,101 @@
+"""
+End-to-end load test: the FastAPI app in-process (httpx ASGI transport)
+with its AI path pointed at the stub OpenAI server.
+
+The app is imported only after the environment is pointed at the stub and
+at a throw-away SQLite pattern cache, so the repo's data files are never
+written.  Requests are a mix of cached queries (hits) and unique queries
+(misses: retrieval + LLM round-trip + cache write).
+"""
+import asyncio
+import os
+import pathlib
+import random
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from .micro import CACHE_CODE, SEED, retrieval_queries
+from .report import summarize
+from .stub_openai import StubServer
+
+LOAD_REQUESTS    = 400
+LOAD_CONCURRENCY = 32
+LOAD_MISS_RATIO  = 0.2
+STUB_LATENCY     = 0.2
+
+
+def _configure_app(base_url: str, workdir: pathlib.Path, use_ai: bool) -> None:
+    """Must run before anything under ``app`` is imported."""
+    import sys
+    if any(name == "app" or name.startswith("app.") for name in sys.modules):
+        raise RuntimeError("run the load test before importing the app (python -m bench load)")
+    os.environ.update({
+        "OPENAI_BASE_URL":       base_url,
+        "OPENAI_API_KEY":        "bench-stub",
+        "USE_AI_MERGING":        "true" if use_ai else "false",
+        "PATTERN_CACHE_BACKEND": "sqlite",
+        "PATTERN_CACHE_DB":      str(workdir / "pattern-cache.sqlite3"),
+        "LLM_CACHE_PATH":        str(workdir / "llm-cache.sqlite3"),
+    })
+
+
+def _workload(n: int, miss_ratio: float, hit_pool: List[str]) -> List[str]:
+    rng = random.Random(SEED)
+    fresh = iter(f"{q} v{i}x" for i, q in enumerate(retrieval_queries(n, seed=SEED + 1)))
+    return [next(fresh) if rng.random() < miss_ratio else rng.choice(hit_pool) for _ in range(n)]
+
+
+async def _drive(queries: List[str], concurrency: int) -> Tuple[Dict[str, List[float]], float, int]:
+    import httpx
+    from app.main import app
+
+    slots = asyncio.Semaphore(concurrency)
+    by_tier: Dict[str, List[float]] = {}
+    errors = 0
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def one(query: str) -> None:
+            nonlocal errors
+            async with slots:
+                t0 = time.perf_counter()
+                resp = await client.post("/api/suggest", json={"query": query})
+                elapsed = time.perf_counter() - t0
+            if resp.status_code != 200:
+                errors += 1
+                return
+            by_tier.setdefault(resp.json()["cache_tier"], []).append(elapsed)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(q) for q in queries))
+        wall = time.perf_counter() - start
+    return by_tier, wall, errors
+
+
+def run(requests: int = LOAD_REQUESTS, concurrency: int = LOAD_CONCURRENCY,
+        miss_ratio: float = LOAD_MISS_RATIO, stub_latency: float = STUB_LATENCY,
+        use_ai: bool = True) -> Tuple[Dict[str, dict], Dict[str, float]]:
+    setup: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory(prefix="bench-load-") as tmp, StubServer(stub_latency) as base_url:
+        _configure_app(base_url, pathlib.Path(tmp), use_ai)
+
+        t0 = time.perf_counter()
+        import app.main  # noqa: F401
+        from app.assembler import PATTERN_CACHE, CacheEntry
+        from app.catalog import components_version
+        setup["load.app_import"] = time.perf_counter() - t0
+
+        hit_pool = retrieval_queries(1_000, seed=SEED + 2)
+        entry = CacheEntry(["Button"], CACHE_CODE, components_version(["Button"]))
+        PATTERN_CACHE.backend.upsert_many((q.strip().lower(), entry) for q in hit_pool)
+        PATTERN_CACHE.reload()
+
+        by_tier, wall, errors = asyncio.run(_drive(_workload(requests, miss_ratio, hit_pool), concurrency))
+
+    label = f"load.c{concurrency}.{'ai' if use_ai else 'regex'}"
+    results = {f"{label}.all": {**summarize([t for ts in by_tier.values() for t in ts], wall), "errors": errors}}
+    for tier, latencies in by_tier.items():
+        results[f"{label}.{tier}"] = summarize(latencies, wall)
+    setup["load.wall"] = wall
+    return results, setup
@@ -0,0 +1,179 @@
+"""
+Micro-benchmarks for the hot paths of one /suggest request:
+
+* retrieval – ``score_all`` and ``top_components`` over synthetic queries
+* merge     – regex ``merge_records`` and structural ``merge_snippets``
+* cache     – ``PatternCache.lookup`` per tier at several cache sizes
+
+Inputs are generated from ``data/components.json`` with a fixed seed, so
+two runs on the same tree measure the same work.
+"""
+import csv
+import itertools
+import json
+import pathlib
+import random
+import tempfile
+import time
+from typing import Dict, List, Sequence, Tuple
+
+from .report import ROOT, measure
+
+SEED = 1234
+CACHE_SIZES = (1_000, 100_000, 1_000_000)
+CACHE_BACKENDS = ("sqlite", "csv")
+CACHE_CODE = "import { Button } from '@visa/nova-react';\n\n" \
+             "export default function Cached() {\n  return (\n    <Button>Cached</Button>\n  );\n}"
+
+QUERY_TEMPLATES = (
+    "{a}", "{a} {b}", "{a} with {b}", "{p} with {a} and {b}",
+    "simple {p} {a}", "{a} {b} {c}", "responsive {p} using {a}",
+)
+
+
+def _catalog() -> List[dict]:
+    return json.loads((ROOT / "data" / "components.json").read_text("utf-8"))
+
+
+def _vocabulary(catalog: List[dict]) -> Tuple[List[str], List[str]]:
+    words = set()
+    for comp in catalog:
+        words.add(comp["component"].lower())
+        words.update(t.lower() for t in comp.get("tags", []))
+    from app.retriever import UI_PATTERNS
+    return sorted(words), sorted(UI_PATTERNS)
+
+
+def retrieval_queries(n: int = 500, seed: int = SEED) -> List[str]:
+    rng = random.Random(seed)
+    words, patterns = _vocabulary(_catalog())
+    return [
+        rng.choice(QUERY_TEMPLATES).format(
+            a=rng.choice(words), b=rng.choice(words), c=rng.choice(words), p=rng.choice(patterns),
+        )
+        for _ in range(n)
+    ]
+
+
+# ────────────────── retrieval ──────────────────
+def bench_retrieval(min_time: float) -> Dict[str, dict]:
+    from app import retriever
+
+    queries = retrieval_queries()
+    return {
+        "retrieval.score_all":      measure(retriever.score_all, queries, min_time),
+        "retrieval.top_components": measure(lambda q: retriever.top_components(q, k=3), queries, min_time),
+    }
+
+
+# ────────────────── merge ──────────────────
+def merge_inputs(size: int, limit: int = 200, seed: int = SEED) -> List[List[str]]:
+    """*limit* distinct combinations of *size* catalog variants."""
+    codes = [v["code"] for comp in _catalog() for v in comp.get("variants", [])]
+    combos = list(itertools.combinations(range(len(codes)), size))
+    random.Random(seed).shuffle(combos)
+    return [[codes[i] for i in combo] for combo in combos[:limit]]
+
+
+def bench_merge(min_time: float) -> Dict[str, dict]:
+    from app.manual_merge import merge_records, parse_variant
+    from app.tsx_merge import TSXParseError, merge_snippets
+
+    def structural(snippets):
+        try:
+            merge_snippets(snippets, "LoginForm")
+        except TSXParseError:
+            pass
+
+    results = {}
+    for size in (2, 3):
+        inputs  = merge_inputs(size)
+        records = [[parse_variant(code) for code in snippets] for snippets in inputs]
+        results[f"merge.regex_records.{size}"] = measure(lambda r: merge_records(r, "LoginForm"), records, min_time)
+        results[f"merge.structural.{size}"]    = measure(structural, inputs, min_time)
+    return results
+
+
+# ────────────────── cache ──────────────────
+def cache_keys(n: int, seed: int = SEED) -> List[str]:
+    """*n* distinct five-token queries; the last token makes each unique."""
+    rng = random.Random(seed)
+    words, patterns = _vocabulary(_catalog())
+    words = [w for w in words + patterns if w.isalnum()]
+    return [" ".join(rng.sample(words, 4) + [f"q{i}x"]) for i in range(n)]
+
+
+def _write_csv(path: pathlib.Path, keys: Sequence[str]) -> None:
+    from app.catalog import components_version
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["query", "components", "code", "version", "provisional"])
+        comps, version = json.dumps(["Button"]), components_version(["Button"])
+        writer.writerows((key, comps, CACHE_CODE, version, "") for key in keys)
+
+
+def build_cache(kind: str, keys: Sequence[str], workdir: pathlib.Path):
+    """A PatternCache over a fresh *kind* backend holding *keys*."""
+    from app.assembler import CacheEntry, CSVCacheBackend, PatternCache, SQLiteCacheBackend
+    from app.catalog import components_version
+
+    if kind == "csv":
+        path = workdir / f"cache-{len(keys)}.csv"
+        _write_csv(path, keys)
+        backend = CSVCacheBackend(path)
+    else:
+        backend = SQLiteCacheBackend(workdir / f"cache-{len(keys)}.sqlite3")
+        entry = CacheEntry(["Button"], CACHE_CODE, components_version(["Button"]))
+        for start in range(0, len(keys), 50_000):
+            backend.upsert_many((k, entry) for k in keys[start:start + 50_000])
+    return PatternCache(backend, version_of=components_version)
+
+
+def bench_cache(sizes: Sequence[int], backends: Sequence[str], min_time: float) -> Tuple[Dict[str, dict], Dict[str, float]]:
+    results, setup = {}, {}
+    rng = random.Random(SEED)
+    for kind, n in itertools.product(backends, sizes):
+        keys = cache_keys(n)
+        with tempfile.TemporaryDirectory(prefix="bench-cache-") as tmp:
+            t0 = time.perf_counter()
+            cache = build_cache(kind, keys, pathlib.Path(tmp))
+            setup[f"cache.{kind}.{n}.build"] = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            cache.lookup("warm up the near-duplicate index")
+            setup[f"cache.{kind}.{n}.matcher_build"] = time.perf_counter() - t0
+
+            # Resident keys sit in the LRU; normalized / similar probes resolve
+            # to them, so those cases time the matcher rather than a refetch.
+            if cache.backend.preload:
+                resident = list(cache._entries)[-2_000:]
+            else:
+                resident = rng.sample(keys, min(len(keys), 2_000))
+                for key in resident:
+                    cache.get(key)
+            in_lru   = set(cache._entries)
+            evicted  = [k for k in rng.sample(keys, min(len(keys), 4_000)) if k not in in_lru][:200]
+            shuffled = [" ".join(reversed(k.split())) for k in resident]        # same tokens
+            similar  = [" ".join(k.split() + ["extra"]) for k in resident]     # Jaccard 5/6
+            misses   = [f"nothing cached like zz{i}qq" for i in range(2_000)]
+
+            prefix = f"cache.{kind}.{n}"
+            results[f"{prefix}.exact_resident"] = measure(cache.lookup, resident, min_time)
+            if evicted:
+                results[f"{prefix}.exact_evicted"] = measure(cache.lookup, evicted, min_time, min_ops=3,
+                                                             max_ops=len(evicted))
+            results[f"{prefix}.normalized"] = measure(cache.lookup, shuffled, min_time)
+            results[f"{prefix}.similar"]    = measure(cache.lookup, similar, min_time)
+            results[f"{prefix}.miss"]       = measure(cache.lookup, misses, min_time)
+            del cache
+    return results, setup
+
+
+def run(sizes: Sequence[int] = CACHE_SIZES, backends: Sequence[str] = CACHE_BACKENDS,
+        min_time: float = 0.5) -> Tuple[Dict[str, dict], Dict[str, float]]:
+    results: Dict[str, dict] = {}
+    results.update(bench_retrieval(min_time))
+    results.update(bench_merge(min_time))
+    cache_results, setup = bench_cache(sizes, backends, min_time)
+    results.update(cache_results)
+    return results, setup
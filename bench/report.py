@@ -0,0 +1,139 @@
+"""
+Timing helpers, result files and baseline comparison.
+
+A result file looks like::
+
+    {"meta": {...}, "setup": {...}, "results": {"<case>": {"n": .., "p50_ms": .., ...}}}
+
+Only ``results`` is compared against a baseline; ``setup`` holds one-off
+costs (building a 1M-row cache, starting servers) for information.
+"""
+import json
+import math
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+ROOT          = pathlib.Path(__file__).resolve().parents[1]
+BASELINE_PATH = pathlib.Path(__file__).resolve().parent / "baseline.json"
+
+# A case regresses when its p50 grows by more than this fraction (p95 is
+# shown too, but tails are too noisy on shared machines to gate on)
+REGRESSION_THRESHOLD = 0.25
+# ...and by more than this many milliseconds (sub-µs noise is not a regression)
+REGRESSION_MIN_DELTA_MS = 0.005
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return float("nan")
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies_s: List[float], wall_s: Optional[float] = None) -> Dict[str, float]:
+    """p50/p95/p99/mean in milliseconds plus throughput for one case."""
+    values = sorted(latencies_s)
+    wall   = wall_s if wall_s is not None else sum(values)
+    return {
+        "n":       len(values),
+        "p50_ms":  round(percentile(values, 50) * 1000, 6),
+        "p95_ms":  round(percentile(values, 95) * 1000, 6),
+        "p99_ms":  round(percentile(values, 99) * 1000, 6),
+        "mean_ms": round(sum(values) / len(values) * 1000, 6) if values else float("nan"),
+        "ops_per_s": round(len(values) / wall, 2) if wall > 0 else float("inf"),
+    }
+
+
+def measure(fn: Callable, inputs: Iterable, min_time: float = 0.5,
+            min_ops: int = 5, max_ops: int = 200_000) -> Dict[str, float]:
+    """
+    Call ``fn(x)`` for the inputs round-robin until *min_time* has passed
+    (and at least *min_ops* calls), timing every call on its own.
+    """
+    inputs = list(inputs)
+    if not inputs:
+        raise ValueError("measure() needs at least one input")
+    fn(inputs[0])                                   # warm caches / lazy imports
+    latencies: List[float] = []
+    clock  = time.perf_counter
+    start  = clock()
+    i = 0
+    while i < max_ops and (i < min_ops or clock() - start < min_time):
+        x  = inputs[i % len(inputs)]
+        t0 = clock()
+        fn(x)
+        latencies.append(clock() - t0)
+        i += 1
+    return summarize(latencies, clock() - start)
+
+
+def environment() -> Dict[str, str]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, timeout=10,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit":    commit,
+        "python":    sys.version.split()[0],
+        "platform":  platform.platform(),
+        "cpus":      str(os.cpu_count()),
+    }
+
+
+def save(report: dict, path: pathlib.Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n", "utf-8")
+
+
+def load(path: pathlib.Path) -> Optional[dict]:
+    if not path.exists():
+        return None
+    return json.loads(path.read_text("utf-8"))
+
+
+def compare(current: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """
+    Print a current-vs-baseline table and return the names of the cases
+    whose p50 got slower by more than *threshold*.
+    """
+    regressions = []
+    base = baseline.get("results", {})
+    print(f"\n{'case':<44} {'p50 ms':>10} {'base':>10} {'Δ':>8}   {'p95 ms':>10} {'base':>10} {'Δ':>8}")
+    for name, cur in sorted(current.get("results", {}).items()):
+        old = base.get(name)
+        if old is None:
+            print(f"{name:<44} {cur['p50_ms']:>10.4f} {'new':>10} {'':>8}   {cur['p95_ms']:>10.4f}")
+            continue
+        row = []
+        for key in ("p50_ms", "p95_ms"):
+            delta = (cur[key] - old[key]) / old[key] if old[key] else 0.0
+            row.append(f"{cur[key]:>10.4f} {old[key]:>10.4f} {delta:>+7.0%}")
+        growth = cur["p50_ms"] - old["p50_ms"]
+        slower = growth > REGRESSION_MIN_DELTA_MS and growth > threshold * old["p50_ms"]
+        print(f"{name:<44} {row[0]}   {row[1]}{'  ← regression' if slower else ''}")
+        if slower:
+            regressions.append(name)
+    missing = sorted(set(base) - set(current.get("results", {})))
+    if missing:
+        print(f"({len(missing)} baseline case(s) not run this time)")
+    return regressions
+
+
+def print_results(report: dict) -> None:
+    print(f"\n{'case':<44} {'n':>8} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'ops/s':>12}")
+    for name, r in sorted(report.get("results", {}).items()):
+        errors = f"  ({r['errors']} errors)" if r.get("errors") else ""
+        print(f"{name:<44} {r['n']:>8} {r['p50_ms']:>10.4f} {r['p95_ms']:>10.4f} "
+              f"{r['p99_ms']:>10.4f} {r['ops_per_s']:>12.1f}{errors}")
+    for name, seconds in sorted(report.get("setup", {}).items()):
+        print(f"  setup {name}: {seconds:.2f}s")
@@ -0,0 +1,44 @@
+"""
+Cold-start cost: how long a fresh interpreter takes to import the app.
+
+Each sample is a new ``python`` process (nothing cached in ``sys.modules``)
+timing only the import, not the interpreter's own start.  ``app.main`` must
+import within ``IMPORT_BUDGET_S``: heavy resources belong in the background
+warm-up (``app.lazy``), not at import time.
+"""
+import os
+import subprocess
+import sys
+from typing import Dict, List, Sequence, Tuple
+
+from .report import ROOT, summarize
+
+IMPORT_BUDGET_S = float(os.getenv("BENCH_IMPORT_BUDGET", "1.0"))   # p50 of `import app.main`
+MODULES = ("app.main", "app.assembler", "app.ai_merge")
+
+_TIMER = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def import_seconds(module: str) -> float:
+    """Seconds a fresh interpreter spends importing *module*."""
+    out = subprocess.run(
+        [sys.executable, "-c", _TIMER.format(module=module)],
+        cwd=ROOT, capture_output=True, text=True, check=True, timeout=120,
+    ).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def run(samples: int = 7, modules: Sequence[str] = MODULES) -> Tuple[Dict[str, dict], Dict[str, float]]:
+    results: Dict[str, dict] = {}
+    for module in modules:
+        times: List[float] = [import_seconds(module) for _ in range(samples)]
+        results[f"startup.import.{module}"] = summarize(times)
+    return results, {}
+
+
+def over_budget(results: Dict[str, dict], budget_s: float = IMPORT_BUDGET_S) -> List[str]:
+    """The import cases whose p50 exceeds the budget (only ``app.main`` is gated)."""
+    case = results.get("startup.import.app.main")
+    if case is not None and case["p50_ms"] > budget_s * 1000:
+        return [f"import app.main took {case['p50_ms']:.0f} ms (p50), budget {budget_s * 1000:.0f} ms"]
+    return []
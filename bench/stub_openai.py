@@ -0,0 +1,153 @@
+"""
+Minimal OpenAI-compatible ``/v1/chat/completions`` server for load tests.
+
+Every request sleeps for the configured latency and answers with one
+fixed, valid merged component (as a plain completion or as SSE chunks when
+``stream`` is set), so the API's AI path can be exercised offline.
+
+With ``--replay`` the stub answers from an LLM cache file recorded by the
+app (``LLM_CACHE_MODE=record``): a request whose model, temperature and
+messages were recorded gets the real reply, usage and original latency.
+
+    python -m bench.stub_openai --port 8911 --latency 0.5
+    python -m bench.stub_openai --replay data/llm-cache.sqlite3
+"""
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import random
+import socket
+import threading
+import time
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+STUB_LATENCY = float(os.getenv("STUB_LATENCY", "0.5"))      # seconds per completion
+STUB_JITTER  = float(os.getenv("STUB_JITTER", "0.1"))       # ± fraction of the latency
+
+STUB_CODE = """import { Button, Input } from '@visa/nova-react';
+
+export default function StubComponent() {
+  return (
+    <div className="p-6 space-y-4">
+      <Input aria-label="Email" />
+      <Button>Submit</Button>
+    </div>
+  );
+}"""
+STUB_REPLY = f"Here is the merged component:\n```tsx\n{STUB_CODE}\n```"
+
+
+def create_app(latency: float = STUB_LATENCY, jitter: float = STUB_JITTER,
+               replay: Optional[pathlib.Path] = None) -> FastAPI:
+    app = FastAPI(title="Stub OpenAI")
+    app.state.requests = 0
+    app.state.replayed = 0
+
+    recorded = None
+    if replay is not None:
+        from app.llm_cache import LLMCache, cache_key     # only needed for replay
+        recorded = LLMCache(replay, mode="replay")
+
+    def delay(base: float = latency) -> float:
+        return max(0.0, base * (1 + random.uniform(-jitter, jitter)))
+
+    def reply_for(body: dict):
+        """(content, prompt tokens, completion tokens, seconds to take)"""
+        hit = recorded.lookup_key(cache_key(body)) if recorded is not None else None
+        if hit is not None:
+            app.state.replayed += 1
+            return (hit.content, hit.usage.get("prompt_tokens", 0),
+                    hit.usage.get("completion_tokens", 0), delay(hit.latency))
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        return STUB_REPLY, prompt_tokens, len(STUB_REPLY) // 4, delay()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        content, prompt_tokens, completion_tokens, total = reply_for(body)
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body.get("model", "stub")}
+
+        if body.get("stream"):
+            pieces = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+
+            async def events():
+                for piece in pieces:
+                    await asyncio.sleep(total / len(pieces))
+                    chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                        {"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    usage = {**base, "object": "chat.completion.chunk", "choices": [], "usage": {
+                        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens}}
+                    yield f"data: {json.dumps(usage)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(total)
+        return {
+            **base,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StubServer:
+    """Run the stub with uvicorn in a daemon thread: ``with StubServer(0.2) as url: ...``."""
+
+    def __init__(self, latency: float = STUB_LATENCY, jitter: float = STUB_JITTER, port: int = 0,
+                 replay: Optional[pathlib.Path] = None):
+        import uvicorn
+        self.app    = create_app(latency, jitter, replay)
+        self.port   = port or free_port()
+        self.server = uvicorn.Server(uvicorn.Config(
+            self.app, host="127.0.0.1", port=self.port, log_level="warning", lifespan="off",
+        ))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def __enter__(self) -> str:
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("stub OpenAI server did not start")
+            time.sleep(0.01)
+        return self.base_url
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8911)
+    parser.add_argument("--latency", type=float, default=STUB_LATENCY)
+    parser.add_argument("--jitter", type=float, default=STUB_JITTER)
+    parser.add_argument("--replay", type=pathlib.Path, default=None,
+                        help="LLM cache file whose recorded replies are served")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.jitter, args.replay), host="127.0.0.1", port=args.port)
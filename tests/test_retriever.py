@@ -0,0 +1,58 @@
+"""The compiled retrieval index ranks components exactly like the per-component scorer."""
+from typing import List
+
+import pytest
+
+from app.catalog import COMPONENTS, NAME2COMP
+from app.retriever import rank_components, score_component_relevance, top_components
+
+QUERIES = [
+    "login form with email input",
+    "user profile card with avatar and badge",
+    "navigation bar with links",
+    "data table with pagination",
+    "checkbox list",
+    "Button",
+    "primary button, secondary button!",
+    "layout grid of cards",
+    "form without labels",
+    "toggle switch settings",
+    "search input with dropdown",
+    "nothing-matches-here qwertyuiop",
+    "   ",
+]
+
+
+def _old_ranking(query: str):
+    """Every component scored one at a time, best first (ties keep catalog order)."""
+    scored = [(comp["component"], score_component_relevance(comp, query)) for comp in COMPONENTS]
+    scored = [(name, score) for name, score in scored if score > 0]
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return scored
+
+
+def _old_top_components(query: str, k: int = 3) -> List[str]:
+    if not query.strip():
+        return [comp["component"] for comp in COMPONENTS[:k]]
+    result = [name for name, _ in _old_ranking(query)[:k]]
+    for name in ["Button", "Input", "Card", "Badge", "Avatar"] + [comp["component"] for comp in COMPONENTS]:
+        if len(result) >= k:
+            break
+        if name in NAME2COMP and name not in result:
+            result.append(name)
+    return result[:k]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_rank_components_matches_old_scorer(query):
+    ranked = rank_components(query, mode="keyword")
+    expected = _old_ranking(query)
+
+    assert [name for name, _ in ranked] == [name for name, _ in expected]
+    assert [score for _, score in ranked] == pytest.approx([score for _, score in expected])
+
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("k", [1, 3, 5])
+def test_top_components_matches_old_selection(query, k):
+    assert top_components(query, k) == _old_top_components(query, k)
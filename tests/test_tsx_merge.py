@@ -0,0 +1,25 @@
+"""Every pair of catalog variants merges into TSX that parses again."""
+import itertools
+
+import pytest
+
+from app.catalog import COMPONENTS
+from app.manual_merge import is_broken_merge
+from app.tsx_merge import merge_snippets, parse_module
+
+VARIANTS = [
+    (f"{comp['component']}#{i}", variant["code"])
+    for comp in COMPONENTS
+    for i, variant in enumerate(comp["variants"])
+]
+PAIRS = list(itertools.combinations(VARIANTS, 2))
+
+
+@pytest.mark.parametrize("first, second", PAIRS, ids=[f"{a[0]}+{b[0]}" for a, b in PAIRS])
+def test_variant_pair_merges_and_reparses(first, second):
+    merged = merge_snippets([first[1], second[1]], "MergedPair")
+
+    parsed = parse_module(merged)                   # raises TSXParseError if the output is not valid TSX
+    assert parsed is not None
+    assert "export default function MergedPair" in merged
+    assert not is_broken_merge(merged)